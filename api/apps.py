@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # подключение обработчиков сигналов для сброса кэша каталога
+        from . import signals  # noqa
+        # PRAGMA для каждого нового соединения SQLite
+        from .db import configure_sqlite
+        connection_created.connect(configure_sqlite)
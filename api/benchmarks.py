@@ -0,0 +1,124 @@
+"""
+Общие утилиты для команд-бенчмарков (manage.py bench_*).
+
+Бенчмарки работают на отдельной тестовой БД, которая создается и удаляется так же,
+как при запуске тестов, поэтому рабочая БД не затрагивается.
+"""
+from contextlib import contextmanager
+from datetime import timedelta
+from statistics import median, quantiles
+import random
+import time
+
+from django.db import connection
+from django.utils import timezone
+
+from book_catalog.models import Book, BookGenre
+from users.models import User
+
+
+@contextmanager
+def isolated_database(verbosity=0, name=None):
+    """
+    Создать тестовую БД на время бенчмарка и удалить ее после
+
+    :param verbosity: Уровень подробности вывода при создании БД
+    :param name: Имя тестовой БД. Для SQLite по умолчанию БД создается в памяти,
+        а для бенчмарков с несколькими соединениями нужен файл
+    """
+    old_name = connection.settings_dict['NAME']
+    old_test_name = connection.settings_dict['TEST']['NAME']
+    if name is not None:
+        connection.settings_dict['TEST']['NAME'] = name
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        connection.settings_dict['TEST']['NAME'] = old_test_name
+
+
+def seed_catalog(books, authors=100, genres=50, chunk_size=10000, seed=0, log=None):
+    """
+    Заполнить каталог случайными книгами. Даты публикации распределяются по последним 10 годам,
+    у каждой книги от 1 до 3 жанров и случайный сохраненный рейтинг
+
+    :param books: Количество книг
+    :param authors: Количество авторов
+    :param genres: Количество жанров
+    :param chunk_size: Размер пачки для bulk_create
+    :param seed: Зерно генератора случайных чисел
+    :param log: Функция для вывода прогресса
+    :return: Айди созданных авторов и жанров
+    """
+    rng = random.Random(seed)
+    author_ids = [
+        user.id for user in User.objects.bulk_create(
+            [User(username=f'bench_author_{i}', password='!') for i in range(authors)]
+        )
+    ]
+    genre_ids = [
+        genre.id for genre in BookGenre.objects.bulk_create(
+            [BookGenre(name=f'bench genre {i}') for i in range(genres)]
+        )
+    ]
+    now = timezone.now()
+    through = Book.genres.through
+
+    def make_book(i):
+        rating = rng.randint(1, 5)
+        return Book(
+            name=f'bench book {i}',
+            description=f'description of bench book {i}',
+            author_id=rng.choice(author_ids),
+            created_at=now - timedelta(seconds=rng.randrange(10 * 365 * 24 * 3600)),
+            review_count=1,
+            rating_sum=rating,
+            rating_avg=rating,
+        )
+
+    created_at = Book._meta.get_field('created_at')
+    # auto_now_add перезаписал бы даты публикации при bulk_create
+    created_at.auto_now_add = False
+    try:
+        for start in range(0, books, chunk_size):
+            chunk = Book.objects.bulk_create([make_book(i) for i in range(start, min(start + chunk_size, books))])
+            through.objects.bulk_create([
+                through(book_id=book.id, bookgenre_id=genre_id)
+                for book in chunk
+                for genre_id in rng.sample(genre_ids, rng.randint(1, 3))
+            ])
+            if log:
+                log(f'Seeded {start + len(chunk)}/{books} books')
+    finally:
+        created_at.auto_now_add = True
+    return author_ids, genre_ids
+
+
+def measure(func, repeat=20):
+    """
+    Замерить время выполнения функции
+
+    :param func: Функция без аргументов
+    :param repeat: Количество повторов
+    :return: Словарь с медианой и 95-м перцентилем в миллисекундах
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'median_ms': median(timings),
+        'p95_ms': quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0],
+    }
+
+
+def format_timing(timing):
+    """
+    Отформатировать результат measure для вывода
+
+    :param timing: Результат measure
+    :return: Строка с результатом
+    """
+    return f'median {timing["median_ms"]:.2f} ms, p95 {timing["p95_ms"]:.2f} ms'
@@ -0,0 +1,164 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from hashlib import sha1
+from typing import Iterable
+import json
+import time
+
+CATALOG_GENERATION_KEY = 'books:generation'
+
+
+def get_cache():
+    """
+    Получить кэш каталога. Бэкенд задается алиасом settings.BOOK_CACHE_ALIAS из settings.CACHES
+
+    :return: Объект кэша
+    """
+    return caches[settings.BOOK_CACHE_ALIAS]
+
+
+def book_detail_key(book_id):
+    """
+    Ключ кэша для страницы книги
+
+    :param book_id: Айди книги
+    :return: Ключ кэша
+    """
+    return f'book:detail:{book_id}'
+
+
+def get_book_detail(book_id):
+    """
+    Получить закэшированную часть страницы книги, которая не зависит от пользователя
+
+    :param book_id: Айди книги
+    :return: Словарь с данными книги или None, если в кэше их нет
+    """
+    return get_cache().get(book_detail_key(book_id))
+
+
+def set_book_detail(book_id, data):
+    """
+    Сохранить в кэш часть страницы книги, которая не зависит от пользователя.
+    Данные должны быть прочитаны из основной БД (см. api.replicas.read_from_primary)
+
+    :param book_id: Айди книги
+    :param data: Сериализированные данные книги
+    """
+    get_cache().set(book_detail_key(book_id), data, settings.BOOK_CACHE_TIMEOUT)
+
+
+def invalidate_book_details(book_ids: Iterable[int]):
+    """
+    Удалить из кэша страницы книг
+
+    :param book_ids: Айди книг
+    """
+    keys = [book_detail_key(book_id) for book_id in book_ids]
+    if keys:
+        get_cache().delete_many(keys)
+
+
+def get_catalog_generation():
+    """
+    Получить текущее поколение каталога. Поколение входит в ключи кэша списков книг,
+    поэтому после его увеличения все закэшированные списки перестают использоваться.
+    Если ключа нет (например, его вытеснил LRU), поколение начинается с текущего времени,
+    чтобы не совпасть ни с одним из прежних значений
+
+    :return: Номер поколения
+    """
+    cache = get_cache()
+    generation = cache.get(CATALOG_GENERATION_KEY)
+    if generation is None:
+        cache.add(CATALOG_GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(CATALOG_GENERATION_KEY)
+    return generation
+
+
+def bump_catalog_generation():
+    """
+    Увеличить поколение каталога после записи, которая меняет списки книг
+    """
+    cache = get_cache()
+    try:
+        cache.incr(CATALOG_GENERATION_KEY)
+    except ValueError:
+        cache.add(CATALOG_GENERATION_KEY, time.time_ns(), None)
+
+
+def book_list_key(generation, params):
+    """
+    Ключ кэша для страницы списка книг
+
+    :param generation: Поколение каталога
+    :param params: Канонизированные параметры запроса (фильтры, курсор, размер страницы)
+    :return: Ключ кэша
+    """
+    digest = sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    return f'book:list:{generation}:{digest}'
+
+
+def book_list_etag(key):
+    """
+    ETag страницы списка книг. Ключ кэша уже включает поколение каталога,
+    поэтому ETag меняется после каждой записи в каталог
+
+    :param key: Ключ из book_list_key
+    :return: Значение заголовка ETag
+    """
+    return f'"{sha1(key.encode()).hexdigest()}"'
+
+
+def get_book_list(key):
+    """
+    Получить закэшированную страницу списка книг
+
+    :param key: Ключ из book_list_key
+    :return: Данные страницы или None, если в кэше их нет
+    """
+    return get_cache().get(key)
+
+
+def set_book_list(key, data):
+    """
+    Сохранить в кэш страницу списка книг, прочитанную из основной БД
+
+    :param key: Ключ из book_list_key
+    :param data: Данные страницы
+    """
+    get_cache().set(key, data, settings.BOOK_CACHE_TIMEOUT)
+
+
+def book_facets_key(generation, filters):
+    """
+    Ключ кэша для фасетных счетчиков списка книг. Счетчики зависят только от фильтров,
+    поэтому общие для всех страниц списка
+
+    :param generation: Поколение каталога
+    :param filters: Канонизированные фильтры списка
+    :return: Ключ кэша
+    """
+    digest = sha1(json.dumps(filters, sort_keys=True, default=str).encode()).hexdigest()
+    return f'book:facets:{generation}:{digest}'
+
+
+def get_book_facets(key):
+    """
+    Получить закэшированные фасетные счетчики
+
+    :param key: Ключ из book_facets_key
+    :return: Фасеты или None, если в кэше их нет
+    """
+    return get_cache().get(key)
+
+
+def set_book_facets(key, facets):
+    """
+    Сохранить в кэш фасетные счетчики, посчитанные в основной БД, на короткое время settings.BOOK_FACETS_CACHE_TIMEOUT
+
+    :param key: Ключ из book_facets_key
+    :param facets: Фасеты
+    """
+    get_cache().set(key, facets, settings.BOOK_FACETS_CACHE_TIMEOUT)
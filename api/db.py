@@ -0,0 +1,83 @@
+"""
+Настройка соединений SQLite и сериализация записей.
+
+- configure_sqlite подключается к сигналу connection_created и выполняет PRAGMA из settings.SQLITE_PRAGMAS
+  для каждого нового соединения: busy_timeout заставляет писателя ждать освобождения блокировки вместо
+  немедленной ошибки "database is locked", а mmap_size и cache_size уменьшают количество чтений с диска.
+  С settings.SQLITE_WAL выполняются и PRAGMA из settings.SQLITE_WAL_PRAGMAS: WAL позволяет читателям
+  не ждать писателя, а synchronous=NORMAL в режиме WAL не теряет целостность и убирает fsync на каждый коммит.
+  Режим WAL сохраняется в файле БД, поэтому он не включается по умолчанию (например, в тестах и makemigrations)
+- run_write выполняет запись в транзакции под блокировкой процесса (settings.SQLITE_SERIALIZE_WRITES),
+  чтобы потоки одного процесса не соревновались за блокировку записи SQLite, и повторяет транзакцию
+  с экспоненциальной задержкой, если блокировку все же держит другой процесс
+"""
+from contextlib import nullcontext
+from django.conf import settings
+from django.db import OperationalError, transaction
+import threading
+import time
+
+_write_lock = threading.Lock()
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Обработчик сигнала connection_created: выполнить PRAGMA из settings.SQLITE_PRAGMAS (и settings.SQLITE_WAL_PRAGMAS,
+    если включен settings.SQLITE_WAL) для соединения SQLite
+
+    :param sender: Класс обертки соединения
+    :param connection: Новое соединение
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = dict(settings.SQLITE_PRAGMAS)
+    if settings.SQLITE_WAL:
+        pragmas.update(settings.SQLITE_WAL_PRAGMAS)
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_locked_error(error):
+    """
+    Проверить, вызвана ли ошибка занятой блокировкой БД SQLite
+
+    :param error: Исключение OperationalError
+    :return: Вызвана ли ошибка блокировкой
+    """
+    message = str(error).lower()
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def run_write(func, using=None):
+    """
+    Выполнить запись в транзакции с сериализацией и повтором при "database is locked".
+    Внутри уже открытой транзакции повтор невозможен, поэтому запись выполняется как есть
+
+    :param func: Функция без аргументов, которая пишет в БД
+    :param using: Алиас БД
+    :return: Результат функции
+    """
+    connection = transaction.get_connection(using)
+    if connection.in_atomic_block or connection.vendor != 'sqlite':
+        with transaction.atomic(using=using):
+            return func()
+    lock = _write_lock if settings.SQLITE_SERIALIZE_WRITES else nullcontext()
+    retries = settings.SQLITE_WRITE_RETRIES
+    for attempt in range(retries + 1):
+        try:
+            with lock, transaction.atomic(using=using):
+                return func()
+        except OperationalError as e:
+            if attempt == retries or not is_locked_error(e):
+                raise
+        time.sleep(settings.SQLITE_WRITE_RETRY_DELAY * 2 ** attempt)
+
+
+class SerializedWriteMixin:
+    """
+    Миксин для CreateAPIView: сохранение объекта выполняется через run_write
+    """
+
+    def perform_create(self, serializer):
+        run_write(lambda: super(SerializedWriteMixin, self).perform_create(serializer))
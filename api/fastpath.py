@@ -0,0 +1,52 @@
+"""
+Быстрое построение страниц списка книг без ModelSerializer (включается настройкой settings.BOOK_LIST_FAST_PATH).
+
+Книги страницы выбираются через .values() только с нужными полями, жанры страницы - одним запросом
+к промежуточной таблице книга-жанр, а элементы ответа собираются в обычные словари в том же виде,
+что и у ListBookSerializer. Так не создаются объекты моделей и не вызываются поля сериализатора
+для каждого значения.
+"""
+from collections import defaultdict
+
+from book_catalog.models import Book
+
+# поля ListBookSerializer.Meta.fields в том же порядке
+BOOK_LIST_KEYS = ('id', 'name', 'genres', 'author', 'avg_rating')
+
+BOOK_LIST_VALUES = ('id', 'name', 'author_id', 'review_count', 'rating_sum')
+
+
+def book_list_values(queryset, extra_fields=()):
+    """
+    Queryset книг в виде словарей с полями, нужными для списка
+
+    :param queryset: queryset книг
+    :param extra_fields: Дополнительные поля, например поля сортировки для курсора пагинации
+    :return: queryset словарей
+    """
+    fields = list(BOOK_LIST_VALUES) + [field for field in extra_fields if field not in BOOK_LIST_VALUES]
+    return queryset.prefetch_related(None).values(*fields)
+
+
+def serialize_book_list(rows):
+    """
+    Собрать элементы списка книг из словарей book_list_values. Результат совпадает с ListBookSerializer(many=True)
+
+    :param rows: Словари книг страницы
+    :return: Список словарей для ответа
+    """
+    genres = defaultdict(list)
+    if rows:
+        book_genres = Book.genres.through.objects.filter(book_id__in=[row['id'] for row in rows])
+        for book_id, genre_id in book_genres.order_by('book_id', 'bookgenre_id').values_list('book_id', 'bookgenre_id'):
+            genres[book_id].append(genre_id)
+    return [
+        {
+            'id': row['id'],
+            'name': row['name'],
+            'genres': genres[row['id']],
+            'author': row['author_id'],
+            'avg_rating': row['rating_sum'] / row['review_count'] if row['review_count'] else None,
+        }
+        for row in rows
+    ]
@@ -0,0 +1,86 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, override_settings
+from django.urls import path
+
+from api.benchmarks import isolated_database, seed_catalog
+from api.views import AsyncGetBookAPIView, AsyncListBooks, GetBookAPIView, ListBooks
+from book_catalog.models import Book
+from users.views import AsyncCheckAuthenticatedView, CheckAuthenticatedView
+
+from statistics import quantiles
+import asyncio
+import time
+
+# команда подключает этот модуль как ROOT_URLCONF, чтобы обе версии представлений были доступны одновременно
+urlpatterns = [
+    path('sync/book/<int:book_id>', GetBookAPIView.as_view()),
+    path('async/book/<int:book_id>', AsyncGetBookAPIView.as_view()),
+    path('sync/books/', ListBooks.as_view()),
+    path('async/books/', AsyncListBooks.as_view()),
+    path('sync/authenticated/', CheckAuthenticatedView.as_view()),
+    path('async/authenticated/', AsyncCheckAuthenticatedView.as_view()),
+]
+
+
+class Command(BaseCommand):
+    """
+    Бенчмарк синхронных и асинхронных представлений каталога под ASGI.
+
+    Запросы отправляются через AsyncClient (полный ASGI-обработчик с middleware) с заданным
+    количеством одновременных клиентов. Для каждого эндпоинта выводится пропускная способность
+    и перцентили задержки обеих версий
+    """
+    help = 'Compare throughput of sync and async catalog views under concurrent ASGI requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000, help='Number of books to seed')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per endpoint and version')
+        parser.add_argument('--concurrency', type=int, default=50, help='Concurrent clients')
+        parser.add_argument('--no-cache', action='store_true', help='Disable the catalog cache to measure DB reads')
+
+    def handle(self, *args, **options):
+        settings_override = {'ROOT_URLCONF': __name__, 'ALLOWED_HOSTS': ['testserver'], 'THROTTLE_RATES': {}}
+        if options['no_cache']:
+            settings_override['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with isolated_database(), override_settings(**settings_override):
+            seed_catalog(options['books'])
+            book_ids = list(Book.objects.values_list('id', flat=True)[:100])
+            endpoints = {
+                'book': lambda i: f'book/{book_ids[i % len(book_ids)]}',
+                'books': lambda i: 'books/',
+                'authenticated': lambda i: 'authenticated/',
+            }
+            for name, make_path in endpoints.items():
+                for version in ('sync', 'async'):
+                    result = asyncio.run(self.run_load(version, make_path, options['requests'], options['concurrency']))
+                    self.stdout.write(
+                        f'{name:<14} {version:<6} {result["rps"]:8.0f} req/s  '
+                        f'p50 {result["p50_ms"]:7.2f} ms  p99 {result["p99_ms"]:7.2f} ms'
+                    )
+
+    async def run_load(self, version, make_path, requests, concurrency):
+        """
+        Отправить запросы к одной версии эндпоинта от нескольких одновременных клиентов
+
+        :param version: Версия представлений (sync или async)
+        :param make_path: Функция, возвращающая путь для номера запроса
+        :param requests: Общее количество запросов
+        :param concurrency: Количество одновременных клиентов
+        :return: Пропускная способность и перцентили задержки
+        """
+        timings = []
+
+        async def client_loop(offset):
+            client = AsyncClient()
+            for i in range(offset, requests, concurrency):
+                started = time.perf_counter()
+                response = await client.get(f'/{version}/{make_path(i)}')
+                timings.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200, response.content
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(offset) for offset in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        percentiles = quantiles(timings, n=100)
+        return {'rps': len(timings) / elapsed, 'p50_ms': percentiles[49], 'p99_ms': percentiles[98]}
@@ -0,0 +1,111 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from api.benchmarks import format_timing, isolated_database, measure, seed_catalog
+from api.views import ListBooks
+from book_catalog.models import Book
+
+
+class Command(BaseCommand):
+    """
+    Бенчмарк фильтров списка книг (/api/books/) на сгенерированном каталоге.
+
+    Для каждого набора фильтров выводится план запроса и время получения первой страницы:
+    сначала для текущей реализации (индексы и EXISTS по жанрам), затем для прежней
+    (JOIN + DISTINCT по жанрам, без индексов book_created_idx и book_author_created_idx).
+    """
+    help = 'Benchmark ListBooks filter queries on a seeded catalog in a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=1000000, help='Number of books to seed')
+        parser.add_argument('--repeat', type=int, default=20, help='Number of timed runs per query')
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            author_ids, genre_ids = seed_catalog(options['books'], log=self.stdout.write)
+            to_date = timezone.now() - timedelta(days=365)
+            from_date = to_date - timedelta(days=30)
+            scenarios = {
+                'no filters': {},
+                'author': {'author_ids': author_ids[:1]},
+                'genres': {'genre_ids': genre_ids[:2]},
+                'date range': {'from_date': int(from_date.timestamp()), 'to_date': int(to_date.timestamp())},
+                'author + genre + date range': {
+                    'author_ids': author_ids[:1],
+                    'genre_ids': genre_ids[:1],
+                    'from_date': int(from_date.timestamp()) - 365 * 24 * 3600,
+                },
+            }
+
+            self.stdout.write(self.style.MIGRATE_HEADING('Current implementation'))
+            for name, params in scenarios.items():
+                self.run_scenario(name, self.get_page_queryset(params), options['repeat'])
+
+            with connection.schema_editor() as schema_editor:
+                for index in Book._meta.indexes:
+                    if index.name in ('book_created_idx', 'book_author_created_idx'):
+                        schema_editor.remove_index(Book, index)
+            self.stdout.write(self.style.MIGRATE_HEADING('Previous implementation'))
+            for name, params in scenarios.items():
+                self.run_scenario(name, self.get_legacy_page_queryset(params), options['repeat'])
+
+    def get_view(self, params):
+        """
+        Создать представление ListBooks для запроса с параметрами фильтрации
+
+        :param params: Параметры запроса
+        :return: Представление с подготовленным запросом
+        """
+        view = ListBooks()
+        request = APIRequestFactory().get('/api/books/', params)
+        view.setup(request)
+        view.request = view.initialize_request(request)
+        view.format_kwarg = None
+        return view
+
+    def get_page_queryset(self, params):
+        """
+        Запрос первой страницы списка книг так, как его строит ListBooks
+
+        :param params: Параметры запроса
+        :return: queryset первой страницы
+        """
+        view = self.get_view(params)
+        return view.paginator.get_page_queryset(view.get_queryset(), view.request)
+
+    def get_legacy_page_queryset(self, params):
+        """
+        Запрос первой страницы списка книг с фильтром по жанрам через JOIN + DISTINCT
+
+        :param params: Параметры запроса
+        :return: queryset первой страницы
+        """
+        view = self.get_view(params)
+        filters = view.get_filters()
+        qs = Book.objects.all()
+        if filters['author_ids']:
+            qs = qs.filter(author__in=filters['author_ids'])
+        if filters['genre_ids']:
+            qs = qs.filter(genres__in=filters['genre_ids']).distinct()
+        if filters['from_date']:
+            qs = qs.filter(created_at__gte=filters['from_date'])
+        if filters['to_date']:
+            qs = qs.filter(created_at__lte=filters['to_date'])
+        return view.paginator.get_page_queryset(qs, view.request)
+
+    def run_scenario(self, name, queryset, repeat):
+        """
+        Вывести план запроса и время его выполнения
+
+        :param name: Название сценария
+        :param queryset: queryset первой страницы
+        :param repeat: Количество повторов
+        """
+        ids_queryset = queryset.values_list('id', flat=True)
+        self.stdout.write(self.style.SUCCESS(name))
+        self.stdout.write(ids_queryset.explain())
+        self.stdout.write(format_timing(measure(lambda: list(ids_queryset.all()), repeat)))
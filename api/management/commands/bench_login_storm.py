@@ -0,0 +1,131 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from api.benchmarks import isolated_database, seed_catalog
+from book_catalog.models import Book
+from users import hashing
+from users.models import User
+
+from statistics import quantiles
+import logging
+import os
+import tempfile
+import threading
+import time
+
+SCENARIOS = {
+    # чтение каталога без входов
+    'idle': {},
+    # каждый вход хэширует пароль сразу, как на потоке запроса
+    'unbounded': {'PASSWORD_HASHING_WORKERS': 64, 'PASSWORD_HASHING_QUEUE_SIZE': 1000},
+    # пул и очередь из settings
+    'bounded': {},
+}
+
+
+class Command(BaseCommand):
+    """
+    Задержка чтения каталога во время шквала входов.
+
+    Читатели запрашивают книги и страницы списка, а потоки входа одновременно отправляют запросы на вход
+    с верным паролем. Сценарий idle запускается без входов, unbounded - с пулом хэширования размером
+    с количество входов (то есть без ограничения), bounded - с пулом и очередью из settings.
+    Для каждого сценария выводятся пропускная способность и p99 чтения, количество входов и отказов 503
+    """
+    help = 'Measure catalog read latency during a login storm with unbounded and bounded password hashing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000, help='Number of books to seed')
+        parser.add_argument('--readers', type=int, default=4, help='Reader threads')
+        parser.add_argument('--logins', type=int, default=16, help='Login threads')
+        parser.add_argument('--seconds', type=float, default=10, help='Duration of each scenario')
+        parser.add_argument('--scenario', choices=list(SCENARIOS), action='append', help='Scenarios to run')
+
+    def handle(self, *args, **options):
+        # отказы считаются в результатах, а не выводятся логгером django.request
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        for name in options['scenario'] or SCENARIOS:
+            logins = 0 if name == 'idle' else options['logins']
+            with tempfile.TemporaryDirectory() as directory, override_settings(
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+                SESSION_ENGINE='django.contrib.sessions.backends.db',
+                ALLOWED_HOSTS=['testserver'],
+                THROTTLE_RATES={},
+                **SCENARIOS[name]
+            ), isolated_database(name=os.path.join(directory, 'bench.sqlite3')):
+                seed_catalog(options['books'])
+                result = self.run_load(options['readers'], logins, options['seconds'])
+                self.stdout.write(
+                    f'{name:<10} workers={hashing.executor.config[0] if logins else "-":<3} '
+                    f'reads {result["reads"] / options["seconds"]:6.0f}/s  p50 {result["read_p50_ms"]:7.2f} ms  '
+                    f'p99 {result["read_p99_ms"]:7.2f} ms  logins {result["logins"] / options["seconds"]:5.1f}/s  '
+                    f'503 {result["busy"]}  max queue {result["max_pending"]}'
+                )
+
+    def run_load(self, readers, logins, seconds):
+        """
+        Запустить читателей и потоки входа на заданное время
+
+        :param readers: Количество потоков-читателей
+        :param logins: Количество потоков входа
+        :param seconds: Длительность нагрузки
+        :return: Количество чтений и входов, отказов 503, перцентили задержки чтения и максимальная глубина очереди
+        """
+        User.objects.create_user(username='bench_login', password='password123')
+        book_ids = list(Book.objects.values_list('id', flat=True)[:100])
+        deadline = time.perf_counter() + seconds
+        lock = threading.Lock()
+        result = {'reads': 0, 'logins': 0, 'busy': 0}
+        read_timings = []
+        hashing.executor.stats['max_pending'] = 0
+
+        def reader(offset):
+            client = Client()
+            timings = []
+            i = offset
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                client.get(f'/api/book/{book_ids[i % len(book_ids)]}' if i % 2 else '/api/books/')
+                timings.append((time.perf_counter() - started) * 1000)
+                i += 1
+            with lock:
+                result['reads'] += len(timings)
+                read_timings.extend(timings)
+
+        def login():
+            client = Client(raise_request_exception=False)
+            done = busy = 0
+            while time.perf_counter() < deadline:
+                response = client.post('/users/login/', {'username': 'bench_login', 'password': 'password123'})
+                if response.status_code == 200:
+                    done += 1
+                elif response.status_code == 503:
+                    busy += 1
+            with lock:
+                result['logins'] += done
+                result['busy'] += busy
+
+        threads = [threading.Thread(target=self.with_connection, args=(reader, i)) for i in range(readers)]
+        threads += [threading.Thread(target=self.with_connection, args=(login,)) for _ in range(logins)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        timings = quantiles(read_timings, n=100) if len(read_timings) > 1 else [0] * 99
+        result['read_p50_ms'], result['read_p99_ms'] = timings[49], timings[-1]
+        result['max_pending'] = hashing.executor.stats['max_pending']
+        return result
+
+    @staticmethod
+    def with_connection(func, *args):
+        """
+        Выполнить функцию в потоке и закрыть соединение с БД этого потока
+
+        :param func: Функция
+        :param args: Аргументы функции
+        """
+        try:
+            func(*args)
+        finally:
+            connection.close()
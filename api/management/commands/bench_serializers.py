@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from api.benchmarks import format_timing, isolated_database, measure, seed_catalog
+from api.fastpath import book_list_values, serialize_book_list
+from api.renderers import ORJSONRenderer
+from api.serializers import ListBookSerializer
+from book_catalog.models import Book
+
+
+class Command(BaseCommand):
+    """
+    Бенчмарк построения страниц списка книг: ListBookSerializer и JSONRenderer против
+    .values() со сборкой словарей (api.fastpath) и ORJSONRenderer.
+
+    Для каждого размера страницы время измеряется отдельно для выборки с сериализацией и для рендеринга JSON,
+    а итог выводится в строках в секунду
+    """
+    help = 'Compare rows/second of ListBookSerializer + JSONRenderer against the .values() fast path + orjson'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=20000, help='Number of books to seed')
+        parser.add_argument('--rows', type=int, action='append', help='Page sizes to measure (default: 20, 100, 1000)')
+        parser.add_argument('--repeat', type=int, default=20, help='Number of timed runs per measurement')
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            seed_catalog(options['books'])
+            queryset = Book.objects.prefetch_related('genres').order_by('-created_at', '-id')
+            for rows in options['rows'] or (20, 100, 1000):
+                page = queryset[:rows]
+                versions = {
+                    'serializer': (
+                        lambda: ListBookSerializer(list(page.all()), many=True).data,
+                        JSONRenderer(),
+                    ),
+                    'fast path': (
+                        lambda: serialize_book_list(list(book_list_values(page.all()))),
+                        ORJSONRenderer(),
+                    ),
+                }
+                self.stdout.write(self.style.MIGRATE_HEADING(f'{rows} rows'))
+                for name, (build, renderer) in versions.items():
+                    data = build()
+                    build_timing = measure(build, options['repeat'])
+                    render_timing = measure(lambda: renderer.render(data), options['repeat'])
+                    total_ms = build_timing['median_ms'] + render_timing['median_ms']
+                    self.stdout.write(
+                        f'{name:<11} {rows / total_ms * 1000:10.0f} rows/s  '
+                        f'build {format_timing(build_timing)}  render {format_timing(render_timing)}'
+                    )
@@ -0,0 +1,141 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from api.benchmarks import isolated_database, seed_catalog
+from book_catalog.models import Book
+from users.models import User
+
+from statistics import quantiles
+import logging
+import os
+import tempfile
+import threading
+import time
+
+SCENARIOS = {
+    # настройки SQLite по умолчанию: журнал отката, без сериализации и повторов записи
+    'default': {'SQLITE_PRAGMAS': {}, 'SQLITE_WAL': False, 'SQLITE_SERIALIZE_WRITES': False, 'SQLITE_WRITE_RETRIES': 0},
+    # настройки из settings и WAL: PRAGMA, сериализация и повтор записи
+    'tuned': {'SQLITE_WAL': True},
+}
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный тест SQLite: пропускная способность чтения каталога при одновременных записях.
+
+    БД создается во временном файле, потому что БД в памяти не использует журнал и блокировки файла.
+    Читатели запрашивают страницы книг (кэш каталога отключен, чтобы чтения доходили до БД), писатели
+    одновременно добавляют отзывы и книги. Сценарий default запускается с настройками SQLite по умолчанию,
+    tuned - с настройками из settings и в режиме WAL
+    """
+    help = 'Measure catalog read throughput under concurrent writes with default and tuned SQLite settings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000, help='Number of books to seed')
+        parser.add_argument('--readers', type=int, default=8, help='Reader threads')
+        parser.add_argument('--writers', type=int, default=4, help='Writer threads')
+        parser.add_argument('--seconds', type=float, default=10, help='Duration of each scenario')
+        parser.add_argument('--scenario', choices=sorted(SCENARIOS), action='append', help='Scenarios to run')
+
+    def handle(self, *args, **options):
+        # ошибки записи считаются в результатах, а не выводятся логгером django.request
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        for name in options['scenario'] or SCENARIOS:
+            with tempfile.TemporaryDirectory() as directory, override_settings(
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+                SESSION_ENGINE='django.contrib.sessions.backends.db',
+                ALLOWED_HOSTS=['testserver'],
+                THROTTLE_RATES={},
+                **SCENARIOS[name]
+            ), isolated_database(name=os.path.join(directory, 'bench.sqlite3')):
+                _, genre_ids = seed_catalog(options['books'])
+                journal_mode = connection.cursor().execute('PRAGMA journal_mode').fetchone()[0]
+                result = self.run_load(options['readers'], options['writers'], options['seconds'], genre_ids)
+                self.stdout.write(
+                    f'{name:<8} journal={journal_mode:<8} '
+                    f'reads {result["reads"] / options["seconds"]:6.0f}/s  p99 {result["read_p99_ms"]:7.2f} ms  '
+                    f'failed {result["read_errors"]}  '
+                    f'writes {result["writes"] / options["seconds"]:6.0f}/s  failed {result["errors"]}'
+                )
+
+    def run_load(self, readers, writers, seconds, genre_ids):
+        """
+        Запустить читателей и писателей на заданное время
+
+        :param readers: Количество потоков-читателей
+        :param writers: Количество потоков-писателей
+        :param seconds: Длительность нагрузки
+        :param genre_ids: Айди жанров для новых книг
+        :return: Количество успешных и неудачных чтений и записей и 99-й перцентиль задержки чтения
+        """
+        user = User.objects.create_user(username='bench_writer', password='password123', is_activated=True)
+        book_ids = list(Book.objects.values_list('id', flat=True)[:100])
+        deadline = time.perf_counter() + seconds
+        lock = threading.Lock()
+        result = {'reads': 0, 'read_errors': 0, 'writes': 0, 'errors': 0}
+        read_timings = []
+
+        def reader(offset):
+            client = Client(raise_request_exception=False)
+            timings = []
+            errors = 0
+            i = offset
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                path = f'/api/book/{book_ids[i % len(book_ids)]}' if i % 2 else '/api/books/'
+                if client.get(path).status_code == 200:
+                    timings.append((time.perf_counter() - started) * 1000)
+                else:
+                    errors += 1
+                i += 1
+            with lock:
+                result['reads'] += len(timings)
+                result['read_errors'] += errors
+                read_timings.extend(timings)
+
+        def writer(offset):
+            client = Client(raise_request_exception=False)
+            client.force_login(user)
+            writes = errors = 0
+            i = offset
+            while time.perf_counter() < deadline:
+                if i % 2:
+                    response = client.post('/api/writeReview/', {
+                        'book': book_ids[i % len(book_ids)], 'text': 'bench review', 'rating': 1 + i % 5
+                    })
+                else:
+                    response = client.post('/api/addBook/', {
+                        'name': f'bench write {i}', 'description': 'bench', 'genres': [genre_ids[i % len(genre_ids)]]
+                    })
+                if response.status_code == 201:
+                    writes += 1
+                else:
+                    errors += 1
+                i += 1
+            with lock:
+                result['writes'] += writes
+                result['errors'] += errors
+
+        threads = [threading.Thread(target=self.with_connection, args=(reader, i)) for i in range(readers)]
+        threads += [threading.Thread(target=self.with_connection, args=(writer, i)) for i in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        result['read_p99_ms'] = quantiles(read_timings, n=100)[-1] if len(read_timings) > 1 else 0
+        return result
+
+    @staticmethod
+    def with_connection(func, *args):
+        """
+        Выполнить функцию в потоке и закрыть соединение с БД этого потока
+
+        :param func: Функция
+        :param args: Аргументы функции
+        """
+        try:
+            func(*args)
+        finally:
+            connection.close()
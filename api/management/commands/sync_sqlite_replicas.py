@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+import sqlite3
+
+
+class Command(BaseCommand):
+    """
+    Скопировать основную БД SQLite в файлы реплик из settings.DATABASE_REPLICAS.
+
+    Для локальной проверки чтения с реплик: реплика - это снимок основной БД на момент копирования,
+    поэтому отставание реплики можно воспроизвести, изменив данные после копирования
+    """
+    help = 'Copy the primary SQLite database into the replica files from DATABASE_REPLICAS'
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No replicas configured, set the DATABASE_REPLICAS environment variable')
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError('Replicas can be copied only from an SQLite database')
+        primary.ensure_connection()
+        for alias in settings.DATABASE_REPLICAS:
+            connections[alias].close()
+            target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                # резервное копирование SQLite дает согласованный снимок даже во время записей в основную БД
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(f'Copied primary database into {alias} ({connections[alias].settings_dict["NAME"]})')
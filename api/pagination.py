@@ -0,0 +1,239 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import date, datetime
+import binascii
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from typing import List, Tuple
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу (keyset) с непрозрачным курсором.
+
+    Курсор хранит значения полей сортировки последнего элемента страницы, а следующая страница
+    выбирается условием "строго после этих значений". Поэтому стоимость запроса не зависит от того,
+    насколько глубоко листает клиент, в отличие от LIMIT/OFFSET.
+
+    Attributes:
+        ordering (Tuple[str]): Поля сортировки. Последнее поле должно быть уникальным (обычно id)
+        page_size (int): Размер страницы по умолчанию
+        page_size_query_param (str): Параметр запроса для изменения размера страницы
+        max_page_size (int): Максимальный размер страницы
+        cursor_query_param (str): Параметр запроса с курсором
+    """
+    ordering = ('-created_at', '-id')
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Получить элементы текущей страницы
+
+        :param queryset: queryset для пагинации
+        :param request: Запрос пользователя
+        :param view: Представление
+        :return: Список элементов страницы
+        """
+        return self.get_page(list(self.get_page_queryset(queryset, request)))
+
+    def get_page_queryset(self, queryset, request):
+        """
+        Отфильтровать и отсортировать queryset по курсору из запроса.
+        Возвращает на один элемент больше размера страницы, чтобы понять, есть ли следующая страница.
+
+        :param queryset: queryset для пагинации
+        :param request: Запрос пользователя
+        :return: Срез queryset для текущей страницы
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.next_position = None
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.get_keyset_filter(position))
+            except (TypeError, ValueError, DjangoValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        return queryset[:self.page_size + 1]
+
+    def get_page(self, rows):
+        """
+        Обрезать лишний элемент и запомнить позицию для следующей страницы
+
+        :param rows: Элементы, полученные из get_page_queryset
+        :return: Элементы текущей страницы
+        """
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            self.next_position = self.get_position(rows[-1])
+        return rows
+
+    def get_page_size(self, request):
+        """
+        Получить размер страницы из параметров запроса
+
+        :param request: Запрос пользователя
+        :return: Размер страницы
+        """
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_keyset_filter(self, position):
+        """
+        Построить условие "строго после позиции" для составного ключа сортировки.
+        Для ключа (a, b) это a < x OR (a = x AND b < y) при сортировке по убыванию.
+
+        :param position: Значения полей сортировки последнего элемента предыдущей страницы
+        :return: Q-объект с условием
+        """
+        condition = None
+        for field, value in reversed(list(zip(self.ordering, position))):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            after = Q(**{f'{name}__{lookup}': value})
+            condition = after if condition is None else after | (Q(**{name: value}) & condition)
+        return condition
+
+    def get_position(self, row):
+        """
+        Получить значения полей сортировки элемента страницы
+
+        :param row: Объект модели или словарь (для .values() queryset)
+        :return: Список значений полей сортировки
+        """
+        names = [field.lstrip('-') for field in self.ordering]
+        if isinstance(row, dict):
+            return [row[name] for name in names]
+        return [getattr(row, name) for name in names]
+
+    def encode_cursor(self, position):
+        """
+        Закодировать позицию в непрозрачный курсор
+
+        :param position: Значения полей сортировки
+        :return: Курсор в виде строки
+        """
+        values = [value.isoformat() if isinstance(value, (date, datetime)) else value for value in position]
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request):
+        """
+        Раскодировать курсор из параметров запроса
+
+        :param request: Запрос пользователя
+        :return: Значения полей сортировки или None, если курсор не передан
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            position = json.loads(urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def get_next_link(self):
+        """
+        Получить ссылку на следующую страницу
+
+        :return: Ссылка или None, если страница последняя
+        """
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class BookPagination(KeysetPagination):
+    """
+    Пагинация списка книг по дате публикации, от новых к старым
+    """
+    ordering = ('-created_at', '-id')
+
+
+class BookRatingPagination(KeysetPagination):
+    """
+    Пагинация списка книг по среднему рейтингу, от высокого к низкому
+    """
+    ordering = ('-rating_avg', '-id')
+
+
+class BookReviewPagination(KeysetPagination):
+    """
+    Пагинация отзывов на книгу, от новых к старым
+    """
+    ordering = ('-created_at', '-id')
+
+
+class BookSearchPagination(PageNumberPagination):
+    """
+    Постраничная пагинация результатов поиска. Результаты отсортированы по релевантности,
+    а не по полям книги, поэтому вместо курсора по ключу используются номера страниц
+
+    Attributes:
+        page_size_query_param (str): Параметр запроса для изменения размера страницы
+        max_page_size (int): Максимальный размер страницы
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,291 @@
+"""
+Профилирование запросов (включается настройкой settings.REQUEST_PROFILING).
+
+ProfilingMiddleware для каждого запроса измеряет общее время, количество и время запросов к БД
+(через execute_wrapper всех соединений) и отдает их в заголовке Server-Timing. Одинаковые SQL-запросы,
+выполненные за один HTTP-запрос не меньше settings.PROFILING_DUPLICATE_THRESHOLD раз, считаются
+признаком N+1 и пишутся в лог api.profiling. Доля settings.PROFILING_SAMPLE_RATE запросов выполняется
+под cProfile, а профили сохраняются в settings.PROFILING_DIR (смотреть через python -m pstats или snakeviz).
+
+Для потоковых ответов (StreamingHttpResponse, например выгрузка каталога) запросы к БД учитываются,
+пока содержимое ответа не будет отдано целиком, а заголовок Server-Timing не ставится: заголовки
+уходят клиенту раньше, чем становятся известны время и количество запросов.
+
+Middleware работает и в асинхронном стеке (ASGI), но execute_wrapper ставится только на соединения потока
+middleware, а асинхронные представления выполняют запросы к БД в потоках sync_to_async. Поэтому для них
+учитывается только общее время запроса, а cProfile не запускается: в event loop одновременно выполняются
+другие запросы.
+
+Агрегаты по представлениям хранятся в памяти процесса и отдаются в текстовом формате Prometheus
+представлением metrics_view (/metrics) вместе со счетчиками пула хэширования паролей (users.hashing).
+Метрики раскрывают имена представлений и нагрузку, поэтому доступны только администраторам (is_staff).
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from users import hashing
+
+logger = logging.getLogger(__name__)
+
+# списки параметров IN (%s, %s, ...) разной длины дают одну сигнатуру запроса
+_PARAMS_LIST = re.compile(r'%s(?:\s*,\s*%s)+')
+
+
+def sql_signature(sql):
+    """
+    Сигнатура SQL-запроса для поиска повторов: текст запроса без различий в длине списков параметров
+
+    :param sql: Текст запроса с плейсхолдерами
+    :return: Сигнатура запроса
+    """
+    return _PARAMS_LIST.sub('%s, ...', sql)
+
+
+class QueryRecorder:
+    """
+    execute_wrapper, который считает запросы к БД, их время и повторы
+
+    Attributes:
+        count (int): Количество запросов
+        duration (float): Суммарное время запросов в секундах
+        signatures (Counter): Количество выполнений каждой сигнатуры запроса
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.signatures = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.signatures[sql_signature(sql)] += 1
+
+    def duplicates(self, threshold):
+        """
+        Запросы, повторенные не меньше threshold раз
+
+        :param threshold: Минимальное количество повторов
+        :return: Список пар (сигнатура, количество)
+        """
+        return [(sql, count) for sql, count in self.signatures.most_common() if count >= threshold]
+
+
+class RequestMetrics:
+    """
+    Агрегаты запросов по представлениям в памяти процесса
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = defaultdict(lambda: {
+            'requests': 0, 'duration': 0.0, 'queries': 0, 'db_duration': 0.0, 'duplicate_requests': 0,
+        })
+
+    def record(self, view, method, duration, recorder, has_duplicates):
+        """
+        Учесть запрос
+
+        :param view: Имя представления
+        :param method: Метод запроса
+        :param duration: Время запроса в секундах
+        :param recorder: QueryRecorder запроса
+        :param has_duplicates: Были ли в запросе повторы SQL
+        """
+        with self.lock:
+            stats = self.views[view, method]
+            stats['requests'] += 1
+            stats['duration'] += duration
+            stats['queries'] += recorder.count
+            stats['db_duration'] += recorder.duration
+            stats['duplicate_requests'] += has_duplicates
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+    def render(self):
+        """
+        Отрендерить агрегаты в текстовом формате Prometheus
+
+        :return: Текст метрик
+        """
+        metrics = (
+            ('requests', 'django_view_requests_total', 'counter', 'Requests handled by the view'),
+            ('duration', 'django_view_duration_seconds_total', 'counter', 'Wall time spent in the view'),
+            ('queries', 'django_view_db_queries_total', 'counter', 'Database queries executed by the view'),
+            ('db_duration', 'django_view_db_duration_seconds_total', 'counter', 'Time spent in database queries'),
+            ('duplicate_requests', 'django_view_duplicate_query_requests_total', 'counter',
+             'Requests with repeated SQL (possible N+1)'),
+        )
+        with self.lock:
+            views = {key: dict(stats) for key, stats in self.views.items()}
+        lines = []
+        for field, name, metric_type, description in metrics:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for (view, method), stats in sorted(views.items()):
+                lines.append(f'{name}{{view="{view}",method="{method}"}} {stats[field]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = RequestMetrics()
+
+
+class ProfilingMiddleware:
+    """
+    Middleware профилирования запросов. Отключается (MiddlewareNotUsed), если settings.REQUEST_PROFILING выключен
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        profiler = cProfile.Profile() if random.random() < settings.PROFILING_SAMPLE_RATE else None
+        started = time.perf_counter()
+        with self.recording(recorder):
+            if profiler:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+        if profiler:
+            self.save_profile(profiler, self.get_view_name(request))
+
+        if response.streaming:
+            if response.is_async:
+                self.record(request, recorder, started)
+            else:
+                response.streaming_content = self.record_streaming(
+                    response.streaming_content, request, recorder, started
+                )
+            return response
+        duration = self.record(request, recorder, started)
+        response['Server-Timing'] = (
+            f'app;dur={duration * 1000:.2f}, '
+            f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries"'
+        )
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        # запросы к БД выполняются в потоках sync_to_async и не учитываются
+        if response.streaming:
+            return response
+        duration = self.record(request, QueryRecorder(), started)
+        response['Server-Timing'] = f'app;dur={duration * 1000:.2f}'
+        return response
+
+    @staticmethod
+    def recording(recorder):
+        """
+        Поставить execute_wrapper на все соединения с БД текущего потока
+
+        :param recorder: QueryRecorder запроса
+        :return: Контекстный менеджер
+        """
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def record_streaming(self, content, request, recorder, started):
+        """
+        Отдать содержимое потокового ответа, учитывая запросы к БД во время его формирования,
+        и записать метрики запроса, когда ответ отдан или закрыт
+
+        :param content: Итератор содержимого ответа
+        :param request: Запрос пользователя
+        :param recorder: QueryRecorder запроса
+        :param started: Время начала запроса
+        :return: Итератор содержимого ответа
+        """
+        try:
+            with self.recording(recorder):
+                yield from content
+        finally:
+            self.record(request, recorder, started)
+
+    def record(self, request, recorder, started):
+        """
+        Записать метрики запроса и предупредить о повторах SQL
+
+        :param request: Запрос пользователя
+        :param recorder: QueryRecorder запроса
+        :param started: Время начала запроса
+        :return: Время запроса в секундах
+        """
+        duration = time.perf_counter() - started
+        view = self.get_view_name(request)
+        duplicates = recorder.duplicates(settings.PROFILING_DUPLICATE_THRESHOLD)
+        for sql, count in duplicates:
+            logger.warning('Possible N+1 in %s: query executed %d times: %s', view, count, sql)
+        metrics.record(view, request.method, duration, recorder, bool(duplicates))
+        return duration
+
+    @staticmethod
+    def get_view_name(request):
+        """
+        Имя представления запроса, например api.views.ListBooks
+
+        :param request: Запрос пользователя
+        :return: Имя представления или <unresolved>, если адрес не найден
+        """
+        match = getattr(request, 'resolver_match', None)
+        return match._func_path if match else '<unresolved>'
+
+    @staticmethod
+    def save_profile(profiler, view):
+        """
+        Сохранить профиль cProfile в settings.PROFILING_DIR
+
+        :param profiler: Профилировщик запроса
+        :param view: Имя представления
+        """
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        path = os.path.join(settings.PROFILING_DIR, f'{view}-{time.time_ns()}.prof')
+        profiler.dump_stats(path)
+        logger.info('Saved profile of %s to %s', view, path)
+
+
+def metrics_view(request):
+    """
+    Агрегаты профилирования в текстовом формате Prometheus. Доступно, только если профилирование включено,
+    и только администраторам
+
+    :param request: Запрос
+    :return: HttpResponse объект
+    """
+    if not settings.REQUEST_PROFILING:
+        raise Http404
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render() + hashing.executor.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
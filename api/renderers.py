@@ -0,0 +1,40 @@
+"""
+JSON-рендерер на orjson.
+
+ORJSONRenderer сериализует данные в C и для строк, целых чисел, дат и Decimal отдает те же байты, что и JSONRenderer
+DRF с настройками по умолчанию (UNICODE_JSON, COMPACT_JSON). Типы, которые orjson не сериализует сам или сериализует
+иначе, чем DRF (даты, Decimal, ленивые строки и т.д.), передаются в JSONEncoder DRF. Если orjson не установлен,
+запрошен отступ (indent) или данные не поддерживаются orjson (например, ключи словаря не строки), используется
+обычный JSONRenderer.
+
+Числа с плавающей точкой orjson записывает иначе: экспонента без знака и ведущего нуля (1e16 вместо 1e+16,
+1e-7 вместо 1e-07), малые числа без экспоненты (0.00001 вместо 1e-05), а NaN и Infinity как null.
+Поэтому рендерер не включен глобально и используется только там, где числа заведомо в обычной записи:
+в списках книг с settings.BOOK_LIST_FAST_PATH (средний рейтинг от 1 до 5).
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Рендерер JSON на orjson. Результат совпадает с JSONRenderer, кроме записи некоторых чисел с плавающей точкой
+    """
+    # datetime, date и time сериализуются через JSONEncoder DRF, чтобы формат дат не отличался
+    options = orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # как и JSONRenderer, экранируем U+2028 и U+2029, чтобы JSON оставался подмножеством JavaScript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
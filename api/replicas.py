@@ -0,0 +1,175 @@
+"""
+Чтение каталога с реплик БД.
+
+ReplicaRoutingMiddleware разрешает чтение с реплики только для безопасных запросов (GET, HEAD)
+к представлениям с атрибутом read_from_replica = True. На время такого запроса ReplicaRouter
+отправляет чтения моделей приложений из settings.REPLICA_APP_LABELS на случайную реплику
+из settings.DATABASE_REPLICAS. Все записи, а также чтения пользователей и сессий идут в основную БД.
+
+Реплика может отставать от основной БД, поэтому после запроса, который что-то записал, клиенту
+ставится cookie settings.REPLICA_PIN_COOKIE на settings.REPLICA_PIN_SECONDS секунд: пока она есть,
+все чтения этого клиента идут в основную БД и он видит свои изменения (read-your-writes).
+Закрепляют клиента только записи в модели каталога: приложения из settings.REPLICA_APP_LABELS
+и модели из settings.REPLICA_PIN_MODELS (например, избранные книги пользователей). Запись сессии или
+last_login при входе не закрепляет клиента.
+
+Общие кэши каталога (см. api.cache) заполняются данными из основной БД: представления читают запись кэша
+при промахе внутри read_from_primary. Иначе страница, прочитанная с отстающей реплики, попала бы в кэш
+после сброса, закрепленный клиент увидел бы ее вместо своих изменений, а ETag текущего поколения каталога
+указывал бы на устаревшие данные. Без кэша (например, страницы книги с fields или expand) чтения идут на реплики.
+
+Middleware работает и в синхронном, и в асинхронном стеке, поэтому под ASGI асинхронные представления
+не оборачиваются в async_to_sync.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import Resolver404, resolve
+import random
+
+# состояние текущего запроса: {'replica': можно ли читать с реплики, 'wrote': была ли запись}
+_request_state: ContextVar[dict] = ContextVar('replica_request_state', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def is_catalog_model(model):
+    """
+    Проверить, читается ли модель с реплик и закрепляет ли запись в нее клиента за основной БД
+
+    :param model: Модель
+    :return: Относится ли модель к каталогу
+    """
+    return model._meta.app_label in settings.REPLICA_APP_LABELS or model._meta.label_lower in settings.REPLICA_PIN_MODELS
+
+
+def reading_from_replica():
+    """
+    Проверить, читает ли текущий запрос каталог с реплик
+
+    :return: Идут ли чтения каталога на реплики
+    """
+    state = _request_state.get()
+    return bool(state and state['replica'] and settings.DATABASE_REPLICAS)
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Контекстный менеджер: чтения каталога внутри него идут в основную БД, даже если запросу можно читать с реплик.
+    Используется при построении записей общего кэша
+    """
+    state = _request_state.get()
+    if not state:
+        yield
+        return
+    replica = state['replica']
+    state['replica'] = False
+    try:
+        yield
+    finally:
+        state['replica'] = replica
+
+
+class ReplicaRouter:
+    """
+    Роутер БД: чтения каталога из представлений с read_from_replica идут на реплики, все остальное - в основную БД
+    """
+
+    def db_for_read(self, model, **hints):
+        if not reading_from_replica() or model._meta.app_label not in settings.REPLICA_APP_LABELS:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None and is_catalog_model(model):
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики содержат те же данные, что и основная БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # реплики получают схему вместе с данными из основной БД
+        return db not in settings.DATABASE_REPLICAS
+
+
+def view_reads_from_replica(request):
+    """
+    Проверить, помечено ли представление запроса атрибутом read_from_replica
+
+    :param request: Запрос пользователя
+    :return: Можно ли представлению читать с реплики
+    """
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return False
+    view_class = getattr(match.func, 'view_class', None)
+    return bool(getattr(view_class, 'read_from_replica', False))
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Middleware, которое включает чтение с реплик для запроса и закрепляет клиента за основной БД после записи
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.get_state(request)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.pin(state, response)
+
+    async def __acall__(self, request):
+        state = self.get_state(request)
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.pin(state, response)
+
+    @staticmethod
+    def get_state(request):
+        """
+        Состояние запроса для ReplicaRouter
+
+        :param request: Запрос пользователя
+        :return: Словарь состояния
+        """
+        pinned = request.COOKIES.get(settings.REPLICA_PIN_COOKIE) is not None
+        return {
+            'replica': request.method in SAFE_METHODS and not pinned and view_reads_from_replica(request),
+            'wrote': False,
+        }
+
+    @staticmethod
+    def pin(state, response):
+        """
+        Закрепить клиента за основной БД, если запрос записал что-то в каталог
+
+        :param state: Состояние запроса
+        :param response: Ответ
+        :return: Ответ
+        """
+        if state['wrote']:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax'
+            )
+        return response
@@ -1,4 +1,8 @@
-from rest_framework.serializers import HiddenField, CurrentUserDefault, ModelSerializer, ReadOnlyField, SerializerMethodField
+from rest_framework.serializers import HiddenField, CurrentUserDefault, ModelSerializer, ReadOnlyField, SerializerMethodField, \
+    Serializer, ListField, IntegerField, ValidationError
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
 from book_catalog.models import *
 
 from typing import List
@@ -30,6 +34,18 @@ class CreateBookReviewSerializer(ModelSerializer):
     """
     author = HiddenField(default=CurrentUserDefault())
 
+    def create(self, validated_data):
+        """
+        Создание отзыва вместе с обновлением агрегатов рейтинга книги в одной транзакции
+
+        :param validated_data: Провалидированные данные отзыва
+        :return: Созданный отзыв
+        """
+        with transaction.atomic():
+            review = super().create(validated_data)
+            review.book.add_review_rating(review.rating)
+        return review
+
     class Meta:
         """
         Метаданные о классе-сериализаторе
@@ -42,7 +58,109 @@ class CreateBookReviewSerializer(ModelSerializer):
         fields = ['id', 'book', 'author', 'text', 'rating']
 
 
-class ListBookSerializer(ModelSerializer):
+class AuthorSerializer(ModelSerializer):
+    """
+    Сериализатор автора книги для раскрытия поля author (expand=author)
+    """
+
+    class Meta:
+        """
+        Метаданные о классе-сериализаторе
+
+        Attributes:
+            model (object): Модель, которую сериализирует сериализатор
+            fields (List[str]): Список полей модели для сериализации
+        """
+        model = User
+        fields = ['id', 'username']
+
+
+class GenreSerializer(ModelSerializer):
+    """
+    Сериализатор жанра книги для раскрытия поля genres (expand=genres)
+    """
+
+    class Meta:
+        """
+        Метаданные о классе-сериализаторе
+
+        Attributes:
+            model (object): Модель, которую сериализирует сериализатор
+            fields (List[str]): Список полей модели для сериализации
+        """
+        model = BookGenre
+        fields = ['id', 'name']
+
+
+class SparseFieldsSerializerMixin:
+    """
+    Миксин сериализатора для выбора полей ответа (fields) и раскрытия связей (expand).
+    Meta.columns задает столбцы модели, которые нужны каждому полю, чтобы представление могло
+    сузить запрос через .only(), а expandable_fields - вложенные сериализаторы для раскрытия
+
+    Attributes:
+        expandable_fields (dict): Вложенный сериализатор и его аргументы для каждого раскрываемого поля
+    """
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        """
+        :param fields: Поля ответа (None - все поля)
+        :param expand: Раскрываемые поля
+        """
+        super().__init__(*args, **kwargs)
+        for name in expand:
+            serializer_class, serializer_kwargs = self.expandable_fields[name]
+            self.fields[name] = serializer_class(read_only=True, **serializer_kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def get_sparse_params(cls, query_params):
+        """
+        Прочитать параметры fields и expand запроса. Значения перечисляются через запятую
+
+        :param query_params: Параметры запроса
+        :return: Словарь с fields (отсортированный список или None, если параметр не передан) и expand
+        """
+        def get_names(name):
+            values = query_params.getlist(name)
+            return {value.strip() for item in values for value in item.split(',') if value.strip()}
+
+        fields, expand = get_names('fields'), get_names('expand')
+        unknown = fields - set(cls.Meta.fields)
+        if unknown:
+            raise ValidationError({'fields': f'Unknown fields: {", ".join(sorted(unknown))}'})
+        unknown = expand - set(cls.expandable_fields)
+        if unknown:
+            raise ValidationError({'expand': f'Fields cannot be expanded: {", ".join(sorted(unknown))}'})
+        return {'fields': sorted(fields) if fields else None, 'expand': sorted(expand)}
+
+    @classmethod
+    def setup_queryset(cls, queryset, fields=None, expand=(), columns=()):
+        """
+        Подготовить queryset под поля ответа: загрузить через .only() только нужные полям столбцы,
+        подгрузить жанры, только если они запрошены, и раскрытого автора в том же запросе
+
+        :param queryset: queryset модели сериализатора
+        :param fields: Поля ответа (None - все поля)
+        :param expand: Раскрываемые поля
+        :param columns: Дополнительные столбцы, например поля сортировки для курсора пагинации
+        :return: queryset для сериализации
+        """
+        names = cls.Meta.fields if fields is None else fields
+        only = {column for name in names for column in cls.Meta.columns[name]} | {'id', *columns}
+        if 'genres' in names:
+            # жанры упорядочены по айди так же, как в api.fastpath
+            queryset = queryset.prefetch_related(Prefetch('genres', queryset=BookGenre.objects.order_by('id')))
+        if 'author' in names and 'author' in expand:
+            queryset = queryset.select_related('author')
+            only |= {'author__id', 'author__username'}
+        return queryset.only(*sorted(only))
+
+
+class ListBookSerializer(SparseFieldsSerializerMixin, ModelSerializer):
     """
     Сериализатор для списка книг
 
@@ -50,6 +168,10 @@ class ListBookSerializer(ModelSerializer):
         avg_rating (ReadOnlyField): средний рейтинг книги по отзывам
     """
     avg_rating = ReadOnlyField()
+    expandable_fields = {
+        'author': (AuthorSerializer, {}),
+        'genres': (GenreSerializer, {'many': True}),
+    }
 
     class Meta:
         """
@@ -58,9 +180,39 @@ class ListBookSerializer(ModelSerializer):
         Attributes:
             model (object): Модель, которую сериализирует сериализатор
             fields (List[str]): Список полей модели для сериализации
+            columns (Dict[str, List[str]]): Столбцы модели, которые нужны каждому полю
         """
         model = Book
         fields = ['id', 'name', 'genres', 'author', 'avg_rating']
+        columns = {
+            'id': ['id'],
+            'name': ['name'],
+            # жанры подгружаются отдельным запросом
+            'genres': [],
+            'author': ['author_id'],
+            'avg_rating': ['review_count', 'rating_sum'],
+        }
+
+
+class SearchBookSerializer(ListBookSerializer):
+    """
+    Сериализатор для результатов поиска книг
+
+    Attributes:
+        rank (ReadOnlyField): Релевантность книги запросу, чем больше, тем релевантнее
+    """
+    rank = ReadOnlyField(source='search_rank')
+
+    class Meta(ListBookSerializer.Meta):
+        """
+        Метаданные о классе-сериализаторе
+
+        Attributes:
+            model (object): Модель, которую сериализирует сериализатор
+            fields (List[str]): Список полей модели для сериализации
+        """
+        model = Book
+        fields = ListBookSerializer.Meta.fields + ['rank']
 
 
 class BookSerializer(ListBookSerializer):
@@ -68,7 +220,9 @@ class BookSerializer(ListBookSerializer):
     Сериализатор для книг
 
     Attributes:
-        reviews (SerializerMethodField): Отзывы на книгу
+        reviews (SerializerMethodField): Последние отзывы на книгу
+        is_favorite (SerializerMethodField): Находится ли книга в избранных текущего пользователя
+        me (SerializerMethodField): Айди текущего пользователя
     """
     me = SerializerMethodField()
     reviews = SerializerMethodField()
@@ -92,19 +246,26 @@ class BookSerializer(ListBookSerializer):
         :param obj: Объект книги
         :return: Избранность книги
         """
-        if User.objects.filter(favorite_books__id=obj.id).exists():
-            if User.objects.get(favorite_books__id=obj.id).id == self.get_me(obj):
-                return True
-        return False
+        if hasattr(obj, '_is_favorite'):
+            return obj._is_favorite
+        request = self.context.get('request', None)
+        if not request or not request.user.is_authenticated:
+            return False
+        return request.user.has_favorite_book(obj.id)
 
     def get_reviews(self, obj):
         """
-        Вернуть сериализированный список отзывов на книгу
+        Вернуть сериализированный список последних отзывов на книгу (не больше settings.BOOK_DETAIL_REVIEWS).
+        Полный список отзывов отдается постранично отдельным эндпоинтом
 
         :param obj: Объект книги
         :return: Сериализированный JSON-список отызвов на книгу
         """
-        return BookReviewSerializer(obj.book_reviews, many=True).data
+        if hasattr(obj, '_reviews'):
+            reviews = obj._reviews
+        else:
+            reviews = obj.book_reviews.order_by('-created_at', '-id')[:settings.BOOK_DETAIL_REVIEWS]
+        return BookReviewSerializer(reviews, many=True).data
 
     class Meta(ListBookSerializer.Meta):
         """
@@ -115,7 +276,21 @@ class BookSerializer(ListBookSerializer):
             fields (List[str]): Список полей модели для сериализации
         """
         model = Book
-        fields = ListBookSerializer.Meta.fields + ['description', 'created_at', 'reviews', 'is_favorite', 'me']
+        fields = ListBookSerializer.Meta.fields + [
+            'description', 'created_at', 'review_count', 'reviews', 'is_favorite', 'me'
+        ]
+        columns = {
+            **ListBookSerializer.Meta.columns,
+            'description': ['description'],
+            'created_at': ['created_at'],
+            'review_count': ['review_count'],
+            # отзывы и избранность подгружаются отдельными запросами, а me берется из запроса
+            'reviews': [],
+            'is_favorite': [],
+            'me': [],
+        }
+        # поля, которые зависят от текущего пользователя и не попадают в кэш книги
+        user_fields = ['is_favorite', 'me']
 
 
 class CreateBookSerializer(ModelSerializer):
@@ -137,3 +312,29 @@ class CreateBookSerializer(ModelSerializer):
         """
         model = Book
         fields = ['name', 'author', 'description', 'genres']
+
+
+class FavoritesBatchSerializer(Serializer):
+    """
+    Сериализатор пакетного изменения избранных книг
+
+    Attributes:
+        add (ListField): Айди книг, которые нужно добавить в избранные
+        remove (ListField): Айди книг, которые нужно удалить из избранных
+    """
+    add = ListField(child=IntegerField(min_value=1), required=False, default=list, max_length=1000)
+    remove = ListField(child=IntegerField(min_value=1), required=False, default=list, max_length=1000)
+
+    def validate(self, attrs):
+        """
+        Убрать повторы и проверить, что одна книга не добавляется и не удаляется одновременно
+
+        :param attrs: Данные запроса
+        :return: Провалидированные данные с отсортированными списками айди без повторов
+        """
+        add, remove = sorted(set(attrs['add'])), sorted(set(attrs['remove']))
+        if not add and not remove:
+            raise ValidationError('Expected book ids in "add" or "remove".')
+        if set(add) & set(remove):
+            raise ValidationError('The same book cannot be added and removed at once.')
+        return {'add': add, 'remove': remove}
@@ -0,0 +1,83 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from book_catalog.models import Book, BookGenre, BookReview
+from book_catalog.signals import books_imported, ratings_rebuilt
+
+from . import cache
+
+
+def invalidate_after_commit(book_ids):
+    """
+    Сбросить кэш книг и списков книг после коммита транзакции, чтобы параллельный запрос
+    не успел положить в кэш данные, которые еще не закоммичены
+
+    :param book_ids: Айди книг
+    """
+    book_ids = list(book_ids)
+
+    def invalidate():
+        cache.invalidate_book_details(book_ids)
+        cache.bump_catalog_generation()
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_changed(sender, instance, **kwargs):
+    """
+    Сброс кэша книги при ее изменении или удалении
+    """
+    invalidate_after_commit([instance.pk])
+
+
+@receiver(post_save, sender=BookReview)
+@receiver(post_delete, sender=BookReview)
+def review_changed(sender, instance, **kwargs):
+    """
+    Сброс кэша книги при изменении отзыва на нее
+    """
+    invalidate_after_commit([instance.book_id])
+
+
+@receiver(post_save, sender=BookGenre)
+@receiver(pre_delete, sender=BookGenre)
+def genre_changed(sender, instance, **kwargs):
+    """
+    Сброс кэша всех книг жанра при его изменении. При удалении айди книг собираются
+    до удаления, пока связи жанра с книгами еще существуют
+    """
+    invalidate_after_commit(instance.books.values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=Book.genres.through)
+def book_genres_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Сброс кэша книг при изменении их списка жанров
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_after_commit([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        invalidate_after_commit(pk_set)
+    elif action == 'pre_clear':
+        invalidate_after_commit(instance.books.values_list('id', flat=True))
+
+
+@receiver(books_imported)
+def books_were_imported(sender, book_ids, **kwargs):
+    """
+    Сброс кэша списков книг после массового импорта (сигнал отправляется уже после коммита)
+    """
+    cache.bump_catalog_generation()
+
+
+@receiver(ratings_rebuilt)
+def ratings_were_rebuilt(sender, book_ids, **kwargs):
+    """
+    Сброс кэша книг и списков книг после пересчета агрегатов рейтинга (сигнал отправляется уже после коммита)
+    """
+    cache.invalidate_book_details(book_ids)
+    cache.bump_catalog_generation()
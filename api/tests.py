@@ -1,3 +1,1045 @@
-from django.test import TestCase
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, connections
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from django.test import AsyncRequestFactory, Client, RequestFactory, SimpleTestCase, TestCase, \
+    TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-# Create your tests here.
+from book_catalog.models import Book, BookGenre, BookReview
+from users.models import User
+
+from api import cache, throttling
+from api.db import run_write
+from api.fastpath import BOOK_LIST_KEYS
+from api.profiling import ProfilingMiddleware, QueryRecorder, metrics, sql_signature
+from api.renderers import ORJSONRenderer
+from api.serializers import ListBookSerializer
+from api.replicas import ReplicaRouter, ReplicaRoutingMiddleware
+from api.views import AsyncGetBookAPIView, AsyncListBooks
+
+from decimal import Decimal
+from unittest import mock
+import json
+import os
+import random
+import tempfile
+
+
+class CatalogTestCase(TestCase):
+    """
+    Базовый класс тестов каталога. Очищает кэш каталога и корзины ограничения частоты перед каждым тестом
+    """
+
+    def setUp(self):
+        cache.get_cache().clear()
+        throttling.local_store.reset()
+
+
+class ListBooksQueriesTestCase(CatalogTestCase):
+    """
+    Проверка того, что количество запросов к БД в /api/books/ не зависит от количества книг
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author', password='password123')
+        cls.reviewer = User.objects.create_user(username='reviewer', password='password123')
+        cls.genres = [BookGenre.objects.create(name=f'genre {i}') for i in range(3)]
+
+    def create_books(self, count):
+        for i in range(count):
+            book = Book.objects.create(name=f'book {i}', author=self.author, description='description')
+            book.genres.set(self.genres)
+            BookReview.objects.create(book=book, author=self.reviewer, rating=i % 5 + 1)
+            BookReview.objects.create(book=book, author=self.reviewer, rating=5)
+        Book.objects.rebuild_ratings()
+
+    def count_list_queries(self):
+        cache.get_cache().clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/books/')
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_constant(self):
+        self.create_books(2)
+        few_books_queries = self.count_list_queries()
+        self.create_books(10)
+        many_books_queries = self.count_list_queries()
+        self.assertEqual(few_books_queries, many_books_queries)
+        self.assertLessEqual(many_books_queries, 2)
+
+    def test_avg_rating_is_a_number(self):
+        self.create_books(1)
+        book = self.client.get('/api/books/').json()['results'][0]
+        self.assertEqual(book['avg_rating'], 3.0)
+        self.assertEqual(sorted(book['genres']), sorted(genre.id for genre in self.genres))
+        self.assertEqual(Book.objects.get(id=book['id']).avg_rating, 3.0)
+
+
+class ListBooksPaginationTestCase(CatalogTestCase):
+    """
+    Проверка пагинации списка книг по курсору
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(username='author', password='password123')
+        Book.objects.bulk_create([
+            Book(name=f'book {i}', author=author, description='description') for i in range(10)
+        ])
+
+    def test_pages_cover_all_books_once(self):
+        ids = []
+        url = '/api/books/?page_size=3'
+        while url:
+            page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 3)
+            ids += [book['id'] for book in page['results']]
+            url = page['next']
+        self.assertEqual(sorted(ids), sorted(Book.objects.values_list('id', flat=True)))
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/books/?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+
+class BookRatingAggregatesTestCase(CatalogTestCase):
+    """
+    Проверка денормализованных агрегатов рейтинга книги
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reviewer', password='password123', is_activated=True)
+        cls.book = Book.objects.create(name='book', author=cls.user, description='description')
+
+    def test_review_updates_aggregates(self):
+        self.client.force_login(self.user)
+        for rating in (5, 2):
+            response = self.client.post('/api/writeReview/', {'book': self.book.id, 'text': 'text', 'rating': rating})
+            self.assertEqual(response.status_code, 201)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.review_count, self.book.rating_sum, self.book.rating_avg), (2, 7, 3.5))
+        self.assertEqual(self.book.avg_rating, 3.5)
+
+    def test_rebuild_ratings(self):
+        BookReview.objects.create(book=self.book, author=self.user, rating=4)
+        BookReview.objects.create(book=self.book, author=self.user, rating=1)
+        empty_book = Book.objects.create(name='empty', author=self.user, description='description')
+        Book.objects.rebuild_ratings()
+        self.book.refresh_from_db()
+        empty_book.refresh_from_db()
+        self.assertEqual((self.book.review_count, self.book.rating_sum, self.book.rating_avg), (2, 5, 2.5))
+        self.assertEqual((empty_book.review_count, empty_book.rating_avg), (0, 0))
+        self.assertIsNone(empty_book.avg_rating)
+
+    def test_rebuild_ratings_invalidates_cache(self):
+        self.client.get(f'/api/book/{self.book.id}')
+        self.client.get('/api/books/')
+        # bulk_create не отправляет сигналы, поэтому кэш сбрасывается только пересчетом
+        BookReview.objects.bulk_create([BookReview(book=self.book, author=self.user, text='text', rating=4)])
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.rebuild_ratings()
+        self.assertEqual(self.client.get(f'/api/book/{self.book.id}').json()['review_count'], 1)
+        self.assertEqual(self.client.get('/api/books/').json()['results'][0]['avg_rating'], 4.0)
+
+
+class BooksByRatingTestCase(CatalogTestCase):
+    """
+    Проверка списка книг, отсортированного по рейтингу
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author', password='password123')
+        cls.other_author = User.objects.create_user(username='other', password='password123')
+        cls.books = []
+        for i, rating_avg in enumerate([3.0, 0, 5.0, 4.5, 3.0]):
+            cls.books.append(Book.objects.create(
+                name=f'book {i}',
+                author=cls.author if i % 2 else cls.other_author,
+                description='description',
+                rating_avg=rating_avg
+            ))
+
+    def test_ordered_by_rating_across_pages(self):
+        ids = []
+        url = '/api/booksByRating/?page_size=2'
+        while url:
+            page = self.client.get(url).json()
+            ids += [book['id'] for book in page['results']]
+            url = page['next']
+        expected = sorted(self.books, key=lambda book: (book.rating_avg, book.id), reverse=True)
+        self.assertEqual(ids, [book.id for book in expected])
+
+    def test_filter_by_author(self):
+        response = self.client.get(f'/api/booksByRating/?author_ids={self.author.id}')
+        ids = [book['id'] for book in response.json()['results']]
+        self.assertEqual(ids, [self.books[3].id, self.books[1].id])
+
+    def test_index_serves_ordering(self):
+        plan = Book.objects.order_by('-rating_avg', '-id')[:20].explain()
+        self.assertIn('book_rating_idx', plan)
+
+
+class GetBookFavoriteTestCase(CatalogTestCase):
+    """
+    Проверка избранности книги на странице книги
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'user {i}', password='password123', is_activated=True)
+            for i in range(3)
+        ]
+        cls.book = Book.objects.create(name='book', author=cls.users[0], description='description')
+        for user in cls.users[:2]:
+            user.favorite_books.add(cls.book)
+
+    def test_is_favorite_per_user(self):
+        for user, is_favorite in zip(self.users, (True, True, False)):
+            self.client.force_login(user)
+            data = self.client.get(f'/api/book/{self.book.id}').json()
+            self.assertEqual(data['is_favorite'], is_favorite)
+            self.assertEqual(data['me'], user.id)
+
+    def test_anonymous_user(self):
+        data = self.client.get(f'/api/book/{self.book.id}').json()
+        self.assertFalse(data['is_favorite'])
+
+    def test_missing_book(self):
+        self.assertEqual(self.client.get('/api/book/0').status_code, 404)
+
+
+class FavoritesTestCase(CatalogTestCase):
+    """
+    Проверка добавления, удаления и списка избранных книг
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other = [
+            User.objects.create_user(username=f'user {i}', password='password123', is_activated=True) for i in range(2)
+        ]
+        cls.genre = BookGenre.objects.create(name='genre')
+        cls.books = [Book.objects.create(name=f'book {i}', author=cls.user, description='d') for i in range(4)]
+        for book in cls.books:
+            book.genres.add(cls.genre)
+        cls.other.favorite_books.add(cls.books[0])
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def test_single_add_and_remove_are_per_user(self):
+        book_id = self.books[0].id
+        self.assertEqual(self.client.get(f'/api/removeFavorite/{book_id}').status_code, 409)
+        self.assertEqual(self.client.get(f'/api/favorite/{book_id}').status_code, 200)
+        self.assertEqual(self.client.get(f'/api/favorite/{book_id}').status_code, 409)
+        self.assertEqual(self.client.get(f'/api/removeFavorite/{book_id}').status_code, 200)
+        self.assertTrue(self.other.has_favorite_book(book_id))
+
+    def test_concurrent_add(self):
+        book_id = self.books[1].id
+        # запись добавил параллельный запрос: вставка упирается в уникальный индекс и дает 409, а не 500
+        with mock.patch.object(
+            User.favorite_books.through.objects, 'get', side_effect=[User.favorite_books.through.DoesNotExist, None]
+        ):
+            User.favorite_books.through.objects.create(user_id=self.user.id, book_id=book_id)
+            response = self.client.get(f'/api/favorite/{book_id}')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(User.favorite_books.through.objects.filter(user_id=self.user.id, book_id=book_id).count(), 1)
+
+    def test_batch(self):
+        self.user.favorite_books.add(self.books[1], self.books[3])
+        ids = [book.id for book in self.books]
+        response = self.client.post('/api/favorites/batch', {
+            'add': [ids[0], ids[1], ids[2], 10 ** 6], 'remove': [ids[3]]
+        }, content_type='application/json')
+        self.assertEqual(response.json(), {'added': ids[:3], 'removed': 1, 'not_found': [10 ** 6]})
+        self.assertEqual(sorted(self.user.favorite_books.values_list('id', flat=True)), ids[:3])
+
+    def test_batch_validation(self):
+        book_id = self.books[0].id
+        for body in ({}, {'add': [book_id], 'remove': [book_id]}, {'add': ['x']}):
+            response = self.client.post('/api/favorites/batch', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_list(self):
+        self.user.favorite_books.add(*self.books[:3])
+        self.client.get('/api/favorites?page_size=2')
+        # сессия и пользователь берутся из кэша: только страница книг и жанры страницы
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/favorites?page_size=2')
+        data = response.json()
+        self.assertEqual([book['name'] for book in data['results']], ['book 2', 'book 1'])
+        self.assertEqual(data['results'][0]['genres'], [self.genre.id])
+        self.assertEqual([book['name'] for book in self.client.get(data['next']).json()['results']], ['book 0'])
+
+
+@override_settings(BOOK_DETAIL_REVIEWS=3)
+class BookReviewsTestCase(CatalogTestCase):
+    """
+    Проверка отзывов на странице книги и постраничного списка отзывов
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reviewer', password='password123')
+        cls.book = Book.objects.create(name='book', author=cls.user, description='description')
+        cls.reviews = BookReview.objects.bulk_create([
+            BookReview(book=cls.book, author=cls.user, text=f'review {i}', rating=5) for i in range(7)
+        ])
+        Book.objects.rebuild_ratings()
+
+    def test_detail_embeds_latest_reviews(self):
+        data = self.client.get(f'/api/book/{self.book.id}').json()
+        self.assertEqual(data['review_count'], 7)
+        self.assertEqual([review['id'] for review in data['reviews']], [review.id for review in self.reviews[:-4:-1]])
+
+    def test_reviews_pages(self):
+        ids = []
+        url = f'/api/book/{self.book.id}/reviews?page_size=3'
+        while url:
+            page = self.client.get(url).json()
+            ids += [review['id'] for review in page['results']]
+            url = page['next']
+        self.assertEqual(ids, [review.id for review in reversed(self.reviews)])
+
+    def test_reviews_of_missing_book(self):
+        self.assertEqual(self.client.get('/api/book/0/reviews').status_code, 404)
+
+
+class BookDetailCacheTestCase(CatalogTestCase):
+    """
+    Проверка кэша страницы книги и его сброса при изменениях
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', password='password123', is_activated=True)
+        cls.book = Book.objects.create(name='book', author=cls.user, description='description')
+        cls.genre = BookGenre.objects.create(name='genre')
+
+    def get_book(self):
+        return self.client.get(f'/api/book/{self.book.id}').json()
+
+    def test_cache_hit_does_not_query_book(self):
+        self.get_book()
+        with self.assertNumQueries(0):
+            self.get_book()
+
+    def test_user_fields_are_merged(self):
+        self.get_book()
+        self.user.favorite_books.add(self.book)
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.get_book()
+        self.assertTrue(data['is_favorite'])
+        self.assertEqual(data['me'], self.user.id)
+        favorite_queries = [query for query in ctx.captured_queries if 'users_user_favorite_books' in query['sql']]
+        self.assertEqual(len(favorite_queries), 1)
+        self.assertFalse(any('book_catalog_book' in query['sql'] for query in ctx.captured_queries))
+
+    def test_invalidated_on_review(self):
+        self.get_book()
+        with self.captureOnCommitCallbacks(execute=True):
+            BookReview.objects.create(book=self.book, author=self.user, text='new review', rating=4)
+        self.assertEqual([review['text'] for review in self.get_book()['reviews']], ['new review'])
+
+    def test_invalidated_on_genres_change(self):
+        self.get_book()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.genres.add(self.genre)
+        self.assertEqual(self.get_book()['genres'], [self.genre.id])
+        self.get_book()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.genre.delete()
+        self.assertEqual(self.get_book()['genres'], [])
+
+
+class BookListCacheTestCase(CatalogTestCase):
+    """
+    Проверка кэша страниц списка книг и ETag
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author', password='password123', is_activated=True)
+        cls.genres = [BookGenre.objects.create(name=f'genre {i}') for i in range(2)]
+        book = Book.objects.create(name='book', author=cls.user, description='description')
+        book.genres.set(cls.genres)
+
+    def test_equivalent_filters_share_cache(self):
+        first, second = self.genres
+        self.client.get(f'/api/books/?genre_ids={first.id}&genre_ids={second.id}')
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/books/?genre_ids={second.id}&genre_ids={first.id}&genre_ids={first.id}')
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_write_invalidates_list(self):
+        self.client.force_login(self.user)
+        self.client.get('/api/books/')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/addBook/', {
+                'name': 'new book', 'description': 'description', 'genres': [self.genres[0].id]
+            })
+        self.assertEqual(response.status_code, 201)
+        names = [book['name'] for book in self.client.get('/api/books/').json()['results']]
+        self.assertEqual(names, ['new book', 'book'])
+
+    def test_etag_revalidation(self):
+        etag = self.client.get('/api/books/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/books/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.create(name='new book', author=self.user, description='description')
+        response = self.client.get('/api/books/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class BookFacetsTestCase(CatalogTestCase):
+    """
+    Проверка фасетных счетчиков списка книг
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [
+            User.objects.create_user(username=f'author{i}', password='password123', is_activated=True) for i in range(2)
+        ]
+        cls.drama, cls.fantasy = BookGenre.objects.create(name='Drama'), BookGenre.objects.create(name='Fantasy')
+        for i in range(3):
+            book = Book.objects.create(name=f'book {i}', author=cls.authors[i % 2], description='description')
+            book.genres.set([cls.drama, cls.fantasy] if i else [cls.drama])
+
+    def test_facets(self):
+        facets = self.client.get('/api/books/?facets=1').json()['facets']
+        self.assertEqual(facets['genres'], [
+            {'id': self.drama.id, 'name': 'Drama', 'count': 3},
+            {'id': self.fantasy.id, 'name': 'Fantasy', 'count': 2},
+        ])
+        self.assertEqual(facets['authors'], [
+            {'id': self.authors[0].id, 'name': 'author0', 'count': 2},
+            {'id': self.authors[1].id, 'name': 'author1', 'count': 1},
+        ])
+        self.assertNotIn('facets', self.client.get('/api/books/').json())
+
+    def test_facets_follow_filters(self):
+        response = self.client.get(f'/api/books/?facets=1&author_ids={self.authors[0].id}&page_size=1')
+        facets = response.json()['facets']
+        self.assertEqual([genre['count'] for genre in facets['genres']], [2, 1])
+        self.assertEqual(facets['authors'], [{'id': self.authors[0].id, 'name': 'author0', 'count': 2}])
+        # следующая страница берет фасеты из кэша: запросы только за страницей и жанрами ее книг
+        with self.assertNumQueries(2):
+            next_page = self.client.get(response.json()['next']).json()
+        self.assertEqual(next_page['facets'], facets)
+
+    def test_facets_change_etag(self):
+        etag = self.client.get('/api/books/').headers['ETag']
+        response = self.client.get('/api/books/?facets=1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class AsyncCatalogViewsTestCase(CatalogTestCase):
+    """
+    Проверка того, что асинхронные представления каталога отдают те же ответы, что и синхронные
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', password='password123', is_activated=True)
+        cls.book = Book.objects.create(name='book', author=cls.user, description='description')
+        cls.book.genres.add(BookGenre.objects.create(name='genre'))
+        cls.user.favorite_books.add(cls.book)
+        BookReview.objects.create(book=cls.book, author=cls.user, text='review', rating=4)
+
+    async def get_async(self, view, path, user=None, **kwargs):
+        request = AsyncRequestFactory().get(path)
+        request.user = user or AnonymousUser()
+        return await view.as_view()(request, **kwargs)
+
+    async def test_book_matches_sync(self):
+        await sync_to_async(self.client.force_login)(self.user)
+        expected = (await sync_to_async(self.client.get)(f'/api/book/{self.book.id}')).json()
+        for _ in range(2):
+            # первый запрос идет в БД, второй - в кэш
+            response = await self.get_async(AsyncGetBookAPIView, '/api/book/', user=self.user, book_id=self.book.id)
+            self.assertEqual(json.loads(response.content), expected)
+        self.assertTrue(expected['is_favorite'])
+
+    async def test_missing_book(self):
+        response = await self.get_async(AsyncGetBookAPIView, '/api/book/', book_id=0)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_books_matches_sync(self):
+        expected = (await sync_to_async(self.client.get)('/api/books/?page_size=1')).json()
+        await sync_to_async(cache.get_cache().clear)()
+        response = await self.get_async(AsyncListBooks, '/api/books/?page_size=1')
+        self.assertEqual(json.loads(response.content), expected)
+
+    async def test_invalid_filter(self):
+        response = await self.get_async(AsyncListBooks, '/api/books/?author_ids=abc')
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportBooksTestCase(CatalogTestCase):
+    """
+    Проверка эндпоинта массового импорта книг
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='publisher', password='password123', is_activated=True)
+
+    def test_import_file(self):
+        self.client.force_login(self.user)
+        content = '\n'.join(json.dumps({'name': f'Book {i}', 'description': 'd', 'genres': ['Drama']}) for i in range(3))
+        upload = SimpleUploadedFile('books.jsonl', content.encode())
+        self.client.get('/api/books/')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/importBooks/', {'file': upload})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'created': 3, 'failed': 0, 'errors': []})
+        self.assertEqual(len(self.client.get('/api/books/').json()['results']), 3)
+
+    def test_cannot_import_as_other_author(self):
+        other = User.objects.create_user(username='other', password='password123')
+        content = json.dumps({'name': 'Book', 'description': 'd', 'author': 'other'})
+        self.client.force_login(self.user)
+        response = self.client.post('/api/importBooks/', {'file': SimpleUploadedFile('books.jsonl', content.encode())})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Book.objects.exists())
+        # администратор может указывать авторов
+        self.client.force_login(User.objects.create_user(
+            username='admin', password='password123', is_activated=True, is_staff=True
+        ))
+        response = self.client.post('/api/importBooks/', {'file': SimpleUploadedFile('books.jsonl', content.encode())})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Book.objects.get().author, other)
+
+    @override_settings(BOOK_IMPORT_CHUNK_SIZE=1)
+    def test_invalid_encoding_imports_nothing(self):
+        self.client.force_login(self.user)
+        lines = [json.dumps({'name': f'Book {i}', 'description': 'd'}).encode() for i in range(3)]
+        upload = SimpleUploadedFile('books.jsonl', b'\n'.join(lines + [b'{"name": "\xff"}']))
+        response = self.client.post('/api/importBooks/', {'file': upload})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Book.objects.exists())
+
+    def test_requires_activated_user(self):
+        upload = SimpleUploadedFile('books.csv', b'name,description\nBook,d\n')
+        self.assertEqual(self.client.post('/api/importBooks/', {'file': upload}).status_code, 403)
+
+
+class ExportBooksTestCase(CatalogTestCase):
+    """
+    Проверка эндпоинта выгрузки каталога
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', password='password123', is_activated=True)
+        cls.book = Book.objects.create(name='book', author=cls.admin, description='description')
+
+    def test_stream_csv(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/api/exportBooks/?file_format=csv')
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['id', 'name'])
+        self.assertEqual(len(lines), 2)
+
+    def test_invalid_since(self):
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get('/api/exportBooks/?since=yesterday').status_code, 400)
+
+    def test_admin_only(self):
+        user = User.objects.create_user(username='reader', password='password123', is_activated=True)
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/api/exportBooks/').status_code, 403)
+
+
+class SearchBooksTestCase(CatalogTestCase):
+    """
+    Проверка полнотекстового поиска книг
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', password='password123', is_activated=True)
+        cls.genre = BookGenre.objects.create(name='Drama')
+        cls.in_name = Book.objects.create(name='The Dragon Book', author=cls.user, description='compilers')
+        cls.in_description = Book.objects.create(name='Wizards', author=cls.user, description='a story about a dragon')
+        Book.objects.create(name='Other', author=cls.user, description='nothing here')
+        cls.in_name.genres.add(cls.genre)
+
+    def search(self, query, **params):
+        return self.client.get('/api/books/search', {'q': query, **params})
+
+    def test_ranked_by_relevance(self):
+        response = self.search('dragon')
+        self.assertEqual(response.data['count'], 2)
+        results = response.data['results']
+        # совпадение в названии весит больше совпадения в описании
+        self.assertEqual([book['id'] for book in results], [self.in_name.id, self.in_description.id])
+        self.assertGreater(results[0]['rank'], results[1]['rank'])
+        self.assertEqual(results[0]['genres'], [self.genre.id])
+
+    def test_unsupported_backend(self):
+        with mock.patch.object(connection, 'vendor', 'oracle'):
+            response = self.search('dragon')
+        self.assertEqual(response.status_code, 501)
+
+    def test_index_follows_changes(self):
+        self.in_description.description = 'a story about wizards'
+        self.in_description.save()
+        Book.objects.filter(pk=self.in_name.pk).delete()
+        created = Book.objects.bulk_create([Book(name='Dragon again', author=self.user, description='d')])
+        self.assertEqual([book['id'] for book in self.search('DRAGON').data['results']], [created[0].id])
+
+    def test_pagination_and_queries(self):
+        # количество, айди страницы, книги страницы и их жанры
+        with self.assertNumQueries(4):
+            response = self.search('dragon', page_size=1, page=2)
+        self.assertEqual([book['id'] for book in response.data['results']], [self.in_description.id])
+        self.assertIsNone(response.data['next'])
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(self.search('dragon" * (:').data['count'], 2)
+        self.assertEqual(self.search('dragon compilers').data['count'], 1)
+        self.assertEqual(self.search('').status_code, 400)
+        self.assertEqual(self.search('***').data['count'], 0)
+
+
+@override_settings(SQLITE_WRITE_RETRY_DELAY=0)
+class SQLiteWritesTestCase(TransactionTestCase):
+    """
+    Проверка настройки соединений SQLite и повтора записи при занятой блокировке
+    """
+
+    def read_pragmas(self, path):
+        """
+        Открыть новое соединение с файлом SQLite и прочитать его PRAGMA
+
+        :param path: Путь к файлу БД
+        :return: Пара (journal_mode, synchronous)
+        """
+        wrapper = type(connections['default'])({**connection.settings_dict, 'NAME': path}, alias='pragmas')
+        try:
+            with wrapper.cursor() as cursor:
+                self.assertEqual(cursor.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+                journal_mode = cursor.execute('PRAGMA journal_mode').fetchone()[0]
+                return journal_mode, cursor.execute('PRAGMA synchronous').fetchone()[0]
+        finally:
+            wrapper.close()
+
+    def test_pragmas(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'db.sqlite3')
+            # без SQLITE_WAL файл БД не переводится в WAL (2 - FULL)
+            with override_settings(SQLITE_WAL=False):
+                self.assertEqual(self.read_pragmas(path), ('delete', 2))
+            # 1 - NORMAL
+            with override_settings(SQLITE_WAL=True):
+                self.assertEqual(self.read_pragmas(path), ('wal', 1))
+
+    def test_retry_on_locked(self):
+        attempts = []
+
+        def write():
+            attempts.append(BookGenre.objects.create(name='genre'))
+            if len(attempts) < 3:
+                raise OperationalError('database is locked')
+            return attempts[-1]
+
+        genre = run_write(write)
+        self.assertEqual(len(attempts), 3)
+        # неудачные попытки откатываются вместе со своей транзакцией
+        self.assertEqual(list(BookGenre.objects.all()), [genre])
+
+    @override_settings(SQLITE_WRITE_RETRIES=1)
+    def test_retries_are_limited(self):
+        def write():
+            raise OperationalError('database is locked')
+
+        with self.assertRaises(OperationalError):
+            run_write(write)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaRoutingTestCase(SimpleTestCase):
+    """
+    Проверка выбора БД для чтения каталога с реплик
+    """
+
+    def request(self, method, path, cookies=None, write=False):
+        """
+        Пропустить запрос через ReplicaRoutingMiddleware и вернуть БД, выбранную роутером для книг и пользователей
+
+        :param method: Метод запроса
+        :param path: Путь запроса
+        :param cookies: Cookie запроса
+        :param write: Записать ли что-нибудь во время запроса
+        :return: Ответ с выбранными БД
+        """
+        router = ReplicaRouter()
+
+        def view(request):
+            if write:
+                router.db_for_write(Book)
+            response = HttpResponse()
+            response.databases = (router.db_for_read(Book), router.db_for_read(User))
+            return response
+
+        request = getattr(RequestFactory(), method)(path)
+        request.COOKIES.update(cookies or {})
+        return ReplicaRoutingMiddleware(view)(request)
+
+    def test_catalog_reads_use_replica(self):
+        for path in ('/api/books/', '/api/book/1', '/api/booksByRating/'):
+            self.assertEqual(self.request('get', path).databases, ('replica_0', 'default'))
+
+    def test_other_requests_use_primary(self):
+        self.assertEqual(self.request('get', '/api/favorites').databases, ('default', 'default'))
+        self.assertEqual(self.request('post', '/api/books/').databases, ('default', 'default'))
+        self.assertEqual(ReplicaRouter().db_for_read(Book), 'default')
+
+    def test_read_your_writes(self):
+        response = self.request('post', '/api/writeReview/', write=True)
+        cookie = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+        pinned = self.request('get', '/api/books/', cookies={settings.REPLICA_PIN_COOKIE: cookie.value})
+        self.assertEqual(pinned.databases, ('default', 'default'))
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, self.request('get', '/api/books/').cookies)
+
+    def test_only_catalog_writes_pin(self):
+        router = ReplicaRouter()
+        for model, pinned in ((Book, True), (User.favorite_books.through, True), (User, False)):
+            def view(request):
+                router.db_for_write(model)
+                return HttpResponse()
+
+            response = ReplicaRoutingMiddleware(view)(RequestFactory().post('/users/login/'))
+            self.assertEqual(settings.REPLICA_PIN_COOKIE in response.cookies, pinned)
+
+
+# реплика указывает на ту же тестовую БД, а обращения к ней видны по вызовам random.choice в ReplicaRouter
+@override_settings(DATABASE_REPLICAS=['default'])
+class ReplicaCacheTestCase(CatalogTestCase):
+    """
+    Проверка того, что общий кэш каталога заполняется чтениями из основной БД
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reviewer', password='password123', is_activated=True)
+        cls.book = Book.objects.create(name='book', author=cls.user, description='description')
+
+    def test_cache_is_filled_from_primary(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/writeReview/', {'book': self.book.id, 'text': 'text', 'rating': 4})
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(settings.REPLICA_PIN_COOKIE, self.client.cookies)
+
+        # другой клиент не закреплен: промахи кэша читаются из основной БД, и кэш заполняется
+        other = Client()
+        with mock.patch('api.replicas.random.choice', side_effect=random.choice) as choice:
+            self.assertEqual(other.get(f'/api/book/{self.book.id}').json()['avg_rating'], 4)
+            page = other.get('/api/books/', {'facets': 1})
+            self.assertEqual(choice.call_count, 0)
+            self.assertIsNotNone(cache.get_book_detail(self.book.id))
+            # ответы без кэша читаются с реплики
+            other.get(f'/api/book/{self.book.id}', {'fields': 'id,author', 'expand': 'author'})
+            self.assertGreater(choice.call_count, 0)
+
+        # закрепленный клиент получает ту же страницу и тот же ETag
+        pinned = self.client.get('/api/books/', {'facets': 1})
+        self.assertEqual(pinned.json()['results'][0]['avg_rating'], 4)
+        self.assertEqual(pinned['ETag'], page['ETag'])
+
+    async def test_async_views_fill_cache_from_primary(self):
+        request_factory = AsyncRequestFactory()
+        with mock.patch('api.replicas.random.choice', side_effect=random.choice) as choice:
+            # асинхронное представление вызывается middleware без async_to_sync
+            self.assertTrue(iscoroutinefunction(ReplicaRoutingMiddleware(AsyncListBooks.as_view())))
+            for view, path, kwargs in (
+                (AsyncGetBookAPIView, f'/api/book/{self.book.id}', {'book_id': self.book.id}),
+                (AsyncListBooks, '/api/books/', {}),
+            ):
+                async def get_response(request):
+                    return await view.as_view()(request, **kwargs)
+
+                request = request_factory.get(path)
+                request.user = AnonymousUser()
+                response = await ReplicaRoutingMiddleware(get_response)(request)
+                self.assertEqual(response.status_code, 200)
+            self.assertEqual(choice.call_count, 0)
+        self.assertIsNotNone(await sync_to_async(cache.get_book_detail)(self.book.id))
+
+
+@override_settings(REQUEST_PROFILING=True, PROFILING_SAMPLE_RATE=0)
+class ProfilingMiddlewareTestCase(CatalogTestCase):
+    """
+    Проверка профилирования запросов и метрик
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author', password='password123', is_activated=True)
+        cls.admin = User.objects.create_user(username='admin', password='password123', is_staff=True)
+        for i in range(3):
+            Book.objects.create(name=f'book {i}', author=cls.user, description='description')
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get('/api/books/')
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="2 queries"$')
+        self.client.force_login(self.admin)
+        text = self.client.get('/metrics').content.decode()
+        self.assertIn('django_view_requests_total{view="api.views.ListBooks",method="GET"} 1', text)
+        self.assertIn('django_view_db_queries_total{view="api.views.ListBooks",method="GET"} 2', text)
+
+    def test_streaming_response_is_recorded_when_consumed(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/api/exportBooks/')
+        self.assertNotIn('Server-Timing', response)
+        b''.join(response.streaming_content)
+        stats = metrics.views['api.views.ExportBooksAPIView', 'GET']
+        # книги и жанры выгрузки (плюс сессия и пользователь)
+        self.assertGreaterEqual(stats['queries'], 2)
+        self.assertEqual(stats['requests'], 1)
+
+    async def test_async_view_is_not_wrapped(self):
+        middleware = ProfilingMiddleware(AsyncListBooks.as_view())
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = AsyncRequestFactory().get('/api/books/')
+        request.user = AnonymousUser()
+        response = await middleware(request)
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+$')
+
+    def test_metrics_require_staff(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    def test_duplicate_queries(self):
+        self.assertEqual(
+            sql_signature('SELECT * FROM t WHERE id IN (%s, %s, %s)'), sql_signature('SELECT * FROM t WHERE id IN (%s, %s)')
+        )
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            authors = [book.author.username for book in Book.objects.all()]
+        self.assertEqual(len(authors), 3)
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual([count for _, count in recorder.duplicates(3)], [3])
+
+    def test_sampled_profile(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_DIR=directory):
+            self.client.get(f'/api/book/{Book.objects.first().id}')
+            self.assertEqual(len(os.listdir(directory)), 1)
+            self.assertTrue(os.listdir(directory)[0].startswith('api.views.GetBookAPIView-'))
+
+    @override_settings(REQUEST_PROFILING=False)
+    def test_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/books/'))
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+class BookListFastPathTestCase(CatalogTestCase):
+    """
+    Проверка того, что быстрый путь списка книг и рендерер orjson отдают те же ответы, что и сериализаторы DRF
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author', password='password123', is_activated=True)
+        genres = [BookGenre.objects.create(name=f'genre {i}') for i in range(4)]
+        for i in range(7):
+            book = Book.objects.create(
+                name=f'книга {i} \u2028', author=cls.user, description='d', review_count=i % 3, rating_sum=(i % 3) * 4
+            )
+            # связи добавляются в порядке, обратном айди жанров, поэтому порядок жанров в ответе
+            # не совпадает с порядком строк промежуточной таблицы
+            Book.genres.through.objects.bulk_create([
+                Book.genres.through(book_id=book.id, bookgenre_id=genre.id) for genre in reversed(genres[i % 4:])
+            ])
+
+    def get_pages(self, path):
+        pages, url = [], f'{path}?page_size=3'
+        while url:
+            cache.get_cache().clear()
+            response = self.client.get(url)
+            pages.append(response.content)
+            url = response.json()['next']
+        return pages
+
+    def test_same_output(self):
+        self.assertEqual(list(BOOK_LIST_KEYS), ListBookSerializer.Meta.fields)
+        for path in ('/api/books/', '/api/booksByRating/'):
+            with override_settings(BOOK_LIST_FAST_PATH=False):
+                expected = self.get_pages(path)
+            with override_settings(BOOK_LIST_FAST_PATH=True):
+                self.assertEqual(self.get_pages(path), expected)
+            self.assertEqual(len(expected), 3)
+            genres = [book['genres'] for page in expected for book in json.loads(page)['results']]
+            self.assertIn(4, map(len, genres))
+            self.assertTrue(all(ids == sorted(ids) for ids in genres))
+
+    def test_fast_path_queries(self):
+        with override_settings(BOOK_LIST_FAST_PATH=True), self.assertNumQueries(2):
+            self.client.get('/api/books/')
+
+    def test_renderer(self):
+        data = {
+            'text': 'текст \u2028 "quoted"', 'float': 4.0, 'none': None, 'list': [1, 2.5, True],
+            'date': Book.objects.first().created_at, 'decimal': Decimal('1.10'),
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render({1: 'a'}), JSONRenderer().render({1: 'a'}))
+
+    def test_renderer_is_opt_in(self):
+        self.assertEqual(api_settings.DEFAULT_RENDERER_CLASSES[0], JSONRenderer)
+        for fast_path, renderer_class in ((False, JSONRenderer), (True, ORJSONRenderer)):
+            with override_settings(BOOK_LIST_FAST_PATH=fast_path):
+                response = self.client.get('/api/books/')
+                self.assertIs(type(response.accepted_renderer), renderer_class)
+                self.assertIs(type(self.client.get(f'/api/book/{Book.objects.first().id}').accepted_renderer), JSONRenderer)
+
+
+class SparseFieldsTestCase(CatalogTestCase):
+    """
+    Проверка выбора полей ответа (fields) и раскрытия связей (expand) в списке и на странице книги
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author', password='password123', is_activated=True)
+        cls.genre = BookGenre.objects.create(name='genre')
+        for i in range(3):
+            book = Book.objects.create(name=f'book {i}', author=cls.user, description='long description')
+            book.genres.add(cls.genre)
+        cls.book = book
+        BookReview.objects.create(book=cls.book, author=cls.user, text='review', rating=4)
+
+    def test_list_fields(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get('/api/books/?fields=id,name').json()
+        self.assertEqual([set(book) for book in data['results']], [{'id', 'name'}] * 3)
+        # без жанров нет запроса к промежуточной таблице, а description не загружается
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn('description', ctx.captured_queries[0]['sql'])
+
+    def test_list_expand(self):
+        with self.assertNumQueries(2):
+            data = self.client.get('/api/booksByRating/?fields=id,author,genres&expand=author,genres').json()
+        self.assertEqual(data['results'][0]['author'], {'id': self.user.id, 'username': 'author'})
+        self.assertEqual(data['results'][0]['genres'], [{'id': self.genre.id, 'name': 'genre'}])
+
+    def test_list_pages_with_fields(self):
+        ids, url = [], '/api/books/?fields=name&page_size=2'
+        while url:
+            data = self.client.get(url).json()
+            ids += [book['name'] for book in data['results']]
+            url = data['next']
+        self.assertEqual(sorted(ids), ['book 0', 'book 1', 'book 2'])
+
+    def test_detail_fields_skip_reviews_and_favorites(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get(f'/api/book/{self.book.id}?fields=id,name,created_at').json()
+        self.assertEqual(set(data), {'id', 'name', 'created_at'})
+        sql = ' '.join(query['sql'] for query in ctx.captured_queries)
+        self.assertNotIn('book_catalog_bookreview', sql)
+        self.assertNotIn('users_user_favorite_books', sql)
+        # частичный ответ не кэшируется, а полный ответ из кэша сужается до запрошенных полей
+        self.assertIsNone(cache.get_book_detail(self.book.id))
+        full = self.client.get(f'/api/book/{self.book.id}').json()
+        with self.assertNumQueries(0):
+            data = self.client.get(f'/api/book/{self.book.id}?fields=name,me').json()
+        self.assertEqual(data, {'name': full['name'], 'me': self.user.id})
+
+    def test_invalid_fields(self):
+        for path in ('/api/books/?fields=id,password', '/api/book/1?expand=reviews', '/api/books/?expand=name'):
+            self.assertEqual(self.client.get(path).status_code, 400)
+
+    async def test_async_detail(self):
+        path = f'/api/book/{self.book.id}?fields=id,author&expand=author'
+        expected = (await sync_to_async(self.client.get)(path)).json()
+        request = AsyncRequestFactory().get(path)
+        request.user = AnonymousUser()
+        response = await AsyncGetBookAPIView.as_view()(request, book_id=self.book.id)
+        self.assertEqual(json.loads(response.content), expected)
+        self.assertEqual(expected['author']['username'], 'author')
+
+
+class ThrottlingTestCase(CatalogTestCase):
+    """
+    Проверка ограничения частоты запросов корзиной токенов
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(username=f'reader{i}', password='password123') for i in range(2)]
+
+    def test_local_bucket_refills(self):
+        store = throttling.LocalBucketStore()
+        with mock.patch('api.throttling.time.monotonic', return_value=100.0):
+            self.assertEqual([store.consume('key', 2, 60) for _ in range(3)], [0, 0, 30.0])
+        with mock.patch('api.throttling.time.monotonic', return_value=130.0):
+            self.assertEqual([store.consume('key', 2, 60) for _ in range(2)], [0, 30.0])
+
+    @override_settings(THROTTLE_LOCAL_MAX_KEYS=2)
+    def test_local_store_is_bounded(self):
+        store = throttling.LocalBucketStore()
+        for key in ('a', 'b', 'c'):
+            store.consume(key, 1, 60)
+        self.assertEqual(list(store.buckets), ['b', 'c'])
+
+    def test_cache_store(self):
+        store = throttling.CacheBucketStore()
+        # окно не меняется между запросами
+        with mock.patch('api.throttling.time.time', return_value=6000.0):
+            self.assertEqual([store.consume('key', 2, 60) > 0 for _ in range(4)], [False, False, True, True])
+
+    @override_settings(THROTTLE_RATES={'books.ip': '2/min'})
+    def test_books_per_ip(self):
+        codes = [self.client.get('/api/books/').status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+        response = self.client.get('/api/booksByRating/')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        # другие области не ограничиваются
+        self.assertEqual(self.client.get('/api/book/0').status_code, 404)
+
+    @override_settings(THROTTLE_RATES={'books.user': '1/min'})
+    def test_books_per_user(self):
+        for user in self.users:
+            self.client.force_login(user)
+            self.assertEqual(self.client.get('/api/books/').status_code, 200)
+            self.assertEqual(self.client.get('/api/books/').status_code, 429)
+        # анонимные запросы ограничиваются только по адресу
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/books/').status_code, 200)
+
+    @override_settings(THROTTLE_RATES={'books.ip': '1/min'}, THROTTLE_STORE='cache')
+    async def test_async_books(self):
+        with mock.patch('api.throttling.time.time', return_value=6000.0):
+            codes = [
+                (await AsyncListBooks.as_view()(AsyncRequestFactory().get('/api/books/'))).status_code for _ in range(2)
+            ]
+        self.assertEqual(codes, [200, 429])
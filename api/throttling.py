@@ -0,0 +1,178 @@
+"""
+Ограничение частоты запросов к дорогим эндпоинтам (token bucket).
+
+Представление задает область ограничения атрибутом throttle_scope (например, books или login),
+а частоты областей задаются в settings.THROTTLE_RATES ключами вида <область>.user и <область>.ip
+в формате DRF: "120/min" - корзина на 120 запросов, которая полностью восполняется за минуту.
+UserTokenBucketThrottle считает запросы аутентифицированного пользователя, IPTokenBucketThrottle -
+все запросы с одного адреса. Области и ключи без частоты не ограничиваются.
+
+Корзины хранятся в памяти процесса (settings.THROTTLE_STORE = 'local') или в кэше
+settings.THROTTLE_CACHE_ALIAS ('cache'), общем для всех процессов. Проверка стоит O(1) и не обращается к БД:
+локальная корзина обновляется под блокировкой, а в кэше используются только атомарные add и incr.
+"""
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+import threading
+import time
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    Разобрать частоту в формате DRF
+
+    :param rate: Частота, например "120/min"
+    :return: Пара (емкость корзины, время полного восполнения в секундах)
+    """
+    num, period = rate.split('/')
+    return int(num), PERIODS[period[0]]
+
+
+class LocalBucketStore:
+    """
+    Корзины в памяти процесса. Хранится не больше settings.THROTTLE_LOCAL_MAX_KEYS корзин,
+    при переполнении вытесняются давно не использованные
+
+    Attributes:
+        lock (threading.Lock): Блокировка корзин
+        buckets (OrderedDict): Ключ корзины -> (количество токенов, время обновления)
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def consume(self, key, capacity, period):
+        """
+        Взять токен из корзины
+
+        :param key: Ключ корзины
+        :param capacity: Емкость корзины
+        :param period: Время полного восполнения корзины в секундах
+        :return: 0, если токен взят, иначе время в секундах до появления токена
+        """
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * capacity / period)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) * period / capacity
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > settings.THROTTLE_LOCAL_MAX_KEYS:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def reset(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheBucketStore:
+    """
+    Корзины в кэше. Кэш не умеет атомарно читать и записывать корзину, поэтому она приближается
+    скользящим окном: запросы считаются атомарным incr в окнах длиной period, а занятые токены оцениваются
+    как количество запросов текущего окна плюс доля предыдущего окна, которая еще не вышла из периода
+    """
+
+    def consume(self, key, capacity, period):
+        """
+        Взять токен из корзины
+
+        :param key: Ключ корзины
+        :param capacity: Емкость корзины
+        :param period: Время полного восполнения корзины в секундах
+        :return: 0, если токен взят, иначе примерное время в секундах до появления токена
+        """
+        cache = caches[settings.THROTTLE_CACHE_ALIAS]
+        now = time.time()
+        window, elapsed = divmod(now / period, 1)
+        current_key = f'throttle:{key}:{int(window)}'
+        cache.add(current_key, 0, timeout=period * 2)
+        try:
+            count = cache.incr(current_key)
+        except ValueError:
+            # счетчик истек между add и incr
+            cache.add(current_key, 1, timeout=period * 2)
+            count = 1
+        previous = cache.get(f'throttle:{key}:{int(window) - 1}', 0)
+        if previous * (1 - elapsed) + count - 1 < capacity:
+            return 0
+        # отклоненный запрос не занимает токен
+        cache.decr(current_key)
+        if count > capacity or not previous:
+            return period * (1 - elapsed)
+        return period * max(0.0, 1 - (capacity - count + 1) / previous - elapsed)
+
+
+local_store = LocalBucketStore()
+cache_store = CacheBucketStore()
+
+
+def get_store():
+    """
+    Хранилище корзин из settings.THROTTLE_STORE
+
+    :return: LocalBucketStore или CacheBucketStore
+    """
+    return cache_store if settings.THROTTLE_STORE == 'cache' else local_store
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Базовый класс ограничения частоты по корзине токенов для области throttle_scope представления
+
+    Attributes:
+        kind (str): Вид ограничения, часть ключа частоты в settings.THROTTLE_RATES
+    """
+    kind = None
+
+    def get_ident_key(self, request):
+        """
+        Ключ клиента, по которому считаются запросы
+
+        :param request: Запрос пользователя
+        :return: Ключ или None, если запрос не ограничивается
+        """
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        rate = settings.THROTTLE_RATES.get(f'{scope}.{self.kind}') if scope else None
+        if not rate:
+            return True
+        ident = self.get_ident_key(request)
+        if ident is None:
+            return True
+        capacity, period = parse_rate(rate)
+        self.wait_time = get_store().consume(f'{scope}.{self.kind}:{ident}', capacity, period)
+        return not self.wait_time
+
+    def wait(self):
+        return getattr(self, 'wait_time', None)
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Ограничение частоты запросов аутентифицированного пользователя
+    """
+    kind = 'user'
+
+    def get_ident_key(self, request):
+        return request.user.pk if request.user and request.user.is_authenticated else None
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Ограничение частоты запросов с одного адреса (с учетом NUM_PROXIES из настроек DRF)
+    """
+    kind = 'ip'
+
+    def get_ident_key(self, request):
+        return self.get_ident(request)
@@ -1,18 +1,39 @@
+from django.conf import settings
 from django.urls import path
 
 from .views import *
 
+# под ASGI книгу и список книг отдают асинхронные представления
+if settings.ASYNC_CATALOG_VIEWS:
+    book_view, books_view = AsyncGetBookAPIView.as_view(), AsyncListBooks.as_view()
+else:
+    book_view, books_view = GetBookAPIView.as_view(), ListBooks.as_view()
+
 urlpatterns = [
     # запрос на получение конкретной книги по ID
-    path('book/<int:book_id>', GetBookAPIView.as_view()),
+    path('book/<int:book_id>', book_view),
+    # запрос на получение отзывов на книгу по ID, постранично
+    path('book/<int:book_id>/reviews', ListBookReviews.as_view()),
     # запрос на получение списка книг, с необязательной фильтрацией
-    path('books/', ListBooks.as_view()),
+    path('books/', books_view),
+    # запрос на полнотекстовый поиск книг по названию и описанию, постранично
+    path('books/search', SearchBooks.as_view()),
+    # запрос на получение списка книг, отсортированных по рейтингу, с необязательной фильтрацией
+    path('booksByRating/', GetBooksByRating.as_view()),
     # запрос на добавление книги (только зарегистрированные пользователи)
     path('addBook/', AddBookAPIView.as_view()),
+    # запрос на массовый импорт книг из файла JSON Lines или CSV (только зарегистрированные пользователи)
+    path('importBooks/', ImportBooksAPIView.as_view()),
+    # запрос на потоковую выгрузку каталога книг в NDJSON или CSV (только администраторы)
+    path('exportBooks/', ExportBooksAPIView.as_view()),
     # запрос на написание отзыва о книге (только зарегистрированные пользователи)
     path('writeReview/', WriteReviewAPIView.as_view()),
     # запрос на добавление книги в избранные
     path('favorite/<int:book_id>', AddBookToFavorite.as_view()),
     # запрос на удаление книги из избранных
-    path('removeFavorite/<int:book_id>', RemoveBookFromFavorites.as_view())
+    path('removeFavorite/<int:book_id>', RemoveBookFromFavorites.as_view()),
+    # запрос на получение избранных книг текущего пользователя, постранично
+    path('favorites', ListFavoriteBooks.as_view()),
+    # запрос на пакетное добавление и удаление избранных книг
+    path('favorites/batch', BatchFavoritesAPIView.as_view())
 ]
@@ -1,13 +1,35 @@
 from rest_framework.views import APIView
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework.generics import CreateAPIView, ListAPIView
+from rest_framework.exceptions import APIException, NotFound, Throttled, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.parsers import MultiPartParser
 from rest_framework import status
+from django.shortcuts import get_object_or_404
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.views import View
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils.http import parse_etags
 
 from api.serializers import *
+from api import cache
+from api.db import SerializedWriteMixin
+from api import fastpath
+from api.renderers import ORJSONRenderer
+from api.replicas import read_from_primary
+from api.pagination import BookPagination, BookRatingPagination, BookReviewPagination, BookSearchPagination
+from book_catalog import exporters
+from book_catalog.facets import count_facets
+from book_catalog.importers import FORMATS, BookImporter, check_utf8, read_rows
+from book_catalog.search import BookSearch
 
-from datetime import datetime
+from contextlib import nullcontext
+from datetime import datetime, timezone
+import codecs
 
 
 class RemoveBookFromFavorites(APIView):
@@ -23,10 +45,9 @@ class RemoveBookFromFavorites(APIView):
         """
         if not Book.objects.filter(id=book_id).exists():
             return Response({'error': 'Book does not exist!'}, status=status.HTTP_404_NOT_FOUND)
-        if not User.objects.filter(favorite_books__id=book_id).exists():
+        deleted, _ = User.favorite_books.through.objects.filter(user_id=request.user.id, book_id=book_id).delete()
+        if not deleted:
             return Response({'error': 'This book is not in your favorites!'}, status=status.HTTP_409_CONFLICT)
-        request.user.favorite_books.remove(Book.objects.get(id=book_id))
-        request.user.save()
         return Response({'ok': 'You removed this book from your favorites'})
 
 
@@ -44,77 +65,374 @@ class AddBookToFavorite(APIView):
         """
         if not Book.objects.filter(id=book_id).exists():
             return Response({'error': 'Book does not exist!'}, status=status.HTTP_404_NOT_FOUND)
-        if User.objects.filter(favorite_books__id=book_id).exists():
+        # get_or_create без отдельной проверки: при одновременном добавлении уникальный индекс (user_id, book_id)
+        # не даст создать вторую запись, и второй запрос получит 409, а не ошибку IntegrityError
+        _, created = User.favorite_books.through.objects.get_or_create(user_id=request.user.id, book_id=book_id)
+        if not created:
             return Response({'error': 'You already added this book to your favorites!'}, status=status.HTTP_409_CONFLICT)
-        request.user.favorite_books.add(Book.objects.get(id=book_id))
-        request.user.save()
         return Response({'ok': f'You added book (id={book_id}) to your favorites!'}, status=status.HTTP_200_OK)
 
 
-class AddBookAPIView(CreateAPIView):
+class BatchFavoritesAPIView(APIView):
     """
-    Представление для обработки запроса на добавление книги
+    Представление для пакетного добавления и удаления избранных книг
+    """
+
+    def post(self, request: Request):
+        """
+        Добавляет книги из списка add и удаляет книги из списка remove. Добавление выполняется одним
+        INSERT в промежуточную таблицу избранных (уже избранные книги пропускаются), удаление - одним DELETE.
+        Несуществующие книги из списка add возвращаются в not_found
+
+        :param request: Запрос пользователя
+        :return: Response объект
+        """
+        serializer = FavoritesBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        add, remove = serializer.validated_data['add'], serializer.validated_data['remove']
+        through = User.favorite_books.through
+
+        with transaction.atomic():
+            existing = set(Book.objects.filter(id__in=add).values_list('id', flat=True)) if add else set()
+            through.objects.bulk_create(
+                [through(user_id=request.user.id, book_id=book_id) for book_id in sorted(existing)],
+                ignore_conflicts=True
+            )
+            removed = through.objects.filter(user_id=request.user.id, book_id__in=remove).delete()[0] if remove else 0
+        return Response({
+            'added': sorted(existing),
+            'removed': removed,
+            'not_found': [book_id for book_id in add if book_id not in existing],
+        })
+
+
+class ListFavoriteBooks(ListAPIView):
+    """
+    Представление для постраничного списка избранных книг текущего пользователя
+    """
+    serializer_class = ListBookSerializer
+    pagination_class = BookPagination
+
+    def get_queryset(self):
+        """
+        Избранные книги текущего пользователя. Жанры подгружаются одним дополнительным запросом
+
+        :return: queryset с избранными книгами
+        """
+        return Book.objects.filter(favorited_users=self.request.user).prefetch_related(
+            models.Prefetch('genres', queryset=BookGenre.objects.order_by('id'))
+        )
+
+
+class AddBookAPIView(SerializedWriteMixin, CreateAPIView):
+    """
+    Представление для обработки запроса на добавление книги.
+    Книга и ее жанры сохраняются в одной транзакции с повтором при занятой блокировке SQLite
     """
     serializer_class = CreateBookSerializer
 
 
-class WriteReviewAPIView(CreateAPIView):
+class ImportBooksAPIView(APIView):
     """
-    Представление для обработки запроса на написание отзыва о книге
+    Представление для массового импорта книг из файла JSON Lines или CSV (формат строк описан в book_catalog.importers)
+    """
+    parser_classes = (MultiPartParser,)
+
+    def post(self, request: Request):
+        """
+        Импорт книг из файла в поле file. Формат берется из поля file_format или из расширения файла.
+        Книги добавляются от имени текущего пользователя. Указывать в строках других авторов
+        могут только администраторы
+
+        :param request: Запрос пользователя
+        :return: Response объект с количеством добавленных книг и ошибками
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'You have to upload a file!'}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.data.get('file_format') or ('csv' if upload.name.endswith('.csv') else 'jsonl')
+        if fmt not in FORMATS:
+            return Response({'error': f'Unsupported format, use one of: {", ".join(FORMATS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # пачки сохраняются по мере чтения, поэтому кодировка проверяется до импорта, чтобы ошибка
+        # в конце файла не оставила часть книг добавленными
+        if not check_utf8(upload.chunks()):
+            return Response({'error': 'File must be UTF-8 encoded!'}, status=status.HTTP_400_BAD_REQUEST)
+        upload.seek(0)
+
+        importer = BookImporter(
+            default_author=request.user,
+            chunk_size=settings.BOOK_IMPORT_CHUNK_SIZE,
+            allow_authors=request.user.is_staff
+        )
+        result = importer.run(read_rows(codecs.iterdecode(upload, 'utf-8-sig'), fmt))
+        response_status = status.HTTP_201_CREATED if result.created else status.HTTP_400_BAD_REQUEST
+        return Response(result.as_dict(), status=response_status)
+
+
+class ExportBooksAPIView(APIView):
+    """
+    Представление для потоковой выгрузки каталога книг в NDJSON или CSV (только администраторы)
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request: Request):
+        """
+        Выгрузка каталога. Необязательные параметры:
+
+        - file_format: ndjson (по умолчанию) или csv
+        - since: выгрузить только книги, измененные после этой даты (ISO 8601 или unix timestamp)
+        - since_id: айди последней выгруженной книги. Книги упорядочены по (updated_at, id),
+          поэтому updated_at и id последней строки - водяной знак (since, since_id) для следующей выгрузки.
+          Книги за settings.BOOK_EXPORT_OVERLAP_SECONDS до since выгружаются повторно (см. book_catalog.exporters)
+
+        :param request: Запрос пользователя
+        :return: StreamingHttpResponse объект
+        """
+        fmt = request.query_params.get('file_format', 'ndjson')
+        if fmt not in exporters.FORMATS:
+            return Response({'error': f'Unsupported format, use one of: {", ".join(exporters.FORMATS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        since = request.query_params.get('since')
+        if since is not None:
+            try:
+                since = exporters.parse_since(since)
+            except ValueError:
+                return Response({'error': 'since must be an ISO 8601 datetime or unix timestamp'},
+                                status=status.HTTP_400_BAD_REQUEST)
+        since_id = request.query_params.get('since_id')
+        if since_id is not None:
+            try:
+                since_id = int(since_id)
+            except ValueError:
+                return Response({'error': 'since_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = exporters.export_rows(
+            since, settings.BOOK_EXPORT_CHUNK_SIZE, since_id, overlap=settings.BOOK_EXPORT_OVERLAP_SECONDS
+        )
+        content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(exporters.render(rows, fmt), content_type=f'{content_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="books.{fmt}"'
+        return response
+
+
+class WriteReviewAPIView(SerializedWriteMixin, CreateAPIView):
+    """
+    Представление для обработки запроса на написание отзыва о книге.
+    Отзыв сохраняется с повтором при занятой блокировке SQLite
     """
     serializer_class = CreateBookReviewSerializer
 
 
-class GetBookAPIView(APIView):
+class SparseFieldsMixin:
+    """
+    Миксин для выбора полей ответа параметром fields и раскрытия связей параметром expand
+    (например, ?fields=id,name,author&expand=author). Значения перечисляются через запятую
+    и проверяются по полям serializer_class. Непереданные поля не попадают в ответ,
+    а их столбцы и связанные данные не загружаются из БД
+    """
+
+    def get_sparse_params(self):
+        """
+        Получить поля ответа и раскрываемые поля из параметров запроса
+
+        :return: Словарь с fields (None - все поля) и expand
+        """
+        if not hasattr(self, '_sparse_params'):
+            self._sparse_params = self.serializer_class.get_sparse_params(self.request.query_params)
+        return self._sparse_params
+
+    def is_sparse(self):
+        """
+        Отличается ли ответ от ответа по умолчанию (заданы fields или expand)
+
+        :return: Заданы ли fields или expand
+        """
+        params = self.get_sparse_params()
+        return params['fields'] is not None or bool(params['expand'])
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, **self.get_sparse_params(), **kwargs)
+
+
+class GetBookAPIView(SparseFieldsMixin, APIView):
     """
     Представление для обработки запроса на получение книги по ID
     """
+    read_from_replica = True
     permission_classes = (AllowAny,)
+    serializer_class = BookSerializer
 
     def get(self, request, book_id):
-        return Response(BookSerializer(Book.objects.get(id=book_id), context={'request': request}).data)
+        """
+        Получение книги по ID. Часть ответа, которая не зависит от пользователя, берется из кэша
+        (сбрасывается сигналами из api.signals), а поверх нее добавляются is_favorite и me.
+        При попадании в кэш делается не больше одного запроса к БД - проверка избранности книги.
+        С параметром fields из кэша отдаются только запрошенные поля, а избранность проверяется,
+        только если она запрошена. Ответы с expand собираются из БД и не кэшируются
+
+        :param request: Запрос пользователя
+        :param book_id: Айди книги
+        :return: Response объект
+        """
+        params = self.get_sparse_params()
+        data = None if params['expand'] else cache.get_book_detail(book_id)
+        if data is None:
+            if self.is_sparse():
+                return Response(self.get_book_data(request, book_id))
+            # запись общего кэша читается из основной БД (см. api.replicas)
+            with read_from_primary():
+                data = self.get_book_data(request, book_id)
+            user_fields = BookSerializer.Meta.user_fields
+            cache.set_book_detail(book_id, {key: value for key, value in data.items() if key not in user_fields})
+            return Response(data)
+        fields = params['fields'] or BookSerializer.Meta.fields
+        data = {key: value for key, value in data.items() if key in fields}
+        if 'is_favorite' in fields:
+            data['is_favorite'] = request.user.is_authenticated and request.user.has_favorite_book(book_id)
+        if 'me' in fields:
+            data['me'] = request.user.id
+        return Response(data)
+
+    def get_book_data(self, request, book_id):
+        """
+        Сериализовать книгу из БД. Избранность книги для текущего пользователя вычисляется
+        подзапросом EXISTS в том же запросе, что и сама книга, а из отзывов подгружаются только последние
 
+        :param request: Запрос пользователя
+        :param book_id: Айди книги
+        :return: Сериализированные данные книги
+        """
+        params = self.get_sparse_params()
+        book = get_object_or_404(self.get_book_queryset(request.user, **params), id=book_id)
+        return BookSerializer(book, context={'request': request}, **params).data
+
+    @staticmethod
+    def get_book_queryset(user, fields=None, expand=()):
+        """
+        queryset книги со всеми данными для BookSerializer, после загрузки сериализация не обращается к БД.
+        Отзывы и избранность загружаются, только если они есть среди полей ответа
+
+        :param user: Текущий пользователь
+        :param fields: Поля ответа (None - все поля)
+        :param expand: Раскрываемые поля
+        :return: queryset книг
+        """
+        names = BookSerializer.Meta.fields if fields is None else fields
+        qs = BookSerializer.setup_queryset(Book.objects.all(), fields, expand)
+        if 'reviews' in names:
+            latest_reviews = BookReview.objects.order_by('-created_at', '-id')[:settings.BOOK_DETAIL_REVIEWS]
+            qs = qs.prefetch_related(models.Prefetch('book_reviews', queryset=latest_reviews, to_attr='_reviews'))
+        if 'is_favorite' in names and user.is_authenticated:
+            qs = qs.annotate(_is_favorite=models.Exists(
+                User.favorite_books.through.objects.filter(book_id=models.OuterRef('pk'), user_id=user.id)
+            ))
+        return qs
 
-class ListBooks(ListAPIView):
+
+class ListBookReviews(ListAPIView):
     """
-    Представление для обработки запроса на список книг. Принимает необязательные параметры фильтрации
+    Представление для обработки запроса на постраничный список отзывов на книгу, от новых к старым
     """
-    serializer_class = ListBookSerializer
+    read_from_replica = True
+    serializer_class = BookReviewSerializer
     permission_classes = (AllowAny,)
+    pagination_class = BookReviewPagination
 
     def get_queryset(self):
         """
-        Возвращение queryset для обработки.
+        Отзывы на книгу из адреса запроса. Выборка идет по индексу (book_id, created_at, id)
 
-        Необязательные параметры в теле запроса и в адресе запроса перечислены ниже:
+        :return: queryset с отзывами на книгу
+        """
+        book_id = self.kwargs['book_id']
+        if not Book.objects.filter(id=book_id).exists():
+            raise NotFound('Book does not exist!')
+        return BookReview.objects.filter(book_id=book_id)
 
-        - author_ids: Получить книги по айди этих авторов
-        - genre_ids: Получить книги по айди этих жанров
-        - from_date: Получить книги опубликованные после этой даты (unix timestamp)
-        - to_date: Получить книги опубликованные до этой даты (unix timestamp)
 
-        :return: queryset с отфильтрованными книгами по указанным фильтрам
+class BookFilterMixin:
+    """
+    Миксин для фильтрации списка книг по необязательным параметрам из адреса или тела запроса.
+
+    Необязательные параметры перечислены ниже:
+
+    - author_ids: Получить книги по айди этих авторов
+    - genre_ids: Получить книги по айди этих жанров
+    - from_date: Получить книги опубликованные после этой даты (unix timestamp)
+    - to_date: Получить книги опубликованные до этой даты (unix timestamp)
+    """
+
+    def get_filter_ids(self, name):
+        """
+        Получить список айди из параметра запроса
+
+        :param name: Название параметра
+        :return: Отсортированный список айди без повторов (пустой, если параметр не передан)
         """
-        authors = self.request.query_params.getlist('author_ids') or self.request.data.get('author_ids')
-        genres = self.request.query_params.getlist('genre_ids') or self.request.data.get('genre_ids')
+        values = self.request.query_params.getlist(name) or self.request.data.get(name)
+        if not values:
+            return []
+        if not isinstance(values, list):
+            values = [values]
         try:
-            from_date = datetime.utcfromtimestamp(
-                int(self.request.query_params.getlist('from_date') or self.request.data.get('from_date'))
-            )
-        except TypeError:
-            from_date = None
+            return sorted({int(value) for value in values})
+        except (TypeError, ValueError):
+            raise ValidationError({name: 'Expected a list of integer ids.'})
+
+    def get_filter_date(self, name):
+        """
+        Получить дату из параметра запроса в формате unix timestamp
+
+        :param name: Название параметра
+        :return: Дата или None, если параметр не передан
+        """
+        value = self.request.query_params.get(name) or self.request.data.get(name)
+        if value is None:
+            return None
         try:
-            to_date = datetime.utcfromtimestamp(
-                int(self.request.query_params.getlist('to_date') or self.request.data.get('to_date'))
-            )
-        except TypeError:
-            to_date = None
+            return datetime.fromtimestamp(int(value), tz=timezone.utc)
+        except (TypeError, ValueError, OverflowError, OSError):
+            raise ValidationError({name: 'Expected a unix timestamp.'})
+
+    def get_filters(self):
+        """
+        Получить канонизированный набор фильтров: одинаковые по смыслу запросы дают одинаковый набор,
+        поэтому он же используется как часть ключа кэша
+
+        :return: Словарь с фильтрами
+        """
+        if not hasattr(self, '_filters'):
+            self._filters = {
+                'author_ids': self.get_filter_ids('author_ids'),
+                'genre_ids': self.get_filter_ids('genre_ids'),
+                'from_date': self.get_filter_date('from_date'),
+                'to_date': self.get_filter_date('to_date'),
+            }
+        return self._filters
+
+    def filter_books(self, qs):
+        """
+        Отфильтровать queryset книг по параметрам запроса
+
+        :param qs: queryset книг
+        :return: queryset с отфильтрованными книгами по указанным фильтрам
+        """
+        filters = self.get_filters()
+        authors = filters['author_ids']
+        genres = filters['genre_ids']
+        from_date = filters['from_date']
+        to_date = filters['to_date']
 
-        qs = Book.objects.all()
         if authors:
             qs = qs.filter(author__in=authors)
         if genres:
-            qs = qs.filter(genres__in=genres).distinct()
+            # EXISTS по промежуточной таблице вместо JOIN + DISTINCT: книга проверяется
+            # по уникальному индексу (book_id, bookgenre_id) и не дублируется в выборке
+            qs = qs.filter(models.Exists(
+                Book.genres.through.objects.filter(book_id=models.OuterRef('pk'), bookgenre_id__in=genres)
+            ))
         if from_date:
             qs = qs.filter(created_at__gte=from_date)
         if to_date:
@@ -122,17 +440,336 @@ class ListBooks(ListAPIView):
         return qs
 
 
-class GetBooksByRating(ListAPIView):
+class CachedBookListMixin(SparseFieldsMixin, BookFilterMixin):
+    """
+    Миксин для кэширования страниц списка книг.
+
+    Ключ кэша строится из канонизированных фильтров, курсора и размера страницы, а также поколения каталога,
+    которое увеличивается после каждой записи в каталог (см. api.signals). Поэтому между записями
+    повторные запросы с теми же фильтрами не доходят до БД. Тот же ключ служит ETag: если клиент
+    присылает его в If-None-Match, ответ 304 отдается без сериализации.
+
+    С параметром facets=1 в ответ добавляются фасетные счетчики по жанрам и авторам для текущих фильтров.
+    Они кэшируются отдельно от страниц на короткое время, поэтому при листании списка не пересчитываются
     """
-    Представление для обработки запроса на получение списка книг, отсортированных по рейтингу
+
+    def get_cache_params(self):
+        """
+        Параметры запроса, от которых зависит страница списка
+
+        :return: Словарь параметров
+        """
+        return {
+            'view': type(self).__name__,
+            'url': self.request.build_absolute_uri(self.request.path),
+            'filters': self.get_filters(),
+            'cursor': self.request.query_params.get(self.paginator.cursor_query_param),
+            'page_size': self.paginator.get_page_size(self.request),
+            'facets': self.wants_facets(),
+            **self.get_sparse_params(),
+        }
+
+    def wants_facets(self):
+        """
+        Запрошены ли фасетные счетчики (параметр facets)
+
+        :return: Нужно ли добавить фасеты в ответ
+        """
+        return self.request.query_params.get('facets', '').lower() in ('1', 'true')
+
+    def get_facets(self):
+        """
+        Получить фасетные счетчики для текущих фильтров из кэша или посчитать их
+
+        :return: Словарь с фасетами genres и authors
+        """
+        key = cache.book_facets_key(cache.get_catalog_generation(), self.get_filters())
+        facets = cache.get_book_facets(key)
+        if facets is None:
+            with read_from_primary():
+                facets = count_facets(self.filter_books(Book.objects.all()), settings.BOOK_FACETS_LIMIT)
+            cache.set_book_facets(key, facets)
+        return facets
+
+    def is_not_modified(self, etag):
+        """
+        Проверить, есть ли у клиента актуальная версия страницы (заголовок If-None-Match)
+
+        :param etag: ETag текущей версии страницы
+        :return: Совпадает ли версия клиента с текущей
+        """
+        if_none_match = parse_etags(self.request.headers.get('If-None-Match', ''))
+        return etag in if_none_match or '*' in if_none_match
+
+    def get_book_list_queryset(self):
+        """
+        Отфильтрованный queryset книг, в котором загружаются только столбцы и связи для полей ответа.
+        Поля сортировки загружаются всегда, потому что из них строится курсор следующей страницы
+
+        :return: queryset книг
+        """
+        ordering = [field.lstrip('-') for field in self.paginator.ordering]
+        return self.serializer_class.setup_queryset(
+            self.filter_books(Book.objects.all()), **self.get_sparse_params(), columns=ordering
+        )
+
+    def use_fast_path(self):
+        """
+        Можно ли собрать страницу быстрым путем: он включен и ответ не отличается от ответа по умолчанию
+
+        :return: Использовать ли api.fastpath
+        """
+        return settings.BOOK_LIST_FAST_PATH and not self.is_sparse()
+
+    def get_renderers(self):
+        """
+        С settings.BOOK_LIST_FAST_PATH JSON рендерится через orjson (см. api.renderers)
+
+        :return: Рендереры представления
+        """
+        renderers = super().get_renderers()
+        if not settings.BOOK_LIST_FAST_PATH:
+            return renderers
+        return [ORJSONRenderer() if type(renderer) is JSONRenderer else renderer for renderer in renderers]
+
+    def get_page_data(self, request, *args, **kwargs):
+        """
+        Сформировать страницу списка. С settings.BOOK_LIST_FAST_PATH книги страницы выбираются через .values()
+        и собираются в словари без ListBookSerializer (см. api.fastpath), иначе страница сериализуется как обычно
+
+        :param request: Запрос пользователя
+        :return: Данные страницы
+        """
+        if not self.use_fast_path():
+            return super().list(request, *args, **kwargs).data
+        ordering = [field.lstrip('-') for field in self.paginator.ordering]
+        queryset = fastpath.book_list_values(self.filter_queryset(self.get_queryset()), ordering)
+        rows = self.paginate_queryset(queryset)
+        return self.get_paginated_response(fastpath.serialize_book_list(rows)).data
+
+    def list(self, request, *args, **kwargs):
+        """
+        Отдать страницу списка из кэша или сформировать и закэшировать ее
+
+        :param request: Запрос пользователя
+        :return: Response объект
+        """
+        key = cache.book_list_key(cache.get_catalog_generation(), self.get_cache_params())
+        etag = cache.book_list_etag(key)
+        if self.is_not_modified(etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        data = cache.get_book_list(key)
+        if data is None:
+            # страница попадает в общий кэш под ETag текущего поколения, поэтому читается из основной БД
+            with read_from_primary():
+                data = self.get_page_data(request, *args, **kwargs)
+            cache.set_book_list(key, data)
+        if self.wants_facets():
+            data = {**data, 'facets': self.get_facets()}
+        return Response(data, headers={'ETag': etag})
+
+
+class ListBooks(CachedBookListMixin, ListAPIView):
+    """
+    Представление для обработки запроса на список книг. Принимает необязательные параметры фильтрации
+    """
+    read_from_replica = True
+    throttle_scope = 'books'
+    serializer_class = ListBookSerializer
+    permission_classes = (AllowAny,)
+    pagination_class = BookPagination
+
+    def get_queryset(self):
+        """
+        Возвращение queryset для обработки, отфильтрованного по параметрам из BookFilterMixin
+
+        :return: queryset с отфильтрованными книгами по указанным фильтрам
+        """
+        # средний рейтинг хранится в самой книге, а жанры подгружаются одним дополнительным запросом,
+        # чтобы количество запросов к БД не зависело от количества книг в ответе
+        return self.get_book_list_queryset()
+
+
+class GetBooksByRating(CachedBookListMixin, ListAPIView):
     """
+    Представление для обработки запроса на получение списка книг, отсортированных по рейтингу.
+    Принимает те же необязательные параметры фильтрации, что и ListBooks
+    """
+    read_from_replica = True
+    throttle_scope = 'books'
     permission_classes = (AllowAny,)
     serializer_class = ListBookSerializer
+    pagination_class = BookRatingPagination
 
     def get_queryset(self):
         """
-        Отсортировать книги запросом к БД
+        Отсортировать книги запросом к БД. Сортировка (и курсор пагинации) идет по паре (rating_avg, id),
+        где rating_avg хранится в книге, а у книг без отзывов равен 0. Без фильтров запрос
+        обслуживается индексом book_rating_idx
 
         :return: queryset с отфильтрованными данными
         """
-        return Book.objects.all().annotate(_avg_rating=models.Avg('book_reviews__rating')).order_by('-_avg_rating')
+        return self.get_book_list_queryset()
+
+
+class SearchBooks(ListAPIView):
+    """
+    Представление для полнотекстового поиска книг по названию и описанию.
+    Параметр q - строка запроса, книга должна содержать все слова запроса.
+    Результаты отсортированы по релевантности и разбиты на страницы параметром page
+    """
+    read_from_replica = True
+    permission_classes = (AllowAny,)
+    serializer_class = SearchBookSerializer
+    pagination_class = BookSearchPagination
+
+    def get_queryset(self):
+        """
+        Возвращение результатов поиска. Книги загружаются только для текущей страницы
+
+        :return: BookSearch с результатами поиска
+        """
+        query = self.request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': 'Search query is required'})
+        return BookSearch(query, Book.objects.prefetch_related(
+            models.Prefetch('genres', queryset=BookGenre.objects.order_by('id'))
+        ))
+
+
+class AsyncCatalogView(View):
+    """
+    Базовое асинхронное представление для чтения каталога под ASGI.
+
+    Запросы к БД идут через асинхронный ORM, поэтому, пока запрос ждет БД или кэш, воркер ASGI
+    обслуживает другие запросы. Ответы рендерятся тем же JSONRenderer, что и в DRF, а исключения DRF
+    (NotFound, ValidationError) превращаются в такие же ответы, как у синхронных представлений
+    """
+    renderer = JSONRenderer()
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except Http404:
+            return self.render({'detail': 'Not found.'}, status_code=status.HTTP_404_NOT_FOUND)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            headers = {'Retry-After': str(exc.wait)} if isinstance(exc, Throttled) and exc.wait else None
+            return self.render(detail, status_code=exc.status_code, headers=headers)
+
+    def render(self, data, status_code=status.HTTP_200_OK, headers=None):
+        """
+        Отрендерить данные в JSON-ответ
+
+        :param data: Данные ответа
+        :param status_code: Код ответа
+        :param headers: Дополнительные заголовки
+        :return: HttpResponse объект
+        """
+        content = self.renderer.render(data) if data is not None else b''
+        return HttpResponse(content, status=status_code, headers=headers, content_type=self.renderer.media_type)
+
+    async def is_authenticated(self, request):
+        """
+        Загрузить пользователя сессии вне event loop и проверить, аутентифицирован ли он.
+        После этого request.user можно использовать в асинхронном коде без запросов к БД
+
+        :param request: Запрос пользователя
+        :return: Аутентифицирован ли пользователь
+        """
+        return await sync_to_async(lambda: request.user.is_authenticated)()
+
+
+class AsyncGetBookAPIView(AsyncCatalogView):
+    """
+    Асинхронная версия GetBookAPIView: тот же кэш и тот же ответ
+    """
+    read_from_replica = True
+
+    async def get(self, request, book_id):
+        """
+        Получение книги по ID
+
+        :param request: Запрос пользователя
+        :param book_id: Айди книги
+        :return: HttpResponse объект
+        """
+        is_authenticated = await self.is_authenticated(request)
+        params = BookSerializer.get_sparse_params(request.GET)
+        sparse = params['fields'] is not None or bool(params['expand'])
+        data = None if params['expand'] else await sync_to_async(cache.get_book_detail)(book_id)
+        if data is None:
+            try:
+                with nullcontext() if sparse else read_from_primary():
+                    book = await GetBookAPIView.get_book_queryset(request.user, **params).aget(id=book_id)
+            except Book.DoesNotExist:
+                raise Http404
+            # все связанные данные уже загружены, сериализация не обращается к БД
+            data = BookSerializer(book, context={'request': request}, **params).data
+            if not sparse:
+                user_fields = BookSerializer.Meta.user_fields
+                await sync_to_async(cache.set_book_detail)(
+                    book_id, {key: value for key, value in data.items() if key not in user_fields}
+                )
+            return self.render(data)
+        fields = params['fields'] or BookSerializer.Meta.fields
+        data = {key: value for key, value in data.items() if key in fields}
+        if 'is_favorite' in fields:
+            data['is_favorite'] = is_authenticated and await User.favorite_books.through.objects.filter(
+                user_id=request.user.id, book_id=book_id
+            ).aexists()
+        if 'me' in fields:
+            data['me'] = request.user.id
+        return self.render(data)
+
+
+class AsyncListBooks(AsyncCatalogView):
+    """
+    Асинхронная версия ListBooks. Фильтры, пагинация и кэш берутся из ListBooks,
+    поэтому обе версии отдают одинаковые ответы и используют общий кэш
+    """
+    read_from_replica = True
+    list_view_class = ListBooks
+
+    async def get(self, request):
+        """
+        Получение страницы списка книг
+
+        :param request: Запрос пользователя
+        :return: HttpResponse объект
+        """
+        view = self.list_view_class()
+        view.setup(request)
+        view.request = view.initialize_request(request)
+        view.format_kwarg = None
+        # те же ограничения частоты, что и у ListBooks. Пользователь сессии загружается вне event loop
+        await sync_to_async(view.check_throttles)(view.request)
+
+        generation = await sync_to_async(cache.get_catalog_generation)()
+        key = cache.book_list_key(generation, view.get_cache_params())
+        etag = cache.book_list_etag(key)
+        if view.is_not_modified(etag):
+            return self.render(None, status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        data = await sync_to_async(cache.get_book_list)(key)
+        if data is None:
+            paginator = view.paginator
+            queryset = view.get_queryset()
+            fast_path = view.use_fast_path()
+            if fast_path:
+                ordering = [field.lstrip('-') for field in paginator.ordering]
+                queryset = fastpath.book_list_values(queryset, ordering)
+            # как и в ListBooks, страница для общего кэша читается из основной БД
+            with read_from_primary():
+                rows = [book async for book in paginator.get_page_queryset(queryset, view.request)]
+                page = paginator.get_page(rows)
+                if fast_path:
+                    results = await sync_to_async(fastpath.serialize_book_list)(page)
+                else:
+                    results = view.get_serializer(page, many=True).data
+            data = paginator.get_paginated_response(results).data
+            await sync_to_async(cache.set_book_list)(key, data)
+        if view.wants_facets():
+            data = {**data, 'facets': await sync_to_async(view.get_facets)()}
+        return self.render(data, headers={'ETag': etag})
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BookCatalogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'book_catalog'
+
+    def ready(self):
+        # подключение обработчиков сигналов для обновления updated_at книг
+        from . import receivers  # noqa
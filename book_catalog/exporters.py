@@ -0,0 +1,133 @@
+"""
+Потоковая выгрузка каталога книг в NDJSON или CSV.
+
+Книги читаются из БД пачками через .iterator(chunk_size=...) (жанры подгружаются одним запросом на пачку),
+а ответ формируется построчно, поэтому память не зависит от размера каталога.
+Книги упорядочены по (updated_at, id) и читаются по индексу book_updated_idx: пара (updated_at, id) последней
+строки служит водяным знаком для следующей инкрементальной выгрузки (параметры since и since_id), поэтому
+книги с одинаковым updated_at не пропускаются и не повторяются. Удаленные книги в инкрементальную выгрузку
+не попадают. Изменения жанров и имен авторов обновляют updated_at книг (см. book_catalog.receivers).
+
+updated_at ставится при сохранении, а не при коммите: транзакция, которая закоммитится после выгрузки,
+может оставить книгу с updated_at раньше водяного знака. Поэтому с параметром overlap инкрементальная выгрузка
+заново читает книги за overlap секунд до водяного знака (since_id при этом не нужен). Такие книги выгружаются
+повторно, и получатель должен обновлять книги по id.
+"""
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator
+import csv
+import json
+
+from .models import Book, BookGenre
+
+FORMATS = ('ndjson', 'csv')
+CSV_FIELDS = ['id', 'name', 'description', 'author', 'genres', 'avg_rating', 'review_count', 'created_at', 'updated_at']
+
+
+def parse_since(value):
+    """
+    Разобрать водяной знак инкрементальной выгрузки
+
+    :param value: Дата в формате ISO 8601 (например, updated_at последней выгруженной книги) или unix timestamp
+    :return: Дата с часовым поясом
+    :raises ValueError: Если значение не является датой
+    """
+    try:
+        return datetime.fromtimestamp(float(value), tz=timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        pass
+    since = parse_datetime(value)
+    if since is None:
+        raise ValueError(f'Invalid datetime: {value}')
+    return since if timezone.is_aware(since) else timezone.make_aware(since, timezone.utc)
+
+
+def export_rows(since=None, chunk_size=2000, since_id=None, overlap=0) -> Iterator[dict]:
+    """
+    Получить книги каталога для выгрузки
+
+    :param since: Выгрузить только книги, измененные после этой даты
+    :param chunk_size: Количество книг, загружаемых из БД за раз
+    :param since_id: Айди последней выгруженной книги с updated_at равным since. Без него выгружаются
+        только книги, измененные строго позже since
+    :param overlap: Сколько секунд до since перечитать, чтобы не потерять книги из транзакций,
+        закоммиченных после предыдущей выгрузки
+    :return: Итератор словарей с данными книг
+    """
+    qs = Book.objects.select_related('author').only(
+        'id', 'name', 'description', 'author__username', 'review_count', 'rating_sum', 'created_at', 'updated_at'
+    ).prefetch_related(
+        Prefetch('genres', queryset=BookGenre.objects.only('id', 'name').order_by('id'))
+    ).order_by('updated_at', 'id')
+    if since is not None:
+        if overlap:
+            qs = qs.filter(updated_at__gte=since - timedelta(seconds=overlap))
+        elif since_id is None:
+            qs = qs.filter(updated_at__gt=since)
+        else:
+            # условие updated_at >= since отдельно от OR, чтобы индекс использовался для поиска диапазона
+            qs = qs.filter(Q(updated_at__gt=since) | Q(id__gt=since_id), updated_at__gte=since)
+    for book in qs.iterator(chunk_size=chunk_size):
+        genres = book.genres.all()
+        yield {
+            'id': book.id,
+            'name': book.name,
+            'description': book.description,
+            'author_id': book.author_id,
+            'author': book.author.username,
+            'genre_ids': [genre.id for genre in genres],
+            'genres': [genre.name for genre in genres],
+            'avg_rating': book.avg_rating,
+            'review_count': book.review_count,
+            'created_at': book.created_at.isoformat(),
+            'updated_at': book.updated_at.isoformat(),
+        }
+
+
+def render_ndjson(rows: Iterable[dict]) -> Iterator[str]:
+    """
+    Построчно отрендерить книги в NDJSON
+
+    :param rows: Данные книг из export_rows
+    :return: Итератор строк
+    """
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    """
+    Псевдо-файл для csv.writer, который возвращает записанную строку вместо записи в буфер
+    """
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows: Iterable[dict]) -> Iterator[str]:
+    """
+    Построчно отрендерить книги в CSV. Колонки совместимы с импортом (manage.py import_books):
+    author - username автора, genres - названия жанров через ";"
+
+    :param rows: Данные книг из export_rows
+    :return: Итератор строк
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for row in rows:
+        row = {**row, 'genres': ';'.join(row['genres'])}
+        yield writer.writerow([row[field] for field in CSV_FIELDS])
+
+
+def render(rows: Iterable[dict], fmt) -> Iterator[str]:
+    """
+    Отрендерить книги в выбранном формате
+
+    :param rows: Данные книг из export_rows
+    :param fmt: Формат (ndjson или csv)
+    :return: Итератор строк
+    """
+    return render_csv(rows) if fmt == 'csv' else render_ndjson(rows)
@@ -0,0 +1,35 @@
+"""
+Фасетные счетчики каталога: сколько книг из текущей выборки относится к каждому жанру и каждому автору.
+
+Счетчики считаются агрегирующими запросами GROUP BY в БД, без загрузки книг: жанры группируются
+по промежуточной таблице книга-жанр, авторы - по author_id таблицы книг. Если выборка отфильтрована,
+книги ограничиваются подзапросом с теми же условиями, что и у списка книг.
+"""
+from django.db import models
+
+from .models import Book
+
+
+def count_facets(books, limit=100):
+    """
+    Посчитать количество книг выборки по жанрам и по авторам
+
+    :param books: queryset книг (например, отфильтрованный список)
+    :param limit: Максимальное количество значений в каждом фасете
+    :return: Словарь с фасетами genres и authors: списки {id, name, count} по убыванию количества книг
+    """
+    books = books.order_by()
+    book_genres = Book.genres.through.objects.all()
+    if books.query.has_filters():
+        book_genres = book_genres.filter(book_id__in=books.values('pk'))
+
+    genres = book_genres.values(
+        'bookgenre_id', 'bookgenre__name'
+    ).annotate(count=models.Count('book_id')).order_by('-count', 'bookgenre_id')[:limit]
+    authors = books.values(
+        'author_id', 'author__username'
+    ).annotate(count=models.Count('id')).order_by('-count', 'author_id')[:limit]
+    return {
+        'genres': [{'id': row['bookgenre_id'], 'name': row['bookgenre__name'], 'count': row['count']} for row in genres],
+        'authors': [{'id': row['author_id'], 'name': row['author__username'], 'count': row['count']} for row in authors],
+    }
@@ -0,0 +1,238 @@
+"""
+Массовый импорт книг из JSON Lines или CSV.
+
+Строки читаются потоком и обрабатываются пачками: каждая пачка валидируется, авторы и жанры
+ищутся по имени через словари в памяти (в БД запрашиваются только новые имена), а книги и их связи
+с жанрами добавляются через bulk_create. Поэтому импорт не держит в памяти весь файл и делает
+несколько запросов на пачку, а не на каждую книгу.
+
+Формат строки: name, description, author (username автора, необязательно), genres (список названий;
+в CSV - названия через ";").
+
+Каждая пачка сохраняется отдельной транзакцией через api.db.run_write, поэтому ошибка в середине файла
+не отменяет уже добавленные пачки. Кодировку файла нужно проверить до импорта (check_utf8).
+"""
+from django.db import transaction
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import codecs
+import csv
+import json
+
+from api.db import run_write
+
+from users.models import User
+
+from .models import Book, BookGenre
+from .signals import books_imported
+
+FORMATS = ('jsonl', 'csv')
+
+
+class ImportResult:
+    """
+    Результат импорта
+
+    Attributes:
+        created (int): Количество добавленных книг
+        failed (int): Количество строк с ошибками
+        errors (List[dict]): Ошибки первых строк (номер строки и описание), не больше max_errors
+    """
+
+    def __init__(self, max_errors=100):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def add_error(self, line, error):
+        """
+        Учесть строку с ошибкой
+
+        :param line: Номер строки
+        :param error: Описание ошибки
+        """
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'error': error})
+
+    def as_dict(self):
+        return {'created': self.created, 'failed': self.failed, 'errors': self.errors}
+
+
+def check_utf8(chunks: Iterable[bytes]) -> bool:
+    """
+    Проверить, что файл целиком в UTF-8, не загружая его в память
+
+    :param chunks: Части файла
+    :return: Корректна ли кодировка
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        for chunk in chunks:
+            decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def read_rows(lines: Iterable[str], fmt) -> Iterator[Tuple[int, object]]:
+    """
+    Прочитать строки файла импорта
+
+    :param lines: Строки файла
+    :param fmt: Формат файла (jsonl или csv)
+    :return: Итератор пар (номер строки, словарь с данными или текст ошибки)
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            genres = row.get('genres') or ''
+            row['genres'] = [name for name in genres.split(';') if name.strip()]
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, f'Invalid JSON: {e}'
+
+
+def validate_row(row) -> Optional[str]:
+    """
+    Проверить строку импорта
+
+    :param row: Данные строки
+    :return: Текст ошибки или None, если строка корректна
+    """
+    if not isinstance(row, dict):
+        return row if isinstance(row, str) else 'Expected an object'
+    name = row.get('name')
+    description = row.get('description')
+    if not isinstance(name, str) or not name.strip() or len(name) > Book._meta.get_field('name').max_length:
+        return 'Field "name" is required and must be at most 200 characters'
+    if not isinstance(description, str) or not description.strip() \
+            or len(description) > Book._meta.get_field('description').max_length:
+        return 'Field "description" is required and must be at most 5000 characters'
+    if not isinstance(row.get('author'), (str, type(None))):
+        return 'Field "author" must be a username'
+    genres = row.get('genres') or []
+    if not isinstance(genres, list) or not all(isinstance(genre, str) and genre.strip() for genre in genres):
+        return 'Field "genres" must be a list of genre names'
+    return None
+
+
+class BookImporter:
+    """
+    Импорт книг пачками с поиском авторов и жанров по имени через словари в памяти
+
+    Attributes:
+        default_author (User): Автор для строк без поля author
+        allow_authors (bool): Можно ли указывать в строках других авторов. Если нельзя, строки
+            с чужим author отклоняются, а книги добавляются от имени default_author
+        chunk_size (int): Размер пачки
+        authors (Dict[str, int]): Найденные айди авторов по username
+        genres (Dict[str, int]): Найденные или созданные айди жанров по названию
+    """
+
+    def __init__(self, default_author=None, chunk_size=1000, max_errors=100, allow_authors=True):
+        self.default_author = default_author
+        self.allow_authors = allow_authors
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.authors: Dict[str, int] = {}
+        self.genres: Dict[str, int] = {}
+
+    def run(self, rows: Iterable[Tuple[int, object]]) -> ImportResult:
+        """
+        Импортировать книги
+
+        :param rows: Пары (номер строки, данные строки), например из read_rows
+        :return: Результат импорта
+        """
+        result = ImportResult(self.max_errors)
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return result
+            self.import_chunk(chunk, result)
+
+    def import_chunk(self, chunk, result):
+        """
+        Провалидировать и добавить пачку книг в одной транзакции
+
+        :param chunk: Пары (номер строки, данные строки)
+        :param result: Результат импорта, в который добавляются счетчики и ошибки
+        """
+        valid = []
+        for line, row in chunk:
+            error = validate_row(row)
+            if not error and not self.allow_authors and row.get('author') \
+                    and row['author'] != getattr(self.default_author, 'username', None):
+                error = 'You cannot import books of other authors'
+            if error:
+                result.add_error(line, error)
+            else:
+                valid.append((line, row))
+
+        self.resolve_authors({row['author'] for _, row in valid if row.get('author')})
+
+        books, book_genres = [], []
+        for line, row in valid:
+            username = row.get('author')
+            author_id = self.authors.get(username) if username else getattr(self.default_author, 'id', None)
+            if author_id is None:
+                result.add_error(line, f'Unknown author "{username}"' if username else 'Field "author" is required')
+                continue
+            books.append({'name': row['name'].strip(), 'description': row['description'], 'author_id': author_id})
+            book_genres.append({name.strip() for name in row.get('genres') or []})
+        if not books:
+            return
+
+        def write():
+            # run_write может повторить транзакцию, поэтому книги и словарь жанров обновляются только после коммита
+            genres = {**self.genres, **self.resolve_genres(set().union(*book_genres))}
+            created = Book.objects.bulk_create([Book(**fields) for fields in books])
+            through = Book.genres.through
+            through.objects.bulk_create([
+                through(book_id=book.id, bookgenre_id=genres[name])
+                for book, names in zip(created, book_genres)
+                for name in names
+            ])
+            book_ids = [book.id for book in created]
+            transaction.on_commit(lambda: books_imported.send(sender=Book, book_ids=book_ids))
+            return genres
+
+        self.genres = run_write(write)
+        result.created += len(books)
+
+    def resolve_authors(self, usernames):
+        """
+        Найти айди авторов, которых еще нет в словаре, одним запросом
+
+        :param usernames: username авторов пачки
+        """
+        missing = [username for username in usernames if username not in self.authors]
+        if missing:
+            self.authors.update(User.objects.filter(username__in=missing).values_list('username', 'id'))
+
+    def resolve_genres(self, names) -> Dict[str, int]:
+        """
+        Найти айди жанров, которых еще нет в словаре, одним запросом и создать недостающие жанры
+
+        :param names: Названия жанров пачки
+        :return: Айди найденных и созданных жанров по названию
+        """
+        missing = {name for name in names if name not in self.genres}
+        if not missing:
+            return {}
+        genres = {}
+        for name, genre_id in BookGenre.objects.filter(name__in=missing).order_by('id').values_list('name', 'id'):
+            genres.setdefault(name, genre_id)
+        created = BookGenre.objects.bulk_create([BookGenre(name=name) for name in missing if name not in genres])
+        genres.update((genre.name, genre.id) for genre in created)
+        return genres
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from book_catalog.exporters import FORMATS, export_rows, parse_since, render
+
+
+class Command(BaseCommand):
+    """
+    Команда для потоковой выгрузки каталога книг в NDJSON или CSV
+    """
+    help = 'Stream the book catalog as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='ndjson', help='Output format')
+        parser.add_argument('--since', help='Export only books updated after this ISO 8601 datetime or unix timestamp')
+        parser.add_argument('--since-id', type=int, help='Id of the last exported book updated at --since')
+        parser.add_argument(
+            '--overlap', type=float, default=settings.BOOK_EXPORT_OVERLAP_SECONDS,
+            help='Seconds before --since to export again, so books committed late are not lost'
+        )
+        parser.add_argument('--output', help='Output file (stdout by default)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Books loaded from the database at once')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = parse_since(options['since'])
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        rows = export_rows(since, options['chunk_size'], options['since_id'], overlap=options['overlap'])
+        lines = render(rows, options['format'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as file:
+                file.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from book_catalog.importers import FORMATS, BookImporter, read_rows
+from users.models import User
+
+import json
+import sys
+
+
+class Command(BaseCommand):
+    """
+    Команда для массового импорта книг из файла JSON Lines или CSV (формат строк описан в book_catalog.importers)
+    """
+    help = 'Import books from a JSON Lines or CSV file in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the file, "-" to read from stdin')
+        parser.add_argument('--format', choices=FORMATS, help='File format (by default guessed from the extension)')
+        parser.add_argument('--author', help='Username of the author for rows without the "author" field')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows validated and inserted at once')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('csv' if options['path'].endswith('.csv') else 'jsonl')
+        default_author = None
+        if options['author']:
+            try:
+                default_author = User.objects.get(username=options['author'])
+            except User.DoesNotExist:
+                raise CommandError(f'User "{options["author"]}" does not exist')
+
+        importer = BookImporter(default_author=default_author, chunk_size=options['chunk_size'])
+        if options['path'] == '-':
+            result = importer.run(read_rows(sys.stdin, fmt))
+        else:
+            with open(options['path'], encoding='utf-8-sig', newline='') as file:
+                result = importer.run(read_rows(file, fmt))
+
+        for error in result.errors:
+            self.stderr.write(json.dumps(error, ensure_ascii=False))
+        self.stdout.write(self.style.SUCCESS(f'Imported {result.created} books, {result.failed} rows failed'))
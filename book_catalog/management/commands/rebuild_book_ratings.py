@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from book_catalog.models import Book
+
+
+class Command(BaseCommand):
+    """
+    Команда для пересчета денормализованных агрегатов рейтинга книг (review_count, rating_sum, rating_avg)
+    по таблице отзывов. Нужна после ручного изменения или удаления отзывов в обход API.
+    """
+    help = 'Rebuild denormalized rating aggregates of books from their reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('book_ids', nargs='*', type=int, help='Rebuild only these books')
+
+    def handle(self, *args, **options):
+        books = Book.objects.all()
+        if options['book_ids']:
+            books = books.filter(id__in=options['book_ids'])
+        with transaction.atomic():
+            updated = books.rebuild_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {updated} books'))
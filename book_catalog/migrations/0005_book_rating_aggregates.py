@@ -0,0 +1,40 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:01
+
+from django.db import migrations, models
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    Book = apps.get_model('book_catalog', 'Book')
+    BookReview = apps.get_model('book_catalog', 'BookReview')
+    for row in BookReview.objects.values('book').annotate(count=models.Count('id'), sum=models.Sum('rating')):
+        Book.objects.filter(pk=row['book']).update(
+            review_count=row['count'],
+            rating_sum=row['sum'],
+            rating_avg=row['sum'] / row['count']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book_catalog', '0004_book_description'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_avg',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book_catalog', '0005_book_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-rating_avg', '-id'], name='book_rating_idx'),
+        ),
+    ]
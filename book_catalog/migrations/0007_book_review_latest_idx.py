@@ -0,0 +1,17 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book_catalog', '0006_book_rating_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookreview',
+            index=models.Index(fields=['book', '-created_at', '-id'], name='book_review_latest_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book_catalog', '0007_book_review_latest_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-created_at', '-id'], name='book_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='book_author_created_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations
+
+# схема индекса записана в миграции, а не импортируется из book_catalog.search,
+# чтобы изменения кода поиска не меняли уже примененную миграцию
+FTS_TABLE = 'book_catalog_book_fts'
+
+PG_VECTOR = (
+    "setweight(to_tsvector('simple'::regconfig, coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple'::regconfig, coalesce(description, '')), 'B')"
+)
+
+SQLITE_SCHEMA = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    f"name, description, content='book_catalog_book', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    f"""CREATE TRIGGER book_catalog_book_fts_insert AFTER INSERT ON book_catalog_book BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    f"""CREATE TRIGGER book_catalog_book_fts_delete AFTER DELETE ON book_catalog_book BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    f"""CREATE TRIGGER book_catalog_book_fts_update AFTER UPDATE OF name, description ON book_catalog_book BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    # индексирование уже существующих книг
+    f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_DROP_SCHEMA = [
+    'DROP TRIGGER IF EXISTS book_catalog_book_fts_update',
+    'DROP TRIGGER IF EXISTS book_catalog_book_fts_delete',
+    'DROP TRIGGER IF EXISTS book_catalog_book_fts_insert',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+POSTGRES_SCHEMA = [f'CREATE INDEX book_search_idx ON book_catalog_book USING GIN (({PG_VECTOR}))']
+
+POSTGRES_DROP_SCHEMA = ['DROP INDEX IF EXISTS book_search_idx']
+
+
+def create_index(apps, schema_editor):
+    # на других бэкендах индекса нет, и поиск отвечает 501 (см. book_catalog.search)
+    vendor = schema_editor.connection.vendor
+    for sql in SQLITE_SCHEMA if vendor == 'sqlite' else POSTGRES_SCHEMA if vendor == 'postgresql' else []:
+        schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for sql in SQLITE_DROP_SCHEMA if vendor == 'sqlite' else POSTGRES_DROP_SCHEMA if vendor == 'postgresql' else []:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book_catalog', '0008_book_list_filter_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book_catalog', '0009_book_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['updated_at', 'id'], name='book_updated_idx'),
+        ),
+    ]
@@ -1,8 +1,12 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.core.validators import MaxValueValidator, MinValueValidator
+from django.utils import timezone
 
 from users.models import User
 
+from .signals import ratings_rebuilt
+
 from datetime import datetime
 from typing import List
 
@@ -24,6 +28,46 @@ class BookGenre(models.Model):
         return f'Book genre: {self.name}'
 
 
+class BookQuerySet(models.QuerySet):
+    """
+    QuerySet книг с операциями над денормализованными агрегатами рейтинга
+    """
+
+    def touch(self):
+        """
+        Обновить updated_at книг, данные которых в выгрузке изменились без сохранения самих книг
+        (жанры, название жанра, имя автора). UPDATE не отправляет post_save
+
+        :return: Количество обновленных книг
+        """
+        return self.update(updated_at=timezone.now())
+
+    def rebuild_ratings(self):
+        """
+        Пересчитать количество отзывов, сумму и среднее оценок по таблице отзывов одним UPDATE.
+        UPDATE не отправляет post_save, поэтому после коммита отправляется сигнал ratings_rebuilt
+        для сброса кэша пересчитанных книг
+
+        :return: Количество обновленных книг
+        """
+        book_ids = list(self.values_list('id', flat=True))
+        reviews = BookReview.objects.filter(book=models.OuterRef('pk')).order_by().values('book')
+        review_count = models.Subquery(reviews.annotate(count=models.Count('id')).values('count'))
+        rating_sum = models.Subquery(reviews.annotate(sum=models.Sum('rating')).values('sum'))
+        updated = self.update(
+            review_count=Coalesce(review_count, 0),
+            rating_sum=Coalesce(rating_sum, 0),
+            rating_avg=Coalesce(
+                models.ExpressionWrapper(rating_sum * 1.0 / review_count, output_field=models.FloatField()),
+                0.0
+            ),
+            # средний рейтинг есть в выгрузке каталога
+            updated_at=timezone.now()
+        )
+        transaction.on_commit(lambda: ratings_rebuilt.send(sender=Book, book_ids=book_ids), using=self.db)
+        return updated
+
+
 class Book(models.Model):
     """
     Модель книги
@@ -33,6 +77,9 @@ class Book(models.Model):
         author (User): Автор книги
         description (str): Описание книги
         genres (List[BookGenre]): Список жанров книги
+        review_count (int): Количество отзывов на книгу
+        rating_sum (int): Сумма оценок всех отзывов на книгу
+        rating_avg (float): Средняя оценка по отзывам (0, если отзывов нет), хранится для сортировки по рейтингу
         updated_at (datetime): Дата последнего обновления книги
         created_at (datetime): Дата публикации книги
     """
@@ -40,9 +87,26 @@ class Book(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     description = models.TextField(max_length=5000)
     genres = models.ManyToManyField(BookGenre, related_name='books')
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_avg = models.FloatField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # сортировка списка книг по рейтингу с пагинацией по курсору (rating_avg, id)
+            models.Index(fields=['-rating_avg', '-id'], name='book_rating_idx'),
+            # список книг с пагинацией по курсору (created_at, id) и фильтрами from_date/to_date
+            models.Index(fields=['-created_at', '-id'], name='book_created_idx'),
+            # фильтр author_ids вместе с сортировкой списка книг
+            models.Index(fields=['author', '-created_at', '-id'], name='book_author_created_idx'),
+            # инкрементальная выгрузка каталога с водяным знаком (updated_at, id)
+            models.Index(fields=['updated_at', 'id'], name='book_updated_idx'),
+        ]
+
     @property
     def reviews(self):
         """
@@ -59,7 +123,23 @@ class Book(models.Model):
         """
         if hasattr(self, '_avg_rating'):
             return self._avg_rating
-        return self.book_reviews.aggregate(models.Avg('rating')).values()
+        if not self.review_count:
+            return None
+        return self.rating_sum / self.review_count
+
+    def add_review_rating(self, rating):
+        """
+        Учесть оценку нового отзыва в агрегатах книги.
+        Обновление делается одним UPDATE через F-выражения, поэтому параллельные отзывы не теряют друг друга
+
+        :param rating: Оценка нового отзыва
+        """
+        Book.objects.filter(pk=self.pk).update(
+            review_count=models.F('review_count') + 1,
+            rating_sum=models.F('rating_sum') + rating,
+            rating_avg=(models.F('rating_sum') + rating) * 1.0 / (models.F('review_count') + 1),
+            updated_at=timezone.now()
+        )
 
     def __str__(self):
         return f'Book: {self.name}'
@@ -90,5 +170,11 @@ class BookReview(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # последние отзывы на книгу и постраничный список отзывов по курсору (created_at, id)
+            models.Index(fields=['book', '-created_at', '-id'], name='book_review_latest_idx'),
+        ]
+
     def __str__(self):
         return f'Review: {self.text[0:20]}...'
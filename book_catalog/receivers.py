@@ -0,0 +1,47 @@
+"""
+Обновление Book.updated_at при изменениях, которые попадают в выгрузку каталога (book_catalog.exporters),
+но не сохраняют саму книгу: изменение жанров книги, переименование или удаление жанра и смена имени автора.
+Иначе инкрементальная выгрузка по водяному знаку updated_at не выгрузила бы такие книги повторно.
+"""
+from django.db.models.signals import m2m_changed, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from users.models import User
+
+from .models import Book, BookGenre
+
+
+@receiver(m2m_changed, sender=Book.genres.through)
+def book_genres_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Обновление книг при изменении их списка жанров. При очистке жанров со стороны жанра книги
+    обновляются до удаления связей
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Book.objects.filter(pk=instance.pk).touch()
+    elif action in ('post_add', 'post_remove'):
+        Book.objects.filter(pk__in=pk_set).touch()
+    elif action == 'pre_clear':
+        instance.books.touch()
+
+
+@receiver(post_save, sender=BookGenre)
+@receiver(pre_delete, sender=BookGenre)
+def genre_changed(sender, instance, created=False, **kwargs):
+    """
+    Обновление книг жанра при его переименовании или удалении
+    """
+    if not created:
+        instance.books.touch()
+
+
+@receiver(pre_save, sender=User)
+def author_changed(sender, instance, update_fields=None, **kwargs):
+    """
+    Обновление книг автора при смене его имени. Книги обновляются одним UPDATE, только если username
+    в БД отличается от нового, поэтому сохранение других полей (например, last_login) книги не трогает
+    """
+    if instance.pk is None or (update_fields is not None and 'username' not in update_fields):
+        return
+    Book.objects.filter(author_id=instance.pk).exclude(author__username=instance.username).touch()
@@ -0,0 +1,161 @@
+"""
+Полнотекстовый поиск книг по названию и описанию.
+
+Индекс зависит от бэкенда БД и создается миграцией 0009_book_search (схема индекса описана в ней,
+а константы ниже должны с ней совпадать):
+
+- SQLite: виртуальная таблица FTS5 book_catalog_book_fts с внешним содержимым (content=book_catalog_book).
+  Триггеры на таблице книг обновляют индекс при любом INSERT, UPDATE названия или описания и DELETE,
+  поэтому индекс остается в синхронизации и при save(), и при bulk_create() и update()
+- PostgreSQL: GIN-индекс по выражению tsvector от названия (вес A) и описания (вес B). Выражение
+  в запросе совпадает с выражением индекса, поэтому PostgreSQL обслуживает поиск индексом
+  и обновляет его сам
+
+В обоих случаях название книги весит больше описания, а текст разбивается на слова без стемминга
+(unicode61 в SQLite, конфигурация simple в PostgreSQL), чтобы поиск одинаково работал для русского
+и английского текста.
+
+Поиск идет в два шага: сначала по индексу выбираются айди и ранг книг одной страницы, затем
+книги страницы загружаются по айди. Поэтому стоимость страницы не зависит от размера каталога.
+
+На других бэкендах миграция индекс не создает, а поиск отвечает 501 (SearchNotSupported).
+"""
+from django.db import connections, router
+from rest_framework import status
+from rest_framework.exceptions import APIException
+import re
+
+from .models import Book
+
+FTS_TABLE = 'book_catalog_book_fts'
+
+# веса столбцов (name, description) для bm25 в SQLite, задаются миграцией как rank таблицы FTS5
+FTS_RANK = 'bm25(10.0, 1.0)'
+
+PG_CONFIG = 'simple'
+
+
+class SearchNotSupported(APIException):
+    """
+    Бэкенд БД не поддерживает полнотекстовый поиск
+    """
+    status_code = status.HTTP_501_NOT_IMPLEMENTED
+    default_detail = 'Full-text search is not supported by this database.'
+    default_code = 'search_not_supported'
+
+# выражение GIN-индекса book_search_idx из миграции
+PG_VECTOR = (
+    f"setweight(to_tsvector('{PG_CONFIG}'::regconfig, coalesce(name, '')), 'A') || "
+    f"setweight(to_tsvector('{PG_CONFIG}'::regconfig, coalesce(description, '')), 'B')"
+)
+
+
+def get_match_query(query) -> str:
+    """
+    Преобразовать пользовательский запрос в запрос FTS5. Каждое слово берется в кавычки,
+    поэтому операторы FTS5 (AND, OR, NEAR, *, ^, :) в запросе не интерпретируются,
+    а книга должна содержать все слова запроса
+
+    :param query: Строка запроса
+    :return: Запрос для MATCH или пустая строка, если в запросе нет слов
+    """
+    return ' '.join(f'"{word}"' for word in re.findall(r'\w+', query))
+
+
+class BookSearch:
+    """
+    Результаты поиска книг, отсортированные по релевантности.
+    Поддерживает count() и срезы, поэтому подходит как object_list для django Paginator
+
+    Attributes:
+        query (str): Строка запроса
+        queryset (QuerySet): Queryset, через который загружаются книги страницы
+        using (str): Алиас БД, из которой читаются результаты
+        vendor (str): Бэкенд БД
+    """
+
+    def __init__(self, query, queryset=None):
+        self.query = query
+        # индекс и книги читаются из одной БД (например, с одной реплики)
+        self.using = router.db_for_read(Book)
+        self.queryset = (queryset if queryset is not None else Book.objects.all()).using(self.using)
+        self.vendor = connections[self.using].vendor
+        if self.vendor not in ('sqlite', 'postgresql'):
+            raise SearchNotSupported
+        self.match = get_match_query(query) if self.vendor == 'sqlite' else query
+        self._count = None
+
+    def count(self):
+        """
+        Количество найденных книг
+
+        :return: Количество книг
+        """
+        if self._count is None:
+            if not self.match.strip():
+                self._count = 0
+            elif self.vendor == 'sqlite':
+                self._count = self.fetch(f'SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [self.match])[0][0]
+            else:
+                self._count = self.fetch(
+                    f"SELECT COUNT(*) FROM book_catalog_book "
+                    f"WHERE ({PG_VECTOR}) @@ plainto_tsquery('{PG_CONFIG}', %s)",
+                    [self.match]
+                )[0][0]
+        return self._count
+
+    def ranked_ids(self, offset, limit):
+        """
+        Айди и ранг книг одной страницы по убыванию релевантности
+
+        :param offset: Смещение
+        :param limit: Количество книг
+        :return: Список пар (айди книги, ранг). Больший ранг - более релевантная книга
+        """
+        if not self.match.strip() or limit <= 0:
+            return []
+        if self.vendor == 'sqlite':
+            # rank в FTS5 равен bm25 с весами FTS_RANK: чем меньше, тем релевантнее
+            return [
+                (book_id, -rank) for book_id, rank in self.fetch(
+                    f'SELECT rowid, rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                    f'ORDER BY rank, rowid LIMIT %s OFFSET %s',
+                    [self.match, limit, offset]
+                )
+            ]
+        return self.fetch(
+            f"SELECT id, ts_rank(({PG_VECTOR}), query) AS rank "
+            f"FROM book_catalog_book, plainto_tsquery('{PG_CONFIG}', %s) query "
+            f"WHERE ({PG_VECTOR}) @@ query ORDER BY rank DESC, id LIMIT %s OFFSET %s",
+            [self.match, limit, offset]
+        )
+
+    def fetch(self, sql, params):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        """
+        Книги страницы в порядке релевантности, с рангом в поле search_rank
+
+        :param item: Срез
+        :return: Список книг
+        """
+        if not isinstance(item, slice) or item.step is not None:
+            raise TypeError('BookSearch supports only slices without step')
+        offset = item.start or 0
+        stop = item.stop if item.stop is not None else self.count()
+        ranked = self.ranked_ids(offset, stop - offset)
+        books = self.queryset.in_bulk([book_id for book_id, _ in ranked])
+        result = []
+        for book_id, rank in ranked:
+            # книга могла быть удалена между запросами
+            if book_id in books:
+                book = books[book_id]
+                book.search_rank = rank
+                result.append(book)
+        return result
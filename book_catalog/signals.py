@@ -0,0 +1,9 @@
+from django.dispatch import Signal
+
+# Отправляется после массового добавления книг (bulk_create не отправляет post_save).
+# Аргументы: book_ids - айди добавленных книг
+books_imported = Signal()
+
+# Отправляется после коммита пересчета агрегатов рейтинга (update() не отправляет post_save).
+# Аргументы: book_ids - айди пересчитанных книг
+ratings_rebuilt = Signal()
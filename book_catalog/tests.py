@@ -1,3 +1,138 @@
 from django.test import TestCase
 
-# Create your tests here.
+from users.models import User
+
+from .exporters import export_rows, parse_since, render
+from .importers import BookImporter, read_rows
+from .models import Book, BookGenre
+
+import json
+
+
+class BookImporterTestCase(TestCase):
+    """
+    Проверка массового импорта книг
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author', password='password123')
+        cls.publisher = User.objects.create_user(username='publisher', password='password123')
+        cls.genre = BookGenre.objects.create(name='Fantasy')
+
+    def test_import_jsonl(self):
+        lines = [
+            json.dumps({'name': 'First', 'description': 'd', 'author': 'author', 'genres': ['Fantasy', 'Drama']}),
+            '',
+            json.dumps({'name': 'Second', 'description': 'd', 'genres': ['Drama']}),
+            json.dumps({'name': '', 'description': 'd'}),
+            json.dumps({'name': 'Third', 'description': 'd', 'author': 'nobody'}),
+            '{broken',
+        ]
+        result = BookImporter(default_author=self.publisher, chunk_size=2).run(read_rows(lines, 'jsonl'))
+        self.assertEqual((result.created, result.failed), (2, 3))
+        self.assertEqual([error['line'] for error in result.errors], [4, 5, 6])
+
+        first, second = Book.objects.order_by('id')
+        drama = BookGenre.objects.get(name='Drama')
+        self.assertEqual(first.author, self.author)
+        self.assertEqual(set(first.genres.all()), {self.genre, drama})
+        self.assertEqual(second.author, self.publisher)
+        self.assertEqual(list(second.genres.all()), [drama])
+
+    def test_import_csv(self):
+        lines = [
+            'name,description,author,genres\n',
+            'First,d,author,Fantasy;Drama\n',
+            'Second,d,,\n',
+        ]
+        result = BookImporter(default_author=self.publisher).run(read_rows(lines, 'csv'))
+        self.assertEqual((result.created, result.failed), (2, 0))
+        self.assertEqual(Book.objects.get(name='First').genres.count(), 2)
+        self.assertEqual(Book.objects.get(name='Second').author, self.publisher)
+
+    def test_other_authors_are_rejected(self):
+        lines = [
+            json.dumps({'name': 'Own', 'description': 'd', 'author': 'publisher'}),
+            json.dumps({'name': 'Default', 'description': 'd'}),
+            json.dumps({'name': 'Foreign', 'description': 'd', 'author': 'author'}),
+            json.dumps({'name': 'List', 'description': 'd', 'author': ['author']}),
+            json.dumps({'name': 'Object', 'description': 'd', 'author': {'a': 1}}),
+        ]
+        result = BookImporter(default_author=self.publisher, allow_authors=False).run(read_rows(lines, 'jsonl'))
+        self.assertEqual((result.created, result.failed), (2, 3))
+        self.assertEqual([error['line'] for error in result.errors], [3, 4, 5])
+        self.assertEqual(set(Book.objects.values_list('author__username', flat=True)), {'publisher'})
+
+    def test_query_count_does_not_grow_with_rows(self):
+        lines = [
+            json.dumps({'name': f'Book {i}', 'description': 'd', 'author': 'author', 'genres': ['Fantasy']})
+            for i in range(50)
+        ]
+        # поиск автора, поиск жанра, вставка книг и вставка связей с жанрами (+ savepoint транзакции)
+        with self.assertNumQueries(6):
+            result = BookImporter(chunk_size=100).run(read_rows(lines, 'jsonl'))
+        self.assertEqual(result.created, 50)
+
+
+class BookExporterTestCase(TestCase):
+    """
+    Проверка потоковой выгрузки каталога
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author', password='password123')
+        cls.genres = [BookGenre.objects.create(name=name) for name in ('Drama', 'Fantasy')]
+        for i in range(5):
+            book = Book.objects.create(name=f'Book {i}', author=cls.author, description='d', review_count=1, rating_sum=4)
+            book.genres.set(cls.genres)
+
+    def test_ndjson(self):
+        # Один запрос книг и по одному запросу жанров на каждую пачку из chunk_size книг
+        with self.assertNumQueries(4):
+            rows = [json.loads(line) for line in render(export_rows(chunk_size=2), 'ndjson')]
+        self.assertEqual([row['name'] for row in rows], [f'Book {i}' for i in range(5)])
+        self.assertEqual(rows[0]['genres'], ['Drama', 'Fantasy'])
+        self.assertEqual((rows[0]['author'], rows[0]['avg_rating']), ('author', 4.0))
+
+    def test_since_watermark(self):
+        rows = list(export_rows())
+        since = parse_since(rows[2]['updated_at'])
+        self.assertEqual([row['name'] for row in export_rows(since)], ['Book 3', 'Book 4'])
+
+    def test_watermark_with_equal_timestamps(self):
+        Book.objects.update(updated_at=Book.objects.first().updated_at)
+        rows = list(export_rows())
+        since = parse_since(rows[2]['updated_at'])
+        self.assertEqual([row['name'] for row in export_rows(since, since_id=rows[2]['id'])], ['Book 3', 'Book 4'])
+
+    def test_overlap_exports_recent_books_again(self):
+        rows = list(export_rows())
+        since = parse_since(rows[-1]['updated_at'])
+        self.assertEqual(list(export_rows(since, since_id=rows[-1]['id'])), [])
+        self.assertEqual(len(list(export_rows(since, since_id=rows[-1]['id'], overlap=60))), 5)
+
+    def test_related_changes_touch_books(self):
+        rows = list(export_rows())
+        since, since_id = parse_since(rows[-1]['updated_at']), rows[-1]['id']
+        Book.objects.get(name='Book 0').genres.remove(self.genres[0])
+        self.assertEqual([row['name'] for row in export_rows(since, since_id=since_id)], ['Book 0'])
+        self.genres[1].name = 'Sci-Fi'
+        self.genres[1].save()
+        self.assertEqual(len(list(export_rows(since, since_id=since_id))), 5)
+
+        since = parse_since(max(row['updated_at'] for row in export_rows()))
+        self.author.last_login = since
+        self.author.save(update_fields=['last_login'])
+        self.assertEqual(list(export_rows(since)), [])
+        self.author.username = 'writer'
+        self.author.save()
+        self.assertEqual({row['author'] for row in export_rows(since)}, {'writer'})
+
+    def test_csv_can_be_imported(self):
+        lines = ''.join(render(export_rows(), 'csv')).splitlines(keepends=True)
+        Book.objects.all().delete()
+        result = BookImporter().run(read_rows(lines, 'csv'))
+        self.assertEqual(result.created, 5)
+        self.assertEqual(Book.objects.get(name='Book 0').genres.count(), 2)
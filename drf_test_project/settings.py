@@ -1,6 +1,6 @@
 from pathlib import Path
 from dotenv import load_dotenv
-from os import getenv
+from os import cpu_count, getenv
 
 import django.core.mail.backends.smtp
 
@@ -21,13 +21,88 @@ EMAIL_PORT = 587
 EMAIL_HOST_USER = getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = getenv('EMAIL_HOST_PASSWORD')
 
+# Очередь писем (users.mail): размер пачки на одно соединение с почтовым сервером,
+# количество попыток отправки, начальная задержка между попытками и время, на которое
+# обработчик захватывает письмо (в секундах)
+MAIL_QUEUE_BATCH_SIZE = 100
+MAIL_QUEUE_MAX_ATTEMPTS = 5
+MAIL_QUEUE_RETRY_DELAY = 60
+MAIL_QUEUE_LEASE = 300
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': ['rest_framework.authentication.SessionAuthentication'],
-    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated', 'api.permissions.IsActivated']
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated', 'api.permissions.IsActivated'],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'DEFAULT_THROTTLE_CLASSES': ['api.throttling.UserTokenBucketThrottle', 'api.throttling.IPTokenBucketThrottle'],
+    'PAGE_SIZE': 20
 }
 
 AUTH_USER_MODEL = 'users.User'
 
+# пользователь сессии загружается из кэша (см. users.backends)
+AUTHENTICATION_BACKENDS = ['users.backends.CachedModelBackend']
+
+# сессии читаются из кэша, а записываются и в кэш, и в БД, поэтому переживают очистку кэша
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+CACHES = {
+    'default': {
+        # LocMemCache вытесняет давно не использованные записи (LRU) при превышении MAX_ENTRIES.
+        # Для нескольких процессов его можно заменить общим бэкендом, например Redis или Memcached
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'drf-test-project',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# Алиас кэша из CACHES для данных каталога книг и время жизни записей в секундах
+BOOK_CACHE_ALIAS = 'default'
+BOOK_CACHE_TIMEOUT = 60 * 60
+
+# Алиас кэша из CACHES для пользователей сессий и время жизни записей в секундах
+USER_CACHE_ALIAS = 'default'
+USER_CACHE_TIMEOUT = 60
+
+# Время жизни фасетных счетчиков списка книг (/api/books/?facets=1) в кэше в секундах
+# и максимальное количество жанров и авторов в каждом фасете
+BOOK_FACETS_CACHE_TIMEOUT = 60
+BOOK_FACETS_LIMIT = 100
+
+# Ограничение частоты запросов (см. api.throttling): области представлений (throttle_scope) с видом ограничения
+# (user - на пользователя, ip - на адрес) и частота в формате DRF. Пустой словарь отключает ограничения
+THROTTLE_RATES = {
+    'books.user': '300/min',
+    'books.ip': '600/min',
+    'login.ip': '20/min',
+    'signup.ip': '10/hour',
+}
+# Хранилище корзин: local - память процесса, cache - кэш THROTTLE_CACHE_ALIAS, общий для процессов
+THROTTLE_STORE = getenv('THROTTLE_STORE', 'local')
+THROTTLE_CACHE_ALIAS = 'default'
+# Максимальное количество корзин в памяти процесса
+THROTTLE_LOCAL_MAX_KEYS = 100000
+
+# Пул потоков для хэширования паролей при входе и регистрации (см. users.hashing): количество потоков
+# (по умолчанию половина ядер, чтобы остальные обслуживали чтение каталога), размер очереди
+# и сколько секунд синхронный запрос ждет место в очереди, прежде чем получить ответ 503
+PASSWORD_HASHING_WORKERS = int(getenv('PASSWORD_HASHING_WORKERS', max(1, (cpu_count() or 1) // 2)))
+PASSWORD_HASHING_QUEUE_SIZE = int(getenv('PASSWORD_HASHING_QUEUE_SIZE', 32))
+PASSWORD_HASHING_QUEUE_TIMEOUT = 1
+
+# Размер пачки строк при массовом импорте книг через /api/importBooks/
+BOOK_IMPORT_CHUNK_SIZE = 1000
+
+# Количество книг, загружаемых из БД за раз при выгрузке каталога через /api/exportBooks/
+BOOK_EXPORT_CHUNK_SIZE = 2000
+# Сколько секунд до водяного знака since перечитывается при инкрементальной выгрузке: книги из транзакций,
+# которые закоммитились после предыдущей выгрузки, выгружаются повторно, а не теряются
+BOOK_EXPORT_OVERLAP_SECONDS = 60
+
+# Количество последних отзывов, которые отдаются вместе с книгой в /api/book/<book_id>
+BOOK_DETAIL_REVIEWS = 10
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -44,6 +119,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.profiling.ProfilingMiddleware',
+    'api.replicas.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -73,13 +150,72 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'drf_test_project.wsgi.application'
 
+# Профилирование запросов (см. api.profiling): время, запросы к БД и повторы SQL по представлениям,
+# заголовок Server-Timing и метрики Prometheus на /metrics. PROFILING_SAMPLE_RATE - доля запросов под cProfile
+REQUEST_PROFILING = getenv('REQUEST_PROFILING') == '1'
+PROFILING_SAMPLE_RATE = float(getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_DUPLICATE_THRESHOLD = 5
+PROFILING_DIR = BASE_DIR / 'profiles'
+
+# Страницы /api/books/ и /api/booksByRating/ строятся из .values() без ModelSerializer (см. api.fastpath)
+BOOK_LIST_FAST_PATH = getenv('BOOK_LIST_FAST_PATH') == '1'
+
+# Асинхронные представления для чтения каталога (книга, список книг, проверка аутентификации).
+# Имеет смысл включать только при запуске через ASGI (drf_test_project.asgi)
+ASYNC_CATALOG_VIEWS = getenv('ASYNC_CATALOG_VIEWS') == '1'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # соединение переиспользуется между запросами одного потока и проверяется перед повторным использованием
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Реплики для чтения каталога: пути к файлам SQLite через запятую в переменной окружения DATABASE_REPLICAS,
+# например DATABASE_REPLICAS=replica.sqlite3 (копию основной БД делает manage.py sync_sqlite_replicas)
+DATABASE_REPLICAS = []
+for index, replica_name in enumerate(filter(None, getenv('DATABASE_REPLICAS', '').split(','))):
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / replica_name.strip(),
+        # в тестах реплика указывает на тестовую основную БД
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+# Приложения, модели которых читаются с реплик, другие модели, запись в которые закрепляет клиента
+# за основной БД, cookie закрепления и время закрепления в секундах
+REPLICA_APP_LABELS = ['book_catalog']
+REPLICA_PIN_MODELS = ['users.user_favorite_books']
+REPLICA_PIN_COOKIE = 'primary_pin'
+REPLICA_PIN_SECONDS = 5
+
+# PRAGMA, которые выполняются для каждого нового соединения SQLite (см. api.db.configure_sqlite).
+# Они действуют только на соединение и не меняют файл БД
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+}
+# Режим WAL записывается в заголовок файла БД, поэтому включается только явно (переменная окружения SQLITE_WAL=1),
+# а не при каждом запуске manage.py. Вместе с ним выполняются PRAGMA из SQLITE_WAL_PRAGMAS
+SQLITE_WAL = getenv('SQLITE_WAL') == '1'
+SQLITE_WAL_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+}
+
+# Записи из представлений создания выполняются по одной в процессе, а при "database is locked"
+# транзакция повторяется до SQLITE_WRITE_RETRIES раз с задержкой от SQLITE_WRITE_RETRY_DELAY секунд
+SQLITE_SERIALIZE_WRITES = True
+SQLITE_WRITE_RETRIES = 3
+SQLITE_WRITE_RETRY_DELAY = 0.05
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -4,6 +4,8 @@ from rest_framework.permissions import AllowAny
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from api.profiling import metrics_view
+
 schema_view = get_schema_view(
     openapi.Info(
         title='',
@@ -19,5 +21,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     path('users/', include('users.urls')),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui')
+    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+    # метрики профилирования запросов в формате Prometheus (только с REQUEST_PROFILING=1)
+    path('metrics', metrics_view)
 ]
@@ -0,0 +1,141 @@
+"""
+Бэкенд аутентификации с кэшем пользователя сессии.
+
+SessionAuthentication на каждом запросе загружает пользователя по айди из сессии (django.contrib.auth.get_user
+вызывает get_user бэкенда). CachedModelBackend хранит в кэше значения полей, которые нужны для проверки
+разрешений и представлений (USER_CACHE_FIELDS), и собирает из них пользователя без запроса к БД.
+Хэш пароля в кэш не попадает: для проверки сессии хранится только HMAC из get_session_auth_hash.
+Остальные поля остаются отложенными и загружаются из БД при первом обращении.
+
+Пароль при входе проверяется в ограниченном пуле хэширования (см. users.hashing), а не на потоке запроса.
+
+Кэш пользователя сбрасывается после сохранения или удаления пользователя (например, активации аккаунта,
+смены пароля или входа, который обновляет last_login) и при выходе из аккаунта (см. users.signals).
+QuerySet.update не отправляет post_save, поэтому после массового изменения пользователей (например,
+User.objects.filter(...).update(is_staff=True)) нужно вызвать invalidate_cached_user для каждого из них,
+иначе старые значения остаются в кэше до истечения settings.USER_CACHE_TIMEOUT.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from . import hashing
+from .models import User
+
+# поля для IsActivated, IsAdminUser и представлений; хэш сессии хранится в кэше отдельно
+USER_CACHE_FIELDS = (
+    'id', 'username', 'email', 'is_active', 'is_staff', 'is_superuser', 'is_activated',
+)
+
+
+def get_cache():
+    """
+    Получить кэш пользователей. Бэкенд задается алиасом settings.USER_CACHE_ALIAS из settings.CACHES
+
+    :return: Объект кэша
+    """
+    return caches[settings.USER_CACHE_ALIAS]
+
+
+def user_cache_key(user_id):
+    """
+    Ключ кэша пользователя
+
+    :param user_id: Айди пользователя
+    :return: Ключ кэша
+    """
+    return f'user:auth:{user_id}'
+
+
+def invalidate_cached_user(user_id):
+    """
+    Удалить пользователя из кэша. Вызывается сигналами после save и delete, а после QuerySet.update
+    пользователей ее нужно вызвать явно
+
+    :param user_id: Айди пользователя
+    """
+    get_cache().delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend, который загружает пользователя сессии из кэша на settings.USER_CACHE_TIMEOUT секунд
+    и проверяет пароли в пуле хэширования
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        """
+        Проверить имя пользователя и пароль так же, как ModelBackend, но хэш пароля считается в пуле хэширования
+
+        :param request: Запрос пользователя
+        :param username: Имя пользователя
+        :param password: Пароль
+        :return: Пользователь или None, если данные неверны
+        """
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            # хэш считается и для несуществующего пользователя, чтобы по времени ответа нельзя было узнать,
+            # зарегистрирован ли он
+            hashing.make_password(password)
+            return None
+        is_correct, must_update = hashing.check_password(password, user.password)
+        if not is_correct or not self.user_can_authenticate(user):
+            return None
+        if must_update:
+            user.password = hashing.make_password(password)
+            user.save(update_fields=['password'])
+        return user
+
+    async def aauthenticate(self, request, username=None, password=None):
+        """
+        Асинхронная версия authenticate: пользователь загружается асинхронным ORM, а event loop
+        не блокируется на время хэширования
+
+        :param request: Запрос пользователя
+        :param username: Имя пользователя
+        :param password: Пароль
+        :return: Пользователь или None, если данные неверны
+        """
+        if username is None or password is None:
+            return None
+        try:
+            user = await User._default_manager.aget(**{User.USERNAME_FIELD: username})
+        except User.DoesNotExist:
+            await hashing.amake_password(password)
+            return None
+        is_correct, must_update = await hashing.acheck_password(password, user.password)
+        if not is_correct or not self.user_can_authenticate(user):
+            return None
+        if must_update:
+            user.password = await hashing.amake_password(password)
+            await user.asave(update_fields=['password'])
+        return user
+
+    def get_user(self, user_id):
+        """
+        Получить пользователя по айди из кэша или из БД
+
+        :param user_id: Айди пользователя из сессии
+        :return: Пользователь или None, если его нет или он не может войти
+        """
+        cache = get_cache()
+        key = user_cache_key(user_id)
+        values = cache.get(key)
+        if values is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                values = {field: getattr(user, field) for field in USER_CACHE_FIELDS}
+                values['session_auth_hash'] = user.get_session_auth_hash()
+                cache.set(key, values, settings.USER_CACHE_TIMEOUT)
+            return user
+        # from_db ожидает значения в порядке полей модели
+        fields = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+        user = User.from_db(DEFAULT_DB_ALIAS, fields, [values[field] for field in fields])
+        user._session_auth_hash = values['session_auth_hash']
+        return user if self.user_can_authenticate(user) else None
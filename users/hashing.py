@@ -0,0 +1,214 @@
+"""
+Хэширование паролей в ограниченном пуле потоков.
+
+PBKDF2 с сотнями тысяч итераций занимает процессор на десятки миллисекунд, и всплеск входов и регистраций
+на потоках запросов вытесняет чтение каталога. Поэтому хэши паролей (проверка при входе и создание
+при регистрации) считаются в пуле из settings.PASSWORD_HASHING_WORKERS потоков: hashlib отпускает GIL
+на время PBKDF2, а одновременно хэшируется не больше паролей, чем потоков в пуле.
+
+Очередь пула ограничена settings.PASSWORD_HASHING_QUEUE_SIZE задачами. Если очередь заполнена, синхронный
+запрос ждет место не дольше settings.PASSWORD_HASHING_QUEUE_TIMEOUT секунд, асинхронный не ждет, и в обоих
+случаях запрос получает ответ 503 (PasswordHashingBusy). Счетчики пула (глубина очереди, отклоненные задачи,
+время ожидания и хэширования) отдаются вместе с метриками профилирования на /metrics.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+import asyncio
+import threading
+import time
+
+
+class PasswordHashingBusy(APIException):
+    """
+    Очередь пула хэширования заполнена
+    """
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many password checks in progress, try again later.'
+    default_code = 'password_hashing_busy'
+
+
+def verify_password(password, encoded):
+    """
+    Проверить пароль так же, как django.contrib.auth.hashers.check_password, но вместо вызова setter
+    вернуть признак того, что хэш нужно пересчитать (сменился хэшер по умолчанию или количество итераций)
+
+    :param password: Пароль
+    :param encoded: Хэш пароля пользователя
+    :return: Пара (пароль верный, хэш нужно обновить)
+    """
+    if password is None or not hashers.is_password_usable(encoded):
+        return False, False
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False, False
+    preferred = hashers.get_hasher('default')
+    hasher_changed = hasher.algorithm != preferred.algorithm
+    must_update = hasher_changed or preferred.must_update(encoded)
+    is_correct = hasher.verify(password, encoded)
+    if not is_correct and not hasher_changed and must_update:
+        # неверный пароль должен проверяться столько же, сколько верный
+        hasher.harden_runtime(password, encoded)
+    return is_correct, must_update
+
+
+class HashingExecutor:
+    """
+    Ограниченный пул потоков для хэширования паролей со счетчиками для метрик.
+    Пул создается при первой задаче и пересоздается, если поменялись настройки размера
+
+    Attributes:
+        lock (threading.Lock): Блокировка счетчиков и пересоздания пула
+        stats (dict): Счетчики пула
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.config = None
+        self.executor = None
+        self.slots = None
+        self.stats = {
+            'pending': 0, 'running': 0, 'max_pending': 0, 'completed': 0, 'rejected': 0,
+            'wait_seconds': 0.0, 'hash_seconds': 0.0,
+        }
+
+    def get_executor(self):
+        """
+        Получить пул и семафор мест в нем (потоки плюс очередь) для текущих настроек
+
+        :return: Пара (ThreadPoolExecutor, BoundedSemaphore)
+        """
+        config = (settings.PASSWORD_HASHING_WORKERS, settings.PASSWORD_HASHING_QUEUE_SIZE)
+        with self.lock:
+            if self.config != config:
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False)
+                workers, queue_size = config
+                self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+                self.slots = threading.BoundedSemaphore(workers + queue_size)
+                self.config = config
+            return self.executor, self.slots
+
+    def submit(self, func, *args, timeout=None):
+        """
+        Поставить задачу в пул
+
+        :param func: Функция
+        :param args: Аргументы функции
+        :param timeout: Сколько секунд ждать место в очереди (по умолчанию settings.PASSWORD_HASHING_QUEUE_TIMEOUT)
+        :return: Future задачи
+        """
+        executor, slots = self.get_executor()
+        timeout = settings.PASSWORD_HASHING_QUEUE_TIMEOUT if timeout is None else timeout
+        acquired = slots.acquire(timeout=timeout) if timeout > 0 else slots.acquire(blocking=False)
+        if not acquired:
+            with self.lock:
+                self.stats['rejected'] += 1
+            raise PasswordHashingBusy
+        with self.lock:
+            self.stats['pending'] += 1
+            self.stats['max_pending'] = max(self.stats['max_pending'], self.stats['pending'])
+        submitted = time.perf_counter()
+
+        def run():
+            started = time.perf_counter()
+            with self.lock:
+                self.stats['running'] += 1
+                self.stats['wait_seconds'] += started - submitted
+            try:
+                return func(*args)
+            finally:
+                with self.lock:
+                    self.stats['running'] -= 1
+                    self.stats['pending'] -= 1
+                    self.stats['completed'] += 1
+                    self.stats['hash_seconds'] += time.perf_counter() - started
+                slots.release()
+
+        try:
+            return executor.submit(run)
+        except RuntimeError:
+            # пул закрыт, потому что его пересоздали с новыми настройками
+            with self.lock:
+                self.stats['pending'] -= 1
+            slots.release()
+            raise PasswordHashingBusy
+
+    def run(self, func, *args):
+        """
+        Выполнить задачу в пуле и дождаться результата
+
+        :param func: Функция
+        :param args: Аргументы функции
+        :return: Результат функции
+        """
+        return self.submit(func, *args).result()
+
+    async def arun(self, func, *args):
+        """
+        Выполнить задачу в пуле, не блокируя event loop. Если очередь заполнена, место не ожидается
+
+        :param func: Функция
+        :param args: Аргументы функции
+        :return: Результат функции
+        """
+        return await asyncio.wrap_future(self.submit(func, *args, timeout=0))
+
+    def render(self):
+        """
+        Отрендерить счетчики пула в текстовом формате Prometheus
+
+        :return: Текст метрик
+        """
+        metrics = (
+            ('pending', 'password_hashing_pending', 'gauge', 'Password hashing tasks queued or running'),
+            ('running', 'password_hashing_running', 'gauge', 'Password hashing tasks running'),
+            ('max_pending', 'password_hashing_pending_max', 'gauge', 'Maximum observed queue depth'),
+            ('completed', 'password_hashing_completed_total', 'counter', 'Completed password hashing tasks'),
+            ('rejected', 'password_hashing_rejected_total', 'counter', 'Tasks rejected because the queue was full'),
+            ('wait_seconds', 'password_hashing_wait_seconds_total', 'counter', 'Time tasks spent in the queue'),
+            ('hash_seconds', 'password_hashing_seconds_total', 'counter', 'Time spent hashing passwords'),
+        )
+        with self.lock:
+            stats = dict(self.stats)
+        lines = []
+        for field, name, metric_type, description in metrics:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.append(f'{name} {stats[field]}')
+        return '\n'.join(lines) + '\n'
+
+
+executor = HashingExecutor()
+
+
+def check_password(password, encoded):
+    """
+    Проверить пароль в пуле хэширования
+
+    :param password: Пароль
+    :param encoded: Хэш пароля пользователя
+    :return: Пара (пароль верный, хэш нужно обновить)
+    """
+    return executor.run(verify_password, password, encoded)
+
+
+def make_password(password):
+    """
+    Посчитать хэш пароля в пуле хэширования
+
+    :param password: Пароль
+    :return: Хэш пароля
+    """
+    return executor.run(hashers.make_password, password)
+
+
+async def acheck_password(password, encoded):
+    return await executor.arun(verify_password, password, encoded)
+
+
+async def amake_password(password):
+    return await executor.arun(hashers.make_password, password)
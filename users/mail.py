@@ -0,0 +1,107 @@
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+from datetime import timedelta
+from typing import List
+
+
+def enqueue_mail(subject, message, recipient_list, from_email=None):
+    """
+    Поставить письмо в очередь на отправку. Аналог send_mail, который не обращается к почтовому серверу
+
+    :param subject: Тема письма
+    :param message: Текст письма
+    :param recipient_list: Список адресов получателей
+    :param from_email: Адрес отправителя (по умолчанию settings.DEFAULT_FROM_EMAIL)
+    :return: Объект письма в очереди
+    """
+    return OutgoingEmail.objects.create(
+        subject=subject,
+        message=message,
+        from_email=from_email or '',
+        recipients=list(recipient_list)
+    )
+
+
+def get_retry_delay(attempts):
+    """
+    Задержка перед следующей попыткой отправки, растет экспоненциально
+
+    :param attempts: Количество сделанных попыток
+    :return: Задержка
+    """
+    return timedelta(seconds=settings.MAIL_QUEUE_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def claim_email(email):
+    """
+    Захватить письмо для отправки. Условный UPDATE переносит send_after вперед на время
+    MAIL_QUEUE_LEASE, поэтому другие обработчики очереди это письмо не выберут, а если обработчик
+    упадет во время отправки, письмо вернется в очередь после истечения этого времени
+
+    :param email: Письмо из очереди
+    :return: Удалось ли захватить письмо
+    """
+    now = timezone.now()
+    claimed = OutgoingEmail.objects.filter(
+        id=email.id,
+        status=OutgoingEmail.STATUS_PENDING,
+        send_after__lte=now
+    ).update(send_after=now + timedelta(seconds=settings.MAIL_QUEUE_LEASE), attempts=F('attempts') + 1)
+    email.attempts += 1
+    return bool(claimed)
+
+
+def send_queued_mail(batch_size=None, max_attempts=None):
+    """
+    Отправить пачку писем из очереди через одно соединение с почтовым сервером.
+    Письма, которые не удалось отправить, откладываются на следующую попытку,
+    а после max_attempts попыток помечаются как неотправленные
+
+    :param batch_size: Максимальное количество писем в пачке
+    :param max_attempts: Максимальное количество попыток отправки одного письма
+    :return: Количество отправленных писем и количество неудачных попыток
+    """
+    batch_size = batch_size or settings.MAIL_QUEUE_BATCH_SIZE
+    max_attempts = max_attempts or settings.MAIL_QUEUE_MAX_ATTEMPTS
+    emails: List[OutgoingEmail] = list(
+        OutgoingEmail.objects.filter(
+            status=OutgoingEmail.STATUS_PENDING,
+            send_after__lte=timezone.now()
+        ).order_by('send_after', 'id')[:batch_size]
+    )
+    if not emails:
+        return 0, 0
+
+    sent = failed = 0
+    with get_connection() as connection:
+        for email in emails:
+            if not claim_email(email):
+                continue
+            message = EmailMessage(
+                subject=email.subject,
+                body=email.message,
+                from_email=email.from_email or None,
+                to=email.recipients,
+                connection=connection
+            )
+            try:
+                connection.send_messages([message])
+            except Exception as e:
+                failed += 1
+                email.last_error = str(e)
+                if email.attempts >= max_attempts:
+                    email.status = OutgoingEmail.STATUS_FAILED
+                else:
+                    email.send_after = timezone.now() + get_retry_delay(email.attempts)
+            else:
+                sent += 1
+                email.status = OutgoingEmail.STATUS_SENT
+                email.sent_at = timezone.now()
+                email.last_error = ''
+            email.save(update_fields=['status', 'attempts', 'last_error', 'send_after', 'sent_at'])
+    return sent, failed
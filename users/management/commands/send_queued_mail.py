@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from users.mail import send_queued_mail
+
+import time
+
+
+class Command(BaseCommand):
+    """
+    Фоновый обработчик очереди писем. Без --loop отправляет все готовые письма и завершается,
+    с --loop продолжает проверять очередь каждые --interval секунд
+    """
+    help = 'Send queued emails in batches over a single mail server connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling the queue')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls in --loop mode')
+        parser.add_argument('--batch-size', type=int, default=None, help='Emails per connection')
+        parser.add_argument('--max-attempts', type=int, default=None, help='Attempts before an email is failed')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            try:
+                sent, failed = self.send_ready(options['batch_size'], options['max_attempts'])
+            except Exception as e:
+                # почтовый сервер недоступен: письма остаются в очереди до следующей проверки
+                if not options['loop']:
+                    raise
+                self.stderr.write(f'Could not send queued mail: {e}')
+                sent = failed = 0
+            if sent or failed:
+                self.stdout.write(f'Sent {sent} emails, {failed} failed attempts')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
+
+    def send_ready(self, batch_size, max_attempts):
+        """
+        Отправлять пачки писем, пока в очереди есть письма, готовые к отправке
+
+        :param batch_size: Максимальное количество писем в пачке
+        :param max_attempts: Максимальное количество попыток отправки одного письма
+        :return: Количество отправленных писем и количество неудачных попыток
+        """
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = send_queued_mail(batch_size, max_attempts)
+            total_sent += sent
+            total_failed += failed
+            if not sent and not failed:
+                return total_sent, total_failed
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.8 on 2026-10-18 10:07
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('book_catalog', '0008_book_list_filter_idx'),
+        ('users', '0003_user_activation_token_user_is_activated'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='favorite_books',
+            field=models.ManyToManyField(blank=True, related_name='favorited_users', to='book_catalog.book'),
+        ),
+        migrations.CreateModel(
+            name='OutgoingEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255)),
+                ('message', models.TextField()),
+                ('from_email', models.CharField(blank=True, max_length=254)),
+                ('recipients', models.JSONField(default=list)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('send_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'send_after'], name='outgoing_email_queue_idx')],
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 from datetime import datetime
 from uuid import uuid1
@@ -25,5 +26,83 @@ class User(AbstractUser):
     updated_at = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            # у пользователей, созданных без почты (например, через createsuperuser), email пустой
+            models.UniqueConstraint(fields=['email'], condition=~models.Q(email=''), name='user_email_unique'),
+        ]
+
+    def get_session_auth_hash(self):
+        """
+        HMAC хэша пароля для проверки сессии. У пользователя, собранного из кэша (см. users.backends),
+        хэш пароля не загружен, и используется HMAC, сохраненный в кэше
+
+        :return: HMAC хэша пароля
+        """
+        cached = getattr(self, '_session_auth_hash', None)
+        return cached if cached is not None else super().get_session_auth_hash()
+
+    def set_password(self, raw_password):
+        super().set_password(raw_password)
+        # HMAC из кэша соответствует старому паролю
+        self._session_auth_hash = None
+
+    def has_favorite_book(self, book_id):
+        """
+        Проверить, добавлена ли книга в избранные пользователя.
+        Один запрос к промежуточной таблице по уникальному индексу (user_id, book_id)
+
+        :param book_id: Айди книги
+        :return: Находится ли книга в избранных
+        """
+        return User.favorite_books.through.objects.filter(user_id=self.pk, book_id=book_id).exists()
+
     def __str__(self):
         return f'BookCatalogUser {self.username}'
+
+
+class OutgoingEmail(models.Model):
+    """
+    Письмо в очереди на отправку. Письма отправляет фоновый обработчик (manage.py send_queued_mail),
+    поэтому запросы пользователей не ждут ответа почтового сервера
+
+    Attributes:
+        subject (str): Тема письма
+        message (str): Текст письма
+        from_email (str): Адрес отправителя
+        recipients (List[str]): Адреса получателей
+        status (str): Статус письма (в очереди, отправлено, не удалось отправить)
+        attempts (int): Количество попыток отправки
+        last_error (str): Ошибка последней попытки отправки
+        send_after (datetime): Время, раньше которого письмо не отправляется (для повторных попыток)
+        sent_at (datetime): Дата отправки письма
+        created_at (datetime): Дата добавления письма в очередь
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    send_after = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # выборка писем, готовых к отправке
+            models.Index(fields=['status', 'send_after'], name='outgoing_email_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f'OutgoingEmail {self.subject} ({self.status})'
@@ -0,0 +1,25 @@
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .backends import invalidate_cached_user
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    """
+    Сброс кэша пользователя после коммита транзакции, в которой он изменен или удален
+    """
+    transaction.on_commit(lambda: invalidate_cached_user(instance.pk))
+
+
+@receiver(user_logged_out)
+def user_logged_out_handler(sender, request, user, **kwargs):
+    """
+    Сброс кэша пользователя при выходе из аккаунта
+    """
+    if user is not None:
+        invalidate_cached_user(user.pk)
@@ -1,3 +1,259 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import AsyncRequestFactory, Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+import json
+import threading
 
-# Create your tests here.
+from api.throttling import local_store
+
+from . import hashing
+from .backends import get_cache, user_cache_key
+from .models import OutgoingEmail, User
+from .views import AsyncLoginView
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class SignupMailQueueTestCase(TestCase):
+    """
+    Проверка отправки письма активации через очередь писем
+    """
+
+    def setUp(self):
+        local_store.reset()
+
+    def signup(self, username='reader', email='reader@example.com'):
+        return self.client.post('/users/register/', {
+            'email': email,
+            'username': username,
+            'password': 'password123',
+            're_password': 'password123'
+        })
+
+    def test_signup_enqueues_mail(self):
+        response = self.signup()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+
+        call_command('send_queued_mail', stdout=StringIO())
+        user = User.objects.get(username='reader')
+        self.assertTrue(user.check_password('password123'))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['reader@example.com'])
+        self.assertIn(f'/users/confirm/{user.id}?token={user.activation_token}', mail.outbox[0].body)
+        self.assertEqual(OutgoingEmail.objects.get().status, OutgoingEmail.STATUS_SENT)
+
+    @override_settings(MAIL_QUEUE_MAX_ATTEMPTS=2, MAIL_QUEUE_RETRY_DELAY=0)
+    def test_failed_mail_is_retried(self):
+        self.signup()
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('down')):
+            call_command('send_queued_mail', stdout=StringIO())
+        email = OutgoingEmail.objects.get()
+        self.assertEqual((email.status, email.attempts, email.last_error), (OutgoingEmail.STATUS_FAILED, 2, 'down'))
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class CachedSessionUserTestCase(TestCase):
+    """
+    Проверка кэша сессии и пользователя сессии
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', password='password123')
+
+    def setUp(self):
+        get_cache().clear()
+        self.client.login(username='reader', password='password123')
+
+    def test_authenticated_request_skips_db(self):
+        self.client.get('/users/authenticated/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/users/authenticated/')
+        self.assertTrue(response.json()['authenticated'])
+
+    def test_password_hash_is_not_cached(self):
+        self.client.get('/users/authenticated/')
+        values = get_cache().get(user_cache_key(self.user.id))
+        self.assertNotIn('password', values)
+        self.assertNotIn(self.user.password, values.values())
+        self.assertEqual(values['session_auth_hash'], self.user.get_session_auth_hash())
+
+    def test_password_change_ends_session(self):
+        self.client.get('/users/authenticated/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('new password123')
+            self.user.save()
+        self.assertFalse(self.client.get('/users/authenticated/').json()['authenticated'])
+
+    def test_activation_invalidates_user(self):
+        self.assertEqual(self.client.get('/api/favorites').status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(f'/users/confirm/{self.user.id}?token={self.user.activation_token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/favorites').status_code, 200)
+
+    def test_logout_invalidates_user(self):
+        user = User.objects.create_user(username='active', password='password123', is_activated=True)
+        self.client.login(username='active', password='password123')
+        self.client.get('/users/authenticated/')
+        self.assertEqual(self.client.post('/users/logout/').status_code, 200)
+        self.assertIsNone(get_cache().get(user_cache_key(user.id)))
+        self.assertFalse(self.client.get('/users/authenticated/').json()['authenticated'])
+
+
+class LoginThrottleTestCase(TestCase):
+    """
+    Проверка ограничения частоты попыток входа с одного адреса
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', password='password123')
+
+    def setUp(self):
+        local_store.reset()
+
+    @override_settings(THROTTLE_RATES={'login.ip': '2/min'})
+    def test_login_is_throttled_per_ip(self):
+        credentials = {'username': 'reader', 'password': 'wrong password'}
+        codes = [self.client.post('/users/login/', credentials).status_code for _ in range(3)]
+        self.assertEqual(codes, [401, 401, 429])
+        # попытки с другого адреса считаются отдельно
+        response = self.client.post('/users/login/', {**credentials, 'password': 'password123'}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+
+
+class PasswordHashingTestCase(TestCase):
+    """
+    Проверка входа с хэшированием паролей в ограниченном пуле
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', password='password123')
+
+    def setUp(self):
+        local_store.reset()
+
+    def test_login(self):
+        response = self.client.post('/users/login/', {'username': 'reader', 'password': 'password123'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.session['_auth_user_id'], str(self.user.id))
+        response = self.client.post('/users/login/', {'username': 'nobody', 'password': 'password123'})
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(PASSWORD_HASHING_WORKERS=1, PASSWORD_HASHING_QUEUE_SIZE=0, PASSWORD_HASHING_QUEUE_TIMEOUT=0)
+    def test_full_queue_returns_503(self):
+        release = threading.Event()
+        future = hashing.executor.submit(release.wait)
+        rejected = hashing.executor.stats['rejected']
+        try:
+            response = self.client.post('/users/login/', {'username': 'reader', 'password': 'password123'})
+        finally:
+            release.set()
+            future.result()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(hashing.executor.stats['rejected'], rejected + 1)
+        self.assertIn('password_hashing_rejected_total', hashing.executor.render())
+
+    def test_outdated_hash_is_upgraded(self):
+        self.user.password = make_password('password123', hasher='pbkdf2_sha1')
+        self.user.save()
+        self.client.post('/users/login/', {'username': 'reader', 'password': 'password123'})
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+
+    async def login_async(self, password, content_type='application/json'):
+        request = AsyncRequestFactory().post(
+            '/users/login/', json.dumps({'username': 'reader', 'password': password}), content_type=content_type
+        )
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        request.user = AnonymousUser()
+        return request, await AsyncLoginView.as_view()(request)
+
+    async def test_async_login(self):
+        request, response = await self.login_async('password123')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.session['_auth_user_id'], str(self.user.id))
+        _, response = await self.login_async('wrong password')
+        self.assertEqual(response.status_code, 401)
+        _, response = await self.login_async('password123', content_type='text/plain')
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(THROTTLE_RATES={'login.ip': '1/min'})
+    async def test_async_login_is_throttled(self):
+        with mock.patch('api.throttling.time.monotonic', return_value=100.0):
+            _, response = await self.login_async('wrong password')
+            self.assertEqual(response.status_code, 401)
+            _, response = await self.login_async('password123')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', THROTTLE_RATES={})
+class SignupUniquenessTestCase(TransactionTestCase):
+    """
+    Проверка уникальности почты и имени пользователя при регистрации
+    """
+
+    def signup(self, client, username, email):
+        return client.post('/users/register/', {
+            'email': email,
+            'username': username,
+            'password': 'password123',
+            're_password': 'password123'
+        })
+
+    def test_conflicts(self):
+        client = Client()
+        self.assertEqual(self.signup(client, 'reader', 'reader@example.com').status_code, 201)
+        # проверка занятости почты и имени - один запрос к users_user
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.signup(client, 'other', 'reader@example.com')
+        self.assertEqual((response.status_code, response.json()['error']), (409, 'This email already registered!'))
+        self.assertEqual(len([query for query in ctx.captured_queries if 'users_user' in query['sql']]), 1)
+        response = self.signup(client, 'reader', 'other@example.com')
+        self.assertEqual((response.status_code, response.json()['error']), (409, 'This username already exists!'))
+
+    def test_email_constraint(self):
+        User.objects.create_user(username='first', email='reader@example.com')
+        # пользователи без почты не конфликтуют друг с другом
+        User.objects.create_user(username='second')
+        User.objects.create_user(username='third')
+        with self.assertRaises(IntegrityError):
+            User.objects.create_user(username='fourth', email='reader@example.com')
+
+    def test_concurrent_signups(self):
+        barrier = threading.Barrier(8)
+        codes = []
+
+        def signup(i):
+            try:
+                client = Client()
+                barrier.wait()
+                # одно имя пользователя у четных потоков и одна почта у всех
+                codes.append(self.signup(client, f'reader{i % 2}', 'reader@example.com').status_code)
+            finally:
+                connection.close()
+
+        # проверка занятости выполняется до создания пользователя, поэтому ее можно пройти одновременно
+        with mock.patch('users.views.SignupView.get_conflict', side_effect=[None] * 8 + [
+            'This email already registered!'
+        ] * 8):
+            threads = [threading.Thread(target=signup, args=(i,)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(sorted(codes), [201] + [409] * 7)
+        self.assertEqual(User.objects.filter(email='reader@example.com').count(), 1)
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
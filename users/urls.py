@@ -1,17 +1,26 @@
+from django.conf import settings
 from django.urls import path
 from .views import *
 
+# под ASGI проверку аутентификации и вход обрабатывают асинхронные представления
+if settings.ASYNC_CATALOG_VIEWS:
+    check_authenticated_view = AsyncCheckAuthenticatedView.as_view()
+    login_view = AsyncLoginView.as_view()
+else:
+    check_authenticated_view = CheckAuthenticatedView.as_view()
+    login_view = LoginView.as_view()
+
 urlpatterns = [
     # запрос на регистрацию (защищен через csrf)
     path('register/', SignupView.as_view(), name='register'),
     # запрос на получение csrf
     path('csrfCookie/', GetCSRFTokenView.as_view(), name='csrf_cookie'),
     # запрос на вход в аккаунт (защищен через csrf)
-    path('login/', LoginView.as_view(), name='login'),
+    path('login/', login_view, name='login'),
     # запрос на выход из аккаунта (защищен через csrf)
     path('logout/', LogoutView.as_view(), name='logout'),
     # запрос на получение информации о том, вошел пользователь в аккаунт или нет
-    path('authenticated/', CheckAuthenticatedView.as_view(), name='checkauth'),
+    path('authenticated/', check_authenticated_view, name='checkauth'),
     # запрос на активацию аккаунта
     path('confirm/<int:user_id>', ActivateAccountView.as_view())
 ]
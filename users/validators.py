@@ -6,9 +6,10 @@ def validate_register(request_data):
     Валидатор формы регистрации
 
     :param request_data: тело запроса на регистрацию
-    :return: Форма валидна/невалидна
+    :return: Провалидированные данные формы или None, если форма невалидна
     """
-    return RegisterFormSerializer(data=request_data).is_valid()
+    serializer = RegisterFormSerializer(data=request_data)
+    return serializer.validated_data if serializer.is_valid() else None
 
 
 def validate_login(request_data):
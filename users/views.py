@@ -2,15 +2,28 @@ from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.request import Request
+from rest_framework.renderers import JSONRenderer
 from rest_framework import status
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_protect
 from django.utils.decorators import method_decorator
 from django.contrib.auth import authenticate, login, logout
-from django.core.mail import send_mail
 from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Q
+from api.db import run_write
+
+from .mail import enqueue_mail
 from .models import User
 
-from . import validators
+from . import hashing, validators
+from .backends import CachedModelBackend
+
+import json
 
 
 @method_decorator(csrf_protect, name='dispatch')
@@ -51,6 +64,7 @@ class SignupView(APIView):
     Представление для обработки запроса на регистрацию
     """
     permission_classes = (AllowAny,)
+    throttle_scope = 'signup'
 
     def post(self, request: Request):
         """
@@ -60,35 +74,42 @@ class SignupView(APIView):
         :param request: Запрос пользователя
         :return: Response объект
         """
-        data = self.request.data
-
-        if not validators.validate_register(data):
+        data = validators.validate_register(self.request.data)
+        if data is None:
             return Response({'details': 'Bad Request Body'}, status=status.HTTP_400_BAD_REQUEST)
 
-        email = data['email']
-        username = data['username']
+        email = User.objects.normalize_email(data['email'])
+        username = User.normalize_username(data['username'])
         password = data['password']
-        re_password = data['re_password']
 
-        if re_password != password:
+        if data['re_password'] != password:
             return Response({'error': 'Passwords do not match!'}, status=status.HTTP_401_UNAUTHORIZED)
-        if User.objects.filter(email=email).exists():
-            return Response({'error': 'This email already registered!'}, status=status.HTTP_409_CONFLICT)
-        if User.objects.filter(username=username).exists():
-            return Response({'error': 'This username already exists!'}, status=status.HTTP_409_CONFLICT)
-        if len(password) < 8:
-            return Response({'erorr': 'Minimum password size is 8 symbols!'}, status=status.HTTP_401_UNAUTHORIZED)
-
-        # Создаем пользователя
-        user = User.objects.create_user(email=email, username=username, password=password)
-
-        # Отправляем письмо на адрес пользователя с ссылкой активации
-        send_mail(
-            subject='Подтверждение вашего аккаунта в DRF TEST PROJECT',
-            message=f'Для подтверждения аккаунта сделайте запрос на адрес: /users/confirm/{user.id}?token={user.activation_token}',
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[user.email]
-        )
+        error = self.get_conflict(email, username)
+        if error:
+            return Response({'error': error}, status=status.HTTP_409_CONFLICT)
+
+        # хэш пароля считается в пуле хэширования и до начала транзакции
+        password_hash = hashing.make_password(password)
+
+        def create_user():
+            # Создаем пользователя. Одновременную регистрацию с теми же данными отсекают
+            # уникальные ограничения БД на username и email
+            user = User.objects.create(email=email, username=username, password=password_hash)
+
+            # Ставим в очередь письмо на адрес пользователя с ссылкой активации.
+            # Письмо отправит фоновый обработчик (manage.py send_queued_mail)
+            enqueue_mail(
+                subject='Подтверждение вашего аккаунта в DRF TEST PROJECT',
+                message=f'Для подтверждения аккаунта сделайте запрос на адрес: /users/confirm/{user.id}?token={user.activation_token}',
+                from_email=settings.EMAIL_HOST_USER,
+                recipient_list=[user.email]
+            )
+
+        try:
+            run_write(create_user)
+        except IntegrityError:
+            error = self.get_conflict(email, username) or 'This user already exists!'
+            return Response({'error': error}, status=status.HTTP_409_CONFLICT)
         return Response(
             {
                 'ok': 'You registered successfully! Now you need to activate your account to fully use our website'
@@ -96,6 +117,24 @@ class SignupView(APIView):
             status=status.HTTP_201_CREATED
         )
 
+    @staticmethod
+    def get_conflict(email, username):
+        """
+        Проверить занятость почты и имени пользователя одним запросом по уникальным индексам email и username
+
+        :param email: Электронный адрес
+        :param username: Имя пользователя
+        :return: Текст ошибки или None, если почта и имя свободны
+        """
+        # условие email != '' совпадает с условием частичного индекса user_email_unique,
+        # без него SQLite не может использовать этот индекс
+        users = list(
+            User.objects.filter(Q(email=email) & ~Q(email='') | Q(username=username)).values_list('email', flat=True)[:2]
+        )
+        if email in users:
+            return 'This email already registered!'
+        return 'This username already exists!' if users else None
+
 
 @method_decorator(csrf_protect, name='dispatch')
 class LoginView(APIView):
@@ -103,11 +142,14 @@ class LoginView(APIView):
     Представление обработки запроса на вход в аккаунт
     """
     permission_classes = (AllowAny, )
+    throttle_scope = 'login'
 
     def post(self, request):
         """
         Обработка запроса на вход в аккаунт
 
+        Пароль проверяется в пуле хэширования (см. users.hashing). Если его очередь заполнена, отдается ответ 503
+
         :param request: Запрос пользователя
         :return: Response объект
         """
@@ -127,6 +169,75 @@ class LoginView(APIView):
             return Response({'error': 'Your login or password is incorrect!'}, status=status.HTTP_401_UNAUTHORIZED)
 
 
+class AsyncLoginView(View):
+    """
+    Асинхронная версия LoginView для ASGI. Пользователь загружается асинхронным ORM, а пароль проверяется
+    в пуле хэширования без блокировки event loop. CSRF проверяет CsrfViewMiddleware
+    """
+    throttle_scope = 'login'
+    renderer = JSONRenderer()
+
+    def render(self, data, status_code, headers=None):
+        """
+        Отрендерить данные в JSON-ответ
+
+        :param data: Данные ответа
+        :param status_code: Код ответа
+        :param headers: Дополнительные заголовки
+        :return: HttpResponse объект
+        """
+        return HttpResponse(
+            self.renderer.render(data), status=status_code, headers=headers, content_type=self.renderer.media_type
+        )
+
+    def check_throttles(self, request):
+        """
+        Проверить те же ограничения частоты, что и у LoginView
+
+        :param request: Запрос пользователя
+        :return: Время ожидания в секундах или None, если запрос не ограничен
+        """
+        waits = [
+            throttle.wait() or 0 for throttle in (throttle_class() for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES)
+            if not throttle.allow_request(request, self)
+        ]
+        return max(waits, default=None)
+
+    async def post(self, request):
+        """
+        Обработка запроса на вход в аккаунт
+
+        :param request: Запрос пользователя
+        :return: HttpResponse объект
+        """
+        wait = await sync_to_async(self.check_throttles)(request)
+        if wait is not None:
+            exc = Throttled(wait)
+            # как и у LoginView, ответ 429 говорит клиенту, когда повторить попытку
+            headers = {'Retry-After': str(exc.wait)} if exc.wait else None
+            return self.render({'detail': exc.detail}, exc.status_code, headers=headers)
+
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body)
+            except ValueError:
+                data = None
+        else:
+            data = request.POST
+        if not isinstance(data, dict) or not validators.validate_login(data):
+            return self.render({'details': 'Bad Request Body'}, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user = await CachedModelBackend().aauthenticate(request, username=data['username'], password=data['password'])
+        except hashing.PasswordHashingBusy as exc:
+            return self.render({'detail': exc.detail}, exc.status_code)
+        if user:
+            user.backend = f'{CachedModelBackend.__module__}.{CachedModelBackend.__qualname__}'
+            await sync_to_async(login)(request, user)
+            return self.render({'ok': 'You logged in successfully!'}, status.HTTP_200_OK)
+        return self.render({'error': 'Your login or password is incorrect!'}, status.HTTP_401_UNAUTHORIZED)
+
+
 @method_decorator(csrf_protect, name='dispatch')
 class LogoutView(APIView):
     """
@@ -164,6 +275,23 @@ class CheckAuthenticatedView(APIView):
         return Response({'authenticated': False}, status=status.HTTP_200_OK)
 
 
+class AsyncCheckAuthenticatedView(View):
+    """
+    Асинхронная версия CheckAuthenticatedView для ASGI
+    """
+
+    async def get(self, request):
+        """
+        Обработка запроса проверки на аутентифицированность. Пользователь сессии загружается вне event loop
+
+        :param request: Запрос пользователя
+        :return: HttpResponse объект
+        """
+        authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        renderer = JSONRenderer()
+        return HttpResponse(renderer.render({'authenticated': authenticated}), content_type=renderer.media_type)
+
+
 @method_decorator(ensure_csrf_cookie, name='dispatch')
 class GetCSRFTokenView(APIView):
     """